@@ -35,8 +35,13 @@ try and do the detection.
 
 __author__ = "tansell@google.com (Tim Ansell)"
 
+import array
 import calendar
+import collections
 import datetime
+import heapq
+import io
+import math
 import os
 import os.path
 import re
@@ -49,6 +54,13 @@ import dateutil.tz
 import pytz
 
 from . import pytz_abbr  # pylint: disable=g-bad-import-order
+from . import transitions  # pylint: disable=g-bad-import-order
+from . import clock  # pylint: disable=g-bad-import-order
+from . import compiled  # pylint: disable=g-bad-import-order
+from . import instrument  # pylint: disable=g-bad-import-order
+from . import posixtz  # pylint: disable=g-bad-import-order
+from .compiled import compile_zone  # pylint: disable=g-bad-import-order
+from .posixtz import compile_rule  # pylint: disable=g-bad-import-order
 
 if sys.platform == "win32":
   # pylint: disable=g-import-not-at-top
@@ -60,6 +72,12 @@ except NameError:
   # pylint: disable=redefined-builtin
   basestring = str
 
+try:
+  long
+except NameError:
+  # pylint: disable=redefined-builtin
+  long = int
+
 try:
   # pylint: disable=g-import-not-at-top
   import functools
@@ -94,18 +112,109 @@ def _tzinfome(tzinfo):
   Raises:
     UnknownTimeZoneError: If the timezone given can't be decoded.
   """
+  collector = instrument.collector
+  name = getattr(tzinfo, "zone", tzinfo)
+  if isinstance(name, basestring):
+    hot = _hot_zones.get(name)
+    if hot is not None:
+      if collector is not None:
+        collector.count("tzinfome.hot")
+      return hot
+    if _zonedb is not None:
+      hot = _zonedb.zone(name)
+      if hot is not None:
+        if collector is not None:
+          collector.count("tzinfome.zonedb")
+        return hot
+
   if not isinstance(tzinfo, datetime.tzinfo):
+    if collector is not None:
+      collector.count("tzinfome.pytz")
     try:
       tzinfo = pytz.timezone(tzinfo)
       assert tzinfo.zone in pytz.all_timezones
     except AttributeError:
       raise pytz.UnknownTimeZoneError("Unknown timezone! %s" % tzinfo)
+    except pytz.UnknownTimeZoneError:
+      # Not a zone name, but could be a POSIX TZ rule (EST5EDT,M3.2.0,...).
+      # Only rules with transitions are tried, so typos like "Foo3" are still
+      # errors rather than fixed offsets (use compile_rule for those).
+      if not isinstance(tzinfo, basestring) or "," not in tzinfo:
+        raise
+      try:
+        tzinfo = posixtz.compile_rule(tzinfo)
+      except ValueError:
+        raise pytz.UnknownTimeZoneError("Unknown timezone! %s" % tzinfo)
+      if collector is not None:
+        collector.count("tzinfome.posix")
+  elif collector is not None:
+    collector.count("tzinfome.tzinfo")
   return tzinfo
 
 
+# Compiled zones to use instead of pytz, keyed by name
+_hot_zones = {}
+
+
+def hot_zones_set(zones, years=None):
+  """Use compiled versions of the given zones (see datetime_tz.compiled).
+
+  Wherever datetime_tz looks up a timezone (creating objects, astimezone,
+  replace, ...) the compiled version of these zones is used instead.
+
+  Args:
+    zones: List of zone names. Replaces any previous list (so an empty list
+           goes back to pytz for all zones).
+    years: (first, last) years to build the tables for. (Defaults to the
+           whole history of each zone.)
+  """
+  # pylint: disable=global-statement
+  global _hot_zones
+  hot = {}
+  for zone in zones:
+    compiled_zone = compiled.compile_zone(zone, years)
+    hot[compiled_zone.zone] = compiled_zone
+  _hot_zones = hot
+
+
+# The zone database to use instead of pytz (or None)
+_zonedb = None
+
+
+def zonedb_set(enabled=True, path=None):
+  """Use a shared, memory mapped zone database (see datetime_tz.zonedb).
+
+  The database is built first if it doesn't exist or is for a different
+  version of tzdata. Zones in the database are used wherever datetime_tz
+  looks up a timezone, unless the zone is in hot_zones_set().
+
+  Args:
+    enabled: Use the database, or go back to pytz.
+    path: The database file. (Defaults to zonedb.default_path().)
+
+  Returns:
+    The zonedb.ZoneDB object (or None).
+
+  Raises:
+    NotImplementedError: If enabled on Python 2, which can't map the tables.
+  """
+  # pylint: disable=global-statement,g-import-not-at-top
+  global _zonedb
+  _zonedb = None
+  if enabled:
+    if sys.version_info < (3,):
+      raise NotImplementedError("The zone database needs Python 3.")
+    from . import zonedb
+    _zonedb = zonedb.open_db(path)
+  return _zonedb
+
+
 # Our "local" timezone
 _localtz = None
 
+# The clock used by now() and utcnow() (None for the default one)
+_coarse_clock = None
+
 
 def localize(dt, force_to_local=True):
   """Localize a datetime to the local timezone.
@@ -161,6 +270,64 @@ def localtz():
   return _localtz
 
 
+def coarse_clock_set(enabled=True, tick=0):
+  """Use a faster (and optionally coarser) clock for now() and utcnow().
+
+  See datetime_tz.clock for details.
+
+  Args:
+    enabled: Use the fast clock, or go back to the default one.
+    tick: Length of a tick in seconds. Calls to now() in the same tick
+          return the same object.
+  """
+  # pylint: disable=global-statement
+  global _coarse_clock
+  _coarse_clock = None
+  if enabled:
+    _coarse_clock = clock.CoarseClock(tick)
+
+
+def stats_set(enabled=True, timing=False):
+  """Count (and optionally time) the paths taken inside datetime_tz.
+
+  See datetime_tz.instrument for the counters collected. Collection is off
+  by default.
+
+  Args:
+    enabled: Start collecting (clearing any previous stats), or stop.
+    timing: Time creating and parsing objects too, not just count them.
+
+  Returns:
+    The instrument.Collector (or None).
+  """
+  if not enabled:
+    instrument.disable()
+    return None
+  return instrument.enable(timing)
+
+
+def stats(reset=False):
+  """Get the stats collected since stats_set() was called.
+
+  Args:
+    reset: Clear the stats after getting them.
+
+  Returns:
+    A dictionary of counter or timer name to number (empty if not
+    collecting).
+  """
+  collector = instrument.collector
+  if collector is None:
+    return {}
+  result = collector.asdict()
+  if reset:
+    collector.reset()
+  return result
+
+
+collect_stats = instrument.collecting
+
+
 def localtz_name():
   """Returns the name of the local timezone."""
   return str(localtz())
@@ -180,65 +347,278 @@ def require_timezone(zone):
       "or on Linux by exporting TZ=%(zone)s") % {"zone": zone}
 
 
+# The detection methods, in the order detect_timezone() tries them by default
+DETECT_METHODS = ("windows", "environ", "etc_timezone", "etc_localtime", "php")
+
+# How detect_timezone() works, see detect_set()
+_detect_methods = DETECT_METHODS
+_detect_budget = None
+_detect_default = None
+_detect_warn = True
+
+# When the detection in progress runs out of time (or None)
+_detect_deadline = None
+
+
+def detect_set(methods=None, budget=None, default=None, warn=True):
+  """Configure how detect_timezone() finds the local timezone.
+
+  Calling with no arguments goes back to the default behaviour.
+
+  Args:
+    methods: Names of the methods to try, in order, from DETECT_METHODS.
+             Leave out the slow ones ("etc_localtime" scans the zoneinfo
+             database, "php" scans every pytz zone) to never run them.
+             (Defaults to DETECT_METHODS.)
+    budget: Seconds detection may take. Once they are used up no more
+            methods are tried and the slow scans stop early.
+    default: Timezone to use when detection fails or runs out of time,
+             rather than raising an error.
+    warn: Warn about problems found while detecting (for example a TZ value
+          which isn't understood).
+
+  Raises:
+    ValueError: If given an unknown method.
+    UnknownTimeZoneError: If the default timezone doesn't exist.
+  """
+  # pylint: disable=global-statement
+  global _detect_methods, _detect_budget, _detect_default, _detect_warn
+  if methods is None:
+    methods = DETECT_METHODS
+  methods = tuple(methods)
+  for method in methods:
+    if method not in DETECT_METHODS:
+      raise ValueError("Unknown detection method %r (known methods are %s)" %
+                       (method, ", ".join(DETECT_METHODS)))
+  if default is not None:
+    default = _tzinfome(default)
+
+  _detect_methods = methods
+  _detect_budget = budget
+  _detect_default = default
+  _detect_warn = warn
+
+
 def detect_timezone():
   """Try and detect the timezone that Python is currently running in.
 
   We have a bunch of different methods for trying to figure this out (listed in
-  order they are attempted).
-    * In windows, use win32timezone.TimeZoneInfo.local()
-    * Try TZ environment variable.
-    * Try and find /etc/timezone file (with timezone name).
-    * Try and find /etc/localtime file (with timezone data).
-    * Try and match a TZ to the current dst/offset/shortname.
+  the order they are attempted by default, see detect_set to change this).
+    * In windows, use win32timezone.TimeZoneInfo.local() ("windows")
+    * Try TZ environment variable, a zone name, path to a zoneinfo file or
+      POSIX TZ rule ("environ").
+    * Try and find /etc/timezone file (with timezone name) ("etc_timezone").
+    * Try and find /etc/localtime file (with timezone data) ("etc_localtime").
+    * Try and match a TZ to the current dst/offset/shortname ("php").
 
   Returns:
-    The detected local timezone as a tzinfo object
+    The detected local timezone as a tzinfo object (or the default given to
+    detect_set if it was unable to detect a timezone).
 
   Raises:
     pytz.UnknownTimeZoneError: If it was unable to detect a timezone.
   """
-  if sys.platform == "win32":
-    tz = _detect_timezone_windows()
-    if tz is not None:
-      return tz
+  # pylint: disable=global-statement
+  global _detect_deadline
+  if _detect_budget is not None:
+    _detect_deadline = instrument.timer() + _detect_budget
+  try:
+    with warnings.catch_warnings():
+      if not _detect_warn:
+        warnings.simplefilter("ignore")
+      tz = _detect_timezone_methods()
+  finally:
+    _detect_deadline = None
 
-  # First we try the TZ variable
-  tz = _detect_timezone_environ()
   if tz is not None:
     return tz
+  if _detect_default is not None:
+    instrument.count("detect.default")
+    return _detect_default
 
-  # Second we try /etc/timezone and use the value in that
-  tz = _detect_timezone_etc_timezone()
-  if tz is not None:
-    return tz
+  instrument.count("detect.failed")
+  raise pytz.UnknownTimeZoneError("Unable to detect your timezone!")
 
-  # Next we try and see if something matches the tzinfo in /etc/localtime
-  tz = _detect_timezone_etc_localtime()
-  if tz is not None:
-    return tz
 
-  # Next we try and use a similar method to what PHP does.
-  # We first try to search on time.tzname, time.timezone, time.daylight to
-  # match a pytz zone.
-  warnings.warn("Had to fall back to worst detection method (the 'PHP' "
-                "method).")
+def _detect_timezone_methods():
+  """Try the configured detection methods, in order, until one works."""
+  for name in _detect_methods:
+    if _detect_expired():
+      instrument.count("detect.timeout")
+      warnings.warn("Ran out of time detecting your timezone (budget of %ss)."
+                    % _detect_budget)
+      return None
 
-  tz = _detect_timezone_php()
-  if tz is not None:
-    return tz
+    # Looked up each time so the methods can be replaced.
+    method = globals().get("_detect_timezone_" + name)
+    if method is None:
+      # Not available on this platform
+      continue
 
-  raise pytz.UnknownTimeZoneError("Unable to detect your timezone!")
+    if name == "php":
+      # We try and use a similar method to what PHP does. We search on
+      # time.tzname, time.timezone, time.daylight to match a pytz zone.
+      warnings.warn("Had to fall back to worst detection method (the 'PHP' "
+                    "method).")
+
+    tz = _detect_with(name, method)
+    if tz is not None:
+      return tz
+  return None
+
+
+def _detect_expired():
+  """Has the detection in progress run out of time?"""
+  return (_detect_deadline is not None and
+          instrument.timer() > _detect_deadline)
+
+
+def _detect_with(name, method):
+  """Try a detection method, recording the attempt if collecting stats.
+
+  Args:
+    name: Name of the method for the stats.
+    method: Function which returns a tzinfo object or None.
+
+  Returns:
+    The result of method.
+  """
+  collector = instrument.collector
+  if collector is None:
+    return method()
+
+  start = instrument.timer()
+  try:
+    tz = method()
+  finally:
+    collector.time("detect." + name, instrument.timer() - start)
+  if tz is not None:
+    collector.count("detect.success." + name)
+  return tz
 
 
 def _detect_timezone_environ():
   if "TZ" in os.environ:
+    # A leading ":" means "implementation defined", which for glibc is a zone
+    # name or a path to a zoneinfo file.
+    value = os.environ["TZ"]
+    if value.startswith(":"):
+      value = value[1:]
     try:
-      return pytz.timezone(os.environ["TZ"])
-    except (IOError, pytz.UnknownTimeZoneError):
+      if os.path.isabs(value):
+        return _tzinfo_from_path(value)
+      # Embedded systems often only have a POSIX TZ rule, such as
+      # "EST5EDT,M3.2.0,M11.1.0". Zone names never have a ",".
+      if "," in value:
+        return posixtz.compile_rule(value)
+      try:
+        return pytz.timezone(value)
+      except pytz.UnknownTimeZoneError:
+        return posixtz.compile_rule(value)
+    except (IOError, ValueError, pytz.UnknownTimeZoneError):
       warnings.warn("You provided a TZ environment value (%r) we did not "
                     "understand!" % os.environ["TZ"])
 
 
+def _zoneinfo_roots():
+  """Returns the directories which could hold zoneinfo files."""
+  roots = [os.environ.get("TZDIR"), "/usr/share/zoneinfo", "/usr/lib/zoneinfo",
+           "/usr/share/lib/zoneinfo", "/etc/zoneinfo",
+           os.path.join(os.path.dirname(pytz.__file__), "zoneinfo")]
+  return [root for root in roots if root and os.path.isdir(root)]
+
+
+def _zone_name_from_path(path):
+  """Get the zone name for a file under a zoneinfo directory.
+
+  Args:
+    path: Absolute path to a zoneinfo file.
+
+  Returns:
+    The name of the zone in pytz, or None if path isn't under a zoneinfo
+    directory (or the zone isn't in pytz).
+  """
+  for root in _zoneinfo_roots():
+    root = os.path.join(root, "")
+    if not path.startswith(root):
+      continue
+    name = path[len(root):].replace(os.sep, "/")
+    # The posix and right directories hold versions of the same zones
+    # (without and with leap seconds).
+    for prefix in ("posix/", "right/"):
+      if name.startswith(prefix):
+        name = name[len(prefix):]
+    if name in pytz.all_timezones_set:
+      return name
+  return None
+
+
+def _zone_name_from_content(data):
+  """Find a zone whose zoneinfo file has exactly the same content.
+
+  Only files of the same size are read, so this is much quicker than
+  building and comparing every zone.
+
+  Args:
+    data: The contents of a zoneinfo file (bytes).
+
+  Returns:
+    The name of the zone in pytz, or None if none matched.
+  """
+  matches = set()
+  for root in _zoneinfo_roots():
+    for dirpath, _, filenames in os.walk(root):
+      if _detect_expired():
+        return None
+      for filename in filenames:
+        filepath = os.path.join(dirpath, filename)
+        try:
+          if os.path.getsize(filepath) != len(data):
+            continue
+          with open(filepath, "rb") as f:
+            if f.read() != data:
+              continue
+        except (IOError, OSError):
+          continue
+        name = _zone_name_from_path(filepath)
+        if name is not None:
+          matches.add(name)
+    if matches:
+      break
+
+  if not matches:
+    return None
+  # Prefer the common names for a zone (Australia/Sydney over Australia/NSW).
+  return min(matches, key=lambda x: (x not in pytz.common_timezones_set, x))
+
+
+def _tzinfo_from_path(path):
+  """Get the timezone for a zoneinfo file.
+
+  Args:
+    path: Absolute path to a zoneinfo file, such as /etc/localtime or
+          /usr/share/zoneinfo/Europe/Berlin.
+
+  Returns:
+    The pytz timezone with the same name or content as the file, otherwise
+    a tzinfo object built from the file.
+
+  Raises:
+    IOError: If the file can't be read.
+  """
+  # The name as given first (US/Eastern is a link to America/New_York), then
+  # where any symlinks lead.
+  name = (_zone_name_from_path(os.path.abspath(path)) or
+          _zone_name_from_path(os.path.realpath(path)))
+  if name is None:
+    with open(path, "rb") as f:
+      data = f.read()
+    name = _zone_name_from_content(data)
+    if name is None:
+      return pytz.tzfile.build_tzinfo(path, io.BytesIO(data))
+  return pytz.timezone(name)
+
+
 def _detect_timezone_etc_timezone():
   if os.path.exists("/etc/timezone"):
     try:
@@ -255,12 +635,20 @@ def _detect_timezone_etc_timezone():
 
 
 def _load_local_tzinfo():
-  """Load zoneinfo from local disk."""
+  """Load zoneinfo from local disk.
+
+  Returns:
+    Dictionary of zone name to tzinfo, or None if the detection ran out of
+    time before the whole database was loaded.
+  """
   tzdir = os.environ.get("TZDIR", "/usr/share/zoneinfo/posix")
 
   localtzdata = {}
   for dirpath, _, filenames in os.walk(tzdir):
     for filename in filenames:
+      if _detect_expired():
+        # A partial database could match the wrong zone.
+        return None
       filepath = os.path.join(dirpath, filename)
       name = os.path.relpath(filepath, tzdir)
 
@@ -285,6 +673,8 @@ def _detect_timezone_etc_localtime():
     # use the name to get the "same" timezone from the inbuilt pytz database.
 
     tzdatabase = _load_local_tzinfo()
+    if tzdatabase is None:
+      return None
     if tzdatabase:
       tznames = tzdatabase.keys()
       tzvalues = tzdatabase.__getitem__
@@ -294,6 +684,8 @@ def _detect_timezone_etc_localtime():
 
     # See if we can find a "Human Name" for this..
     for tzname in tznames:
+      if _detect_expired():
+        return None
       tz = tzvalues(tzname)
 
       if dir(tz) != dir(localtime):
@@ -345,6 +737,8 @@ def _detect_timezone_php():
 
   matches = []
   for tzname in pytz.all_timezones:
+    if _detect_expired():
+      return None
     try:
       tz = pytz.timezone(tzname)
     except IOError:
@@ -410,9 +804,13 @@ class datetime_tz(datetime.datetime):
     * Full integration with pytz (just give it the string of the timezone!)
     * Proper support for going to/from Unix timestamps (which are in UTC!).
   """
-  __slots__ = ["is_dst"]
+  __slots__ = ["is_dst", "_utc_us"]
 
   def __new__(cls, *args, **kw):
+    collector = instrument.collector
+    if collector is not None and collector.timing:
+      start = instrument.timer()
+
     args = list(args)
     if not args:
       raise TypeError("Not enough arguments given.")
@@ -442,15 +840,21 @@ class datetime_tz(datetime.datetime):
 
     if dt.tzinfo is not None:
       # Re-normalize the dt object
+      if collector is not None:
+        collector.count("new.normalize")
       dt = dt.tzinfo.normalize(dt)
 
     else:
       if tzinfo is None:
         tzinfo = localtz()
 
+      if collector is not None:
+        collector.count("new.localize")
       try:
         dt = tzinfo.localize(dt, is_dst=None)
       except pytz.AmbiguousTimeError:
+        if collector is not None:
+          collector.count("new.ambiguous")
         is_dst = None
         if "is_dst" in kw:
           is_dst = kw.pop("is_dst")
@@ -463,8 +867,60 @@ class datetime_tz(datetime.datetime):
     newargs = list(dt.timetuple()[0:6])+[dt.microsecond, dt.tzinfo]
     obj = datetime.datetime.__new__(cls, *newargs)
     obj.is_dst = obj.dst() != datetime.timedelta(0)
+    if collector is not None and collector.timing:
+      collector.time("new", instrument.timer() - start)
     return obj
 
+  @property
+  def utc_us(self):
+    """Integer microseconds since the epoch (in UTC), computed only once.
+
+    Hashing and comparing datetime_tz objects uses this rather than asking
+    each tzinfo for its offset every time.
+    """
+    try:
+      return self._utc_us
+    except AttributeError:
+      self._utc_us = utc_us = transitions.datetime_us(self)
+      return utc_us
+
+  def __hash__(self):
+    # The same as hashing an aware datetime, which hashes the UTC
+    # (days, seconds, microseconds).
+    days, us = divmod(self.utc_us, 86400000000)
+    seconds, us = divmod(us, 1000000)
+    return hash((days + transitions.EPOCH_ORDINAL, seconds, us))
+
+  def __eq__(self, other):
+    if isinstance(other, datetime_tz):
+      return self.utc_us == other.utc_us
+    return datetime.datetime.__eq__(self, other)
+
+  def __ne__(self, other):
+    if isinstance(other, datetime_tz):
+      return self.utc_us != other.utc_us
+    return datetime.datetime.__ne__(self, other)
+
+  def __lt__(self, other):
+    if isinstance(other, datetime_tz):
+      return self.utc_us < other.utc_us
+    return datetime.datetime.__lt__(self, other)
+
+  def __le__(self, other):
+    if isinstance(other, datetime_tz):
+      return self.utc_us <= other.utc_us
+    return datetime.datetime.__le__(self, other)
+
+  def __gt__(self, other):
+    if isinstance(other, datetime_tz):
+      return self.utc_us > other.utc_us
+    return datetime.datetime.__gt__(self, other)
+
+  def __ge__(self, other):
+    if isinstance(other, datetime_tz):
+      return self.utc_us >= other.utc_us
+    return datetime.datetime.__ge__(self, other)
+
   def __copy__(self):
     return type(self)(self)
 
@@ -505,6 +961,35 @@ class datetime_tz(datetime.datetime):
     """
     return calendar.timegm(self.utctimetuple())+1e-6*self.microsecond
 
+  def utctimetuple(self):
+    """Return the UTC time as a time.struct_time.
+
+    datetime's version creates the UTC time as a datetime_tz in our timezone,
+    which fails if that time doesn't exist in it.
+
+    Returns:
+      A time.struct_time.
+    """
+    return transitions.us_naive(self.utc_us).utctimetuple()
+
+  def totimestamp_us(self):
+    """Convert this datetime object to integer microseconds since the epoch.
+
+    Unlike totimestamp, the result is exact.
+
+    Returns:
+      Integer microseconds since the Unix epoch.
+    """
+    return transitions.datetime_us(self)
+
+  def totimestamp_ns(self):
+    """Convert this datetime object to integer nanoseconds since the epoch.
+
+    Returns:
+      Integer nanoseconds since the Unix epoch.
+    """
+    return transitions.datetime_us(self) * 1000
+
   def astimezone(self, tzinfo):
     """Returns a version of this timestamp converted to the given timezone.
 
@@ -520,6 +1005,10 @@ class datetime_tz(datetime.datetime):
 
     tzinfo = _tzinfome(tzinfo)
 
+    table = transitions.zone_table(tzinfo)
+    if table is not None:
+      return type(self)._fromepoch_us(transitions.datetime_us(self), table)
+
     d = self.asdatetime(naive=False).astimezone(tzinfo)
     return type(self)(d)
 
@@ -593,6 +1082,10 @@ class datetime_tz(datetime.datetime):
     Raises:
       ValueError: If unable to make sense of the input.
     """
+    collector = instrument.collector
+    if collector is not None and collector.timing:
+      start = instrument.timer()
+
     # Default for empty fields are:
     #  year/month/day == now
     #  hour/minute/second/microsecond == 0
@@ -607,6 +1100,8 @@ class datetime_tz(datetime.datetime):
 
     # Remove "start of " and "end of " prefix in the string
     if toparse.lower().startswith("end of "):
+      if collector is not None:
+        collector.count("smartparse.startend")
       toparse = toparse[7:].strip()
 
       dt += datetime.timedelta(days=1)
@@ -616,6 +1111,8 @@ class datetime_tz(datetime.datetime):
       default = dt
 
     elif toparse.lower().startswith("start of "):
+      if collector is not None:
+        collector.count("smartparse.startend")
       toparse = toparse[9:].strip()
 
       dt = dt.replace(hour=0, minute=0, second=0, microsecond=0)
@@ -626,17 +1123,24 @@ class datetime_tz(datetime.datetime):
     toparselower = toparse.lower()
 
     if toparselower in ["now", "today"]:
-      pass
+      if collector is not None:
+        collector.count("smartparse.keyword")
 
     elif toparselower == "yesterday":
+      if collector is not None:
+        collector.count("smartparse.keyword")
       dt -= datetime.timedelta(days=1)
 
     elif toparselower in ("tomorrow", "tommorrow"):
+      if collector is not None:
+        collector.count("smartparse.keyword")
       # tommorrow is spelled wrong, but code out there might be depending on it
       # working
       dt += datetime.timedelta(days=1)
 
     elif "ago" in toparselower:
+      if collector is not None:
+        collector.count("smartparse.relative")
       # Remove the "ago" bit
       toparselower = toparselower[:-3]
       # Replace all "a day and an hour" with "1 day 1 hour"
@@ -674,45 +1178,159 @@ class datetime_tz(datetime.datetime):
       dt -= delta
 
     else:
+      if collector is not None:
+        collector.count("smartparse.dateutil")
       # Handle strings with normal datetime format, use original case.
       dt = dateutil.parser.parse(toparse, default=default.asdatetime(),
                                  tzinfos=pytz_abbr.tzinfos)
       if dt is None:
         raise ValueError("Was not able to parse date!")
 
-      if dt.tzinfo is pytz_abbr.unknown:
-        dt = dt.replace(tzinfo=None)
+      dt = cls._fromparsed(dt, tzinfo)
 
-      if dt.tzinfo is None:
-        if tzinfo is None:
-          tzinfo = localtz()
-        dt = cls(dt, tzinfo)
-      else:
-        if isinstance(dt.tzinfo, pytz_abbr.tzabbr):
-          abbr = dt.tzinfo
-          dt = dt.replace(tzinfo=None)
-          dt = cls(dt, abbr.zone, is_dst=abbr.is_dst)
+    if collector is not None and collector.timing:
+      collector.time("smartparse", instrument.timer() - start)
+    return dt
 
-        dt = cls(dt)
+  @classmethod
+  def _fromparsed(cls, dt, tzinfo=None):
+    """Create a datetime_tz from a datetime parsed with pytz_abbr.tzinfos.
 
-    return dt
+    Args:
+      dt: datetime object with a tzinfo from pytz_abbr.tzinfos (or None).
+      tzinfo: Timezone to use if dt doesn't have one.
+              (Defaults to your local timezone.)
+
+    Returns:
+      New datetime_tz object.
+    """
+    if dt.tzinfo is pytz_abbr.unknown:
+      dt = dt.replace(tzinfo=None)
+
+    if dt.tzinfo is None:
+      if tzinfo is None:
+        tzinfo = localtz()
+      return cls(dt, tzinfo)
+
+    if isinstance(dt.tzinfo, pytz_abbr.tzabbr):
+      instrument.count("smartparse.abbreviation")
+      abbr = dt.tzinfo
+      dt = dt.replace(tzinfo=None)
+      dt = cls(dt, abbr.zone, is_dst=abbr.is_dst)
+
+    return cls(dt)
 
   @classmethod
-  def utcfromtimestamp(cls, timestamp):
-    """Returns a datetime object of a given timestamp (in UTC)."""
-    obj = datetime.datetime.utcfromtimestamp(timestamp)
-    obj = pytz.utc.localize(obj)
-    return cls(obj)
+  def _fromlocal(cls, local, tzinfo, is_dst, utc_us=None):
+    """Create a datetime_tz without any checking or normalizing.
+
+    Args:
+      local: Naive datetime object which is already correct for tzinfo.
+      tzinfo: The (localized) pytz tzinfo object for local.
+      is_dst: The value for is_dst.
+      utc_us: The value for utc_us, if already known.
+
+    Returns:
+      New datetime_tz object.
+    """
+    obj = datetime.datetime.__new__(
+        cls, local.year, local.month, local.day, local.hour, local.minute,
+        local.second, local.microsecond, tzinfo)
+    obj.is_dst = is_dst
+    if utc_us is not None:
+      obj._utc_us = utc_us
+    return obj
 
   @classmethod
-  def fromtimestamp(cls, timestamp):
-    """Returns a datetime object of a given timestamp (in local tz)."""
-    d = cls.utcfromtimestamp(timestamp)
-    return d.astimezone(localtz())
+  def _fromepoch_us(cls, epoch_us, table):
+    """Create a datetime_tz from epoch microseconds.
+
+    Args:
+      epoch_us: Integer microseconds since the epoch (in UTC).
+      table: transitions.ZoneTable for the timezone of the result.
+
+    Returns:
+      New datetime_tz object.
+    """
+    i = table.index(epoch_us)
+    return cls._fromlocal(transitions.us_naive(epoch_us + table.offsets[i]),
+                          table.tzinfos[i], table.dsts[i], epoch_us)
+
+  @classmethod
+  def _fromepochs_us(cls, epochs, table):
+    """Create datetime_tz objects from a sequence of epoch microseconds.
+
+    Consecutive values between the same pair of transitions share a single
+    lookup in the table, so this is much faster for sorted values.
+
+    Args:
+      epochs: Iterable of integer microseconds since the epoch (in UTC).
+      table: transitions.ZoneTable for the timezone of the results.
+
+    Yields:
+      datetime_tz objects.
+    """
+    start = end = 0
+    for epoch_us in epochs:
+      if not start <= epoch_us < end:
+        i = table.index(epoch_us)
+        start, end = table.utc[i], table.until(i)
+        offset, tzinfo, is_dst = (
+            table.offsets[i], table.tzinfos[i], table.dsts[i])
+      yield cls._fromlocal(
+          transitions.us_naive(epoch_us + offset), tzinfo, is_dst, epoch_us)
+
+  @classmethod
+  def _fromtimestamp_us(cls, timestamp):
+    """Convert a timestamp to microseconds the same way datetime does."""
+    if isinstance(timestamp, (int, long)):
+      return timestamp * 1000000
+    frac, whole = math.modf(timestamp)
+    us = int(round(frac * 1e6))
+    return int(whole) * 1000000 + us
+
+  @classmethod
+  def utcfromtimestamp(cls, timestamp, tz=None):
+    """Returns a datetime object of a given timestamp.
+
+    Args:
+      timestamp: Seconds since the Unix epoch.
+      tz: Timezone to return the result in. (Defaults to UTC.)
+
+    Returns:
+      New datetime_tz object.
+    """
+    if tz is None:
+      tz = pytz.utc
+    return cls.fromtimestamp(timestamp, tz)
+
+  @classmethod
+  def fromtimestamp(cls, timestamp, tz=None):
+    """Returns a datetime object of a given timestamp.
+
+    Args:
+      timestamp: Seconds since the Unix epoch.
+      tz: Timezone to return the result in. (Defaults to your local
+          timezone.)
+
+    Returns:
+      New datetime_tz object.
+    """
+    if tz is None:
+      tz = localtz()
+    tz = _tzinfome(tz)
+
+    table = transitions.zone_table(tz)
+    if table is None:
+      obj = datetime.datetime.fromtimestamp(timestamp, pytz.utc)
+      return cls(obj).astimezone(tz)
+    return cls._fromepoch_us(cls._fromtimestamp_us(timestamp), table)
 
   @classmethod
   def utcnow(cls):
     """Return a new datetime representing UTC day and time."""
+    if _coarse_clock is not None:
+      return _coarse_clock.now(cls, pytz.utc)
     obj = datetime.datetime.utcnow()
     obj = cls(obj, tzinfo=pytz.utc)
     return obj
@@ -720,9 +1338,11 @@ class datetime_tz(datetime.datetime):
   @classmethod
   def now(cls, tzinfo=None):
     """[tz] -> new datetime with tz's local day and time."""
-    obj = cls.utcnow()
     if tzinfo is None:
       tzinfo = localtz()
+    if _coarse_clock is not None:
+      return _coarse_clock.now(cls, _tzinfome(tzinfo))
+    obj = cls.utcnow()
     return obj.astimezone(tzinfo)
 
   # pylint: disable=redefined-outer-name
@@ -749,11 +1369,150 @@ datetime_tz.max = datetime_tz(
     datetime.datetime.max-datetime.timedelta(days=2), pytz.utc)
 
 
+def totimestamps_us(values):
+  """Convert timezone aware datetimes to integer microseconds since the epoch.
+
+  Args:
+    values: Iterable of timezone aware datetime objects.
+
+  Returns:
+    array.array of integer microseconds since the Unix epoch.
+
+  Raises:
+    TypeError: If given a naive datetime.
+  """
+  # Values share a handful of tzinfo objects, so only ask each for its offset
+  # once.
+  offsets = {}
+  result = array.array(transitions.EPOCH_TYPECODE)
+  append = result.append
+  naive_us = transitions.naive_us
+  for dt in values:
+    tzinfo = dt.tzinfo
+    try:
+      offset = offsets[tzinfo]
+    except (KeyError, TypeError):
+      if tzinfo is None:
+        raise TypeError("Can only convert timezone aware datetime objects!")
+      offset = transitions.timedelta_us(dt.utcoffset())
+      # Only pytz style tzinfo objects have the same offset for every dt.
+      if hasattr(tzinfo, "localize"):
+        offsets[tzinfo] = offset
+    append(naive_us(dt) - offset)
+  return result
+
+
+def totimestamps_ns(values):
+  """Convert timezone aware datetimes to integer nanoseconds since the epoch.
+
+  Args:
+    values: Iterable of timezone aware datetime objects.
+
+  Returns:
+    array.array of integer nanoseconds since the Unix epoch.
+
+  Raises:
+    TypeError: If given a naive datetime.
+    OverflowError: If a value is after the year 2262.
+  """
+  return array.array(transitions.EPOCH_TYPECODE,
+                     [us * 1000 for us in totimestamps_us(values)])
+
+
+def sort_key(dt):
+  """A key function ordering timezone aware datetimes by the time in UTC.
+
+  Sorting with sorted(values, key=sort_key) works out each key once, rather
+  than comparing the datetimes (and asking each for its offset) many times.
+
+  Args:
+    dt: A timezone aware datetime.
+
+  Returns:
+    Integer microseconds since the epoch (in UTC).
+
+  Raises:
+    TypeError: If not given a timezone aware datetime.
+  """
+  try:
+    return dt.utc_us
+  except AttributeError:
+    if not isinstance(dt, datetime.datetime) or dt.tzinfo is None:
+      raise TypeError("Can only sort timezone aware datetime objects! (Got "
+                      "%r)" % (dt,))
+    return transitions.datetime_us(dt)
+
+
+def _warmup_zones(zones):
+  # pytz.all_timezones is built lazily and checked by _tzinfome.
+  len(pytz.all_timezones)
+  for zone in zones:
+    transitions.zone_table(_tzinfome(zone))
+
+
+def _warmup_detect():
+  transitions.zone_table(localtz())
+
+
+def _warmup_parse():
+  pytz_abbr.warm()
+
+  # Compiles the regular expressions used by smartparse and dateutil.
+  for toparse in ("Thu Sep 25 10:36:28 EST 2003", "2003-09-25T10:36:28+0100",
+                  "1 hour 5 minutes ago", "start of yesterday"):
+    datetime_tz.smartparse(toparse, pytz.utc)
+
+
+def warmup(zones=(), detect=True, parse=True):
+  """Do the work datetime_tz normally does lazily on first use.
+
+  Pre-fork servers can call this in the master process, so the children
+  inherit the loaded zones and caches (copy-on-write) rather than each doing
+  the work (and using the memory) on their first request.
+
+  Args:
+    zones: Names (or tzinfo objects) of the timezones to load. Their
+           transition tables are built too.
+    detect: Detect (and build the table for) the local timezone.
+    parse: Load the timezone abbreviations and compile the parsing regular
+           expressions used by smartparse.
+
+  Returns:
+    Dictionary of phase ("zones", "detect" or "parse") to the time it took in
+    seconds, in the order the phases were run.
+
+  Raises:
+    pytz.UnknownTimeZoneError: If a zone is unknown or detect is True and the
+                               local timezone can't be detected.
+  """
+  timer = getattr(time, "perf_counter", time.time)
+  phases = [("zones", _warmup_zones, (zones,)),
+            ("detect", _warmup_detect, ()),
+            ("parse", _warmup_parse, ())]
+  enabled = {"zones": True, "detect": detect, "parse": parse}
+
+  timings = collections.OrderedDict()
+  for name, function, args in phases:
+    if not enabled[name]:
+      continue
+    start = timer()
+    function(*args)
+    timings[name] = timer() - start
+  return timings
+
+
 class iterate(object):
   """Helpful iterators for working with datetime_tz objects."""
 
+  # Number of values generated at once by the block based iterators.
+  BLOCK_SIZE = 1024
+
+  # The types of value iterate.between can produce.
+  OUTPUTS = ("datetime_tz", "epoch", "array")
+
   @staticmethod
-  def between(start, delta, end=None):
+  def between(start, delta, end=None, output="datetime_tz",
+              block_size=None):
     """Return an iterator between this date till given end point.
 
     Example usage:
@@ -767,89 +1526,358 @@ class iterate(object):
       2008/05/15 11:45
       2008/05/16 11:45
 
+    When delta is a positive timedelta and start is in a pytz timezone, the
+    values are computed as integer microseconds since the epoch and created
+    block_size at a time, rather than adding delta to each value in turn.
+
     Args:
       start: The date to start at.
       delta: The interval to iterate with.
       end: (Optional) Date to end at. If not given the iterator will never
            terminate.
+      output: What to yield, one of
+                "datetime_tz" - a datetime_tz object for each value,
+                "epoch" - integer microseconds since the epoch (in UTC) for
+                          each value,
+                "array" - a DatetimeTZArray for each block of values.
+      block_size: Number of values to compute at once.
+                  (Defaults to iterate.BLOCK_SIZE.)
 
     Yields:
-      datetime_tz objects.
+      datetime_tz objects, integers or DatetimeTZArray objects (see output).
+
+    Raises:
+      ValueError: If output is unknown, or output isn't "datetime_tz" and
+                  delta isn't a positive timedelta.
+    """
+    if output not in iterate.OUTPUTS:
+      raise ValueError("Unknown output %r, should be one of %s" % (
+          output, ", ".join(iterate.OUTPUTS)))
+    if block_size is None:
+      block_size = iterate.BLOCK_SIZE
+
+    table = None
+    if isinstance(delta, datetime.timedelta) and delta > datetime.timedelta(0):
+      table = transitions.zone_table(start.tzinfo)
+
+    if table is None or (
+        output == "datetime_tz" and not isinstance(start, datetime_tz)):
+      if output != "datetime_tz":
+        raise ValueError(
+            "Output %r needs a positive timedelta and a pytz timezone." % (
+                output,))
+      return iterate._between_add(start, delta, end)
+    return iterate._between_blocks(
+        start, delta, end, output, block_size, table)
+
+  @staticmethod
+  def range(start, delta, end):
+    """Return a random access sequence of the values between start and end.
+
+    Like iterate.between, but the result supports len(), indexing, slicing,
+    reversed(), `in` and index(), which are all computed arithmetically.
+
+    Example usage:
+      >>> r = iterate.range(start, timedelta(minutes=1), end)
+      >>> len(r), r[10000000], end - timedelta(minutes=1) in r
+
+    Args:
+      start: The date to start at.
+      delta: The (non-zero) timedelta to step by.
+      end: Date to end at (not included).
+
+    Returns:
+      A DatetimeTZRange object.
+    """
+    return DatetimeTZRange(start, delta, end)
+
+  @staticmethod
+  def merge(*streams, **kw):
+    """Merge sorted streams of timestamps (in any timezones) into time order.
+
+    Like heapq.merge, but each value's UTC time (see sort_key) is worked out
+    once, as it is read from its stream, and the heap compares those integers.
+    Only one value from each stream is held at a time. Values at the same
+    time come out in the order of their streams.
+
+    Example usage:
+      >>> for host, record in iterate.merge(*logs, key=lambda r: r.when,
+      ...                                   tagged=True):
+
+    Args:
+      *streams: Iterables of timezone aware datetimes (or values key turns
+                into them), each sorted by time.
+      key: Function returning the timezone aware datetime of a value.
+           (Defaults to the value itself.)
+      tagged: Yield (index of the stream, value) tuples rather than values.
+
+    Yields:
+      The values of all the streams in time order.
+
+    Raises:
+      TypeError: If given an unknown argument or a naive datetime.
     """
+    key = kw.pop("key", None)
+    tagged = kw.pop("tagged", False)
+    if kw:
+      raise TypeError("Unknown arguments %s" % ", ".join(sorted(kw)))
+
+    if key is None:
+      keyfunc = sort_key
+    else:
+      keyfunc = lambda value: sort_key(key(value))
+
+    # [key, index of stream, value, stream]
+    heap = []
+    for index, stream in enumerate(streams):
+      stream = iter(stream)
+      for value in stream:
+        heap.append([keyfunc(value), index, value, stream])
+        break
+    heapq.heapify(heap)
+
+    while len(heap) > 1:
+      entry = heap[0]
+      if tagged:
+        yield entry[1], entry[2]
+      else:
+        yield entry[2]
+      for value in entry[3]:
+        entry[0] = keyfunc(value)
+        entry[2] = value
+        heapq.heapreplace(heap, entry)
+        break
+      else:
+        heapq.heappop(heap)
+
+    if heap:
+      # The last stream doesn't need any keys.
+      _, index, value, stream = heap[0]
+      if tagged:
+        yield index, value
+        for value in stream:
+          yield index, value
+      else:
+        yield value
+        for value in stream:
+          yield value
+
+  @staticmethod
+  def _between_add(start, delta, end):
     toyield = start
     while end is None or toyield < end:
       yield toyield
       toyield += delta
 
   @staticmethod
-  def weeks(start, end=None):
+  def _between_blocks(start, delta, end, output, block_size, table):
+    cls = type(start)
+    step = transitions.timedelta_us(delta)
+    block_start = transitions.datetime_us(start)
+    end_us = None
+    if end is not None:
+      end_us = transitions.datetime_us(end)
+
+    while end_us is None or block_start < end_us:
+      block_end = block_start + step * block_size
+      if end_us is not None and block_end > end_us:
+        block_end = end_us
+      epochs = transitions.EpochRange(block_start, block_end, step)
+
+      if output == "epoch":
+        for epoch_us in epochs:
+          yield epoch_us
+      elif output == "array":
+        yield DatetimeTZArray.fromepochs(epochs, table.zone)
+      else:
+        for dt in cls._fromepochs_us(epochs, table):
+          yield dt
+
+      block_start += step * len(epochs)
+
+  @staticmethod
+  def wallclock(start, end=None, years=0, months=0, days=0):
+    """Iterate in steps of the local calendar.
+
+    The n'th value is start's local date and time moved on by n times the
+    step, so midnight stays at midnight across DST changes. If the day doesn't
+    exist in a month, the last day of the month is used instead (without
+    affecting later values, so Jan 31 + 1 month is Feb 28 and + 2 months is
+    Mar 31).
+
+    Local times which happen twice give the first occurrence. Local times
+    which don't exist are moved forward by the size of the gap.
+
+    Args:
+      start: datetime_tz to start from.
+      end: (Optional) Date to end at, if not given the iterator will never
+           terminate.
+      years: Number of years to step.
+      months: Number of months to step.
+      days: Number of days to step.
+
+    Yields:
+      datetime_tz objects.
+
+    Raises:
+      ValueError: If the step isn't positive or start isn't in a pytz
+                  timezone.
+    """
+    step_months = years * 12 + months
+    if step_months < 0 or days < 0 or not (step_months or days):
+      raise ValueError("The step must be positive.")
+
+    table = transitions.zone_table(start.tzinfo)
+    if table is None:
+      raise ValueError("Wall clock iteration needs a pytz timezone.")
+    return iterate._wallclock(start, end, step_months, days, table)
+
+  @staticmethod
+  def _wallclock(start, end, step_months, days, table):
+    cls = type(start)
+    if not isinstance(start, datetime_tz):
+      cls = datetime_tz
+
+    end_us = None
+    if end is not None:
+      end_us = transitions.datetime_us(end)
+
+    local = datetime.datetime(*start.timetuple()[0:6] + (start.microsecond,))
+    start_month = local.year * 12 + local.month - 1
+
+    n = 0
+    while True:
+      if step_months:
+        year, month = divmod(start_month + n * step_months, 12)
+        month += 1
+        day = min(local.day, calendar.monthrange(year, month)[1])
+        toyield = local.replace(year=year, month=month, day=day)
+      else:
+        toyield = local
+      if days:
+        toyield += datetime.timedelta(days=n * days)
+
+      local_us = transitions.naive_us(toyield)
+      utc_us, i = table.fromlocal(local_us)
+      if end_us is not None and utc_us >= end_us:
+        return
+      if utc_us + table.offsets[i] != local_us:
+        toyield = transitions.us_naive(utc_us + table.offsets[i])
+      yield cls._fromlocal(toyield, table.tzinfos[i], table.dsts[i], utc_us)
+      n += 1
+
+  @staticmethod
+  def weeks(start, end=None, wallclock=False, **kw):
     """Iterate over the weeks between the given datetime_tzs.
 
     Args:
       start: datetime_tz to start from.
       end: (Optional) Date to end at, if not given the iterator will never
            terminate.
+      wallclock: Step by 7 local calendar days (see iterate.wallclock)
+                 rather than 7 * 24 hours.
+      **kw: Other arguments for iterate.between.
 
     Returns:
       An iterator which generates datetime_tz objects a week apart.
     """
-    return iterate.between(start, datetime.timedelta(days=7), end)
+    if wallclock:
+      return iterate.wallclock(start, end, days=7)
+    return iterate.between(start, datetime.timedelta(days=7), end, **kw)
 
   @staticmethod
-  def days(start, end=None):
+  def days(start, end=None, wallclock=False, **kw):
     """Iterate over the days between the given datetime_tzs.
 
     Args:
       start: datetime_tz to start from.
       end: (Optional) Date to end at, if not given the iterator will never
            terminate.
+      wallclock: Step by local calendar days (see iterate.wallclock) rather
+                 than 24 hours.
+      **kw: Other arguments for iterate.between.
 
     Returns:
       An iterator which generates datetime_tz objects a day apart.
     """
-    return iterate.between(start, datetime.timedelta(days=1), end)
+    if wallclock:
+      return iterate.wallclock(start, end, days=1)
+    return iterate.between(start, datetime.timedelta(days=1), end, **kw)
+
+  @staticmethod
+  def months(start, end=None):
+    """Iterate over the local calendar months between the given datetime_tzs.
+
+    Args:
+      start: datetime_tz to start from.
+      end: (Optional) Date to end at, if not given the iterator will never
+           terminate.
+
+    Returns:
+      An iterator which generates datetime_tz objects a month apart (see
+      iterate.wallclock).
+    """
+    return iterate.wallclock(start, end, months=1)
 
   @staticmethod
-  def hours(start, end=None):
+  def years(start, end=None):
+    """Iterate over the local calendar years between the given datetime_tzs.
+
+    Args:
+      start: datetime_tz to start from.
+      end: (Optional) Date to end at, if not given the iterator will never
+           terminate.
+
+    Returns:
+      An iterator which generates datetime_tz objects a year apart (see
+      iterate.wallclock).
+    """
+    return iterate.wallclock(start, end, years=1)
+
+  @staticmethod
+  def hours(start, end=None, **kw):
     """Iterate over the hours between the given datetime_tzs.
 
     Args:
       start: datetime_tz to start from.
       end: (Optional) Date to end at, if not given the iterator will never
            terminate.
+      **kw: Other arguments for iterate.between.
 
     Returns:
       An iterator which generates datetime_tz objects a hour apart.
     """
-    return iterate.between(start, datetime.timedelta(hours=1), end)
+    return iterate.between(start, datetime.timedelta(hours=1), end, **kw)
 
   @staticmethod
-  def minutes(start, end=None):
+  def minutes(start, end=None, **kw):
     """Iterate over the minutes between the given datetime_tzs.
 
     Args:
       start: datetime_tz to start from.
       end: (Optional) Date to end at, if not given the iterator will never
            terminate.
+      **kw: Other arguments for iterate.between.
 
     Returns:
       An iterator which generates datetime_tz objects a minute apart.
     """
-    return iterate.between(start, datetime.timedelta(minutes=1), end)
+    return iterate.between(start, datetime.timedelta(minutes=1), end, **kw)
 
   @staticmethod
-  def seconds(start, end=None):
+  def seconds(start, end=None, **kw):
     """Iterate over the seconds between the given datetime_tzs.
 
     Args:
       start: datetime_tz to start from.
       end: (Optional) Date to end at, if not given the iterator will never
            terminate.
+      **kw: Other arguments for iterate.between.
 
     Returns:
       An iterator which generates datetime_tz objects a second apart.
     """
-    return iterate.between(start, datetime.timedelta(minutes=1), end)
+    return iterate.between(start, datetime.timedelta(seconds=1), end, **kw)
 
 
 def _wrap_method(name):
@@ -882,10 +1910,39 @@ for methodname in ["__add__", "__radd__", "__rsub__", "__sub__"]:
   if hasattr(datetime.datetime, methodname):
     _wrap_method(methodname)
 
+# pylint: disable=g-import-not-at-top,wrong-import-position
+from .tzarray import DatetimeTZArray
+from .tzrange import DatetimeTZRange
+from .parallel import parse_file
+from .inference import FormatParser
+from .buckets import floor_to, group_by_local
+from .timeindex import TimeIndex
+from .intervals import TimeRange, IntervalIndex
+
+if sys.version_info >= (3, 6):
+
+  def aparse(lines, *args, **kw):
+    """Parse a stream of strings without blocking the event loop.
+
+    See datetime_tz.aio.aparse, which is imported on first use so importing
+    datetime_tz doesn't import asyncio.
+    """
+    from . import aio
+    return aio.aparse(lines, *args, **kw)
+
 __all__ = [
     "datetime_tz", "detect_timezone", "iterate", "localtz",
     "localtz_set", "timedelta", "_detect_timezone_environ",
     "_detect_timezone_etc_localtime", "_detect_timezone_etc_timezone",
     "_detect_timezone_php", "localize", "get_naive", "localtz_name",
-    "require_timezone"]
+    "require_timezone", "DatetimeTZArray", "DatetimeTZRange", "parse_file",
+    "FormatParser", "floor_to", "group_by_local", "totimestamps_us",
+    "totimestamps_ns", "coarse_clock_set", "compile_zone", "compile_rule",
+    "hot_zones_set",
+    "sort_key", "warmup", "zonedb_set", "TimeIndex",
+    "TimeRange", "IntervalIndex", "stats", "stats_set", "collect_stats",
+    "detect_set", "DETECT_METHODS"]
+
+if sys.version_info >= (3, 6):
+  __all__.append("aparse")
 
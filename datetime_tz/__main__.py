@@ -0,0 +1,104 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""Command line tools for datetime_tz.
+
+Usage:
+  python -m datetime_tz parse-file [options] FILE
+  python -m datetime_tz build-zonedb [--output PATH] [ZONE ...]
+"""
+
+import argparse
+import sys
+
+from datetime_tz import parallel
+
+
+def _parse_file(args):
+  """Run the parse-file command."""
+  values = parallel.parse_file(
+      args.file, column=args.column, delimiter=args.delimiter,
+      tzinfo=args.tz, workers=args.workers, chunk_size=args.chunk_size,
+      encoding=args.encoding, header=args.header, errors=args.errors)
+
+  out = sys.stdout
+  if args.output_format == "epoch":
+    zones = [str(zone) for zone in values.zones]
+    for epoch_us, zone_id in zip(values.epochs, values.zone_ids):
+      out.write("%d %s\n" % (epoch_us, zones[zone_id]))
+  else:
+    for value in values:
+      out.write(value.isoformat() + "\n")
+  return 0
+
+
+def _build_zonedb(args):
+  """Run the build-zonedb command."""
+  # pylint: disable=g-import-not-at-top
+  from datetime_tz import zonedb
+  path = zonedb.build(args.output, args.zones or None)
+  sys.stdout.write(path + "\n")
+  return 0
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog="python -m datetime_tz")
+  commands = parser.add_subparsers(dest="command")
+  commands.required = True
+
+  parse_file = commands.add_parser(
+      "parse-file", help="Parse the timestamps in a text or CSV file.")
+  parse_file.add_argument("file")
+  parse_file.add_argument(
+      "--column", type=int, default=None,
+      help="CSV column with the timestamp (default: the whole line).")
+  parse_file.add_argument("--delimiter", default=",")
+  parse_file.add_argument(
+      "--tz", default=None,
+      help="Timezone for values without one (default: local timezone).")
+  parse_file.add_argument(
+      "--workers", type=int, default=None,
+      help="Number of worker processes (default: number of CPUs).")
+  parse_file.add_argument(
+      "--chunk-size", type=int, default=parallel.CHUNK_SIZE)
+  parse_file.add_argument("--encoding", default="utf-8")
+  parse_file.add_argument(
+      "--header", action="store_true", help="Skip the first line.")
+  parse_file.add_argument(
+      "--errors", choices=("raise", "skip"), default="raise")
+  parse_file.add_argument(
+      "--output-format", choices=("iso", "epoch"), default="iso",
+      help="Write ISO 8601 timestamps or epoch microseconds and zone.")
+  parse_file.set_defaults(func=_parse_file)
+
+  build_zonedb = commands.add_parser(
+      "build-zonedb", help="Compile the timezones into a shared database.")
+  build_zonedb.add_argument(
+      "zones", nargs="*", help="Zones to include (default: all of them).")
+  build_zonedb.add_argument(
+      "--output", default=None,
+      help="Where to write the database (default: the cache directory).")
+  build_zonedb.set_defaults(func=_build_zonedb)
+
+  args = parser.parse_args(argv)
+  return args.func(args)
+
+
+if __name__ == "__main__":
+  sys.exit(main())
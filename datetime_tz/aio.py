@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+
+"""asyncio support for datetime_tz (requires Python 3.6+).
+
+Parsing with dateutil is slow enough that doing it directly in a coroutine
+stalls the event loop. aparse batches up lines and parses each batch in an
+executor instead, while keeping the results in the same order as the input.
+
+Example usage:
+  >>> async for dt in datetime_tz.aparse(reader_lines(reader)):
+  ...   handle(dt)
+"""
+
+import asyncio
+import collections
+
+import datetime_tz
+
+# Number of lines parsed in one executor call.
+BATCH_SIZE = 256
+
+# Maximum number of batches being parsed at once. Once reached, no more lines
+# are read until the oldest batch has been consumed.
+MAX_BATCHES = 4
+
+# Maximum time (in seconds) a partial batch waits for more lines.
+MAX_DELAY = 0.05
+
+
+def _parse_batch(batch, tzinfo):
+  """Parse a batch of strings (run in the executor)."""
+  smartparse = datetime_tz.datetime_tz.smartparse
+  return [smartparse(line, tzinfo) for line in batch]
+
+
+async def _aiter(lines):
+  for line in lines:
+    yield line
+
+
+async def aparse(lines, tzinfo=None, batch_size=BATCH_SIZE,
+                 max_batches=MAX_BATCHES, max_delay=MAX_DELAY, executor=None):
+  """Parse a stream of strings with smartparse without blocking the loop.
+
+  Args:
+    lines: An async iterable (or iterable) of strings to parse.
+    tzinfo: Timezone for values which don't include one.
+            (Defaults to your local timezone.)
+    batch_size: Number of lines to parse in a single executor call.
+    max_batches: Maximum number of batches being parsed at once.
+    max_delay: Maximum time (in seconds) to wait for a batch to fill before
+               parsing what has arrived so far.
+    executor: concurrent.futures.Executor to parse in. (Defaults to the
+              loop's default executor.) A ProcessPoolExecutor avoids
+              competing with the event loop for the GIL.
+
+  Yields:
+    datetime_tz objects, in the same order as lines.
+
+  Raises:
+    ValueError: If unable to make sense of a line.
+  """
+  if batch_size < 1 or max_batches < 1:
+    raise ValueError("batch_size and max_batches must be positive.")
+
+  if tzinfo is None:
+    tzinfo = datetime_tz.localtz()
+  tzinfo = datetime_tz._tzinfome(tzinfo)  # pylint: disable=protected-access
+
+  if not hasattr(lines, "__aiter__"):
+    lines = _aiter(lines)
+  iterator = lines.__aiter__()
+
+  loop = asyncio.get_event_loop()
+  pending = collections.deque()
+  batch = []
+  flush_at = None
+  read = None
+
+  try:
+    while True:
+      if read is None:
+        read = asyncio.ensure_future(iterator.__anext__())
+
+      # Wake up for a new line, the oldest batch finishing or when a partial
+      # batch has waited long enough.
+      waiting = [read]
+      if pending:
+        waiting.append(pending[0])
+      timeout = None
+      if batch:
+        timeout = max(0, flush_at - loop.time())
+      done, _ = await asyncio.wait(
+          waiting, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+      if read in done:
+        try:
+          line = read.result()
+        except StopAsyncIteration:
+          read = None
+          break
+        read = None
+        if not batch:
+          flush_at = loop.time() + max_delay
+        batch.append(line)
+
+      if batch and (len(batch) >= batch_size or loop.time() >= flush_at):
+        pending.append(
+            loop.run_in_executor(executor, _parse_batch, batch, tzinfo))
+        batch = []
+
+      while pending and (len(pending) >= max_batches or pending[0].done()):
+        for dt in await pending.popleft():
+          yield dt
+
+    if batch:
+      pending.append(
+          loop.run_in_executor(executor, _parse_batch, batch, tzinfo))
+    while pending:
+      for dt in await pending.popleft():
+        yield dt
+
+  finally:
+    if read is not None:
+      read.cancel()
+    for future in pending:
+      future.cancel()
@@ -0,0 +1,511 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name
+
+"""Benchmarks for the datetime_tz hot paths.
+
+The benchmarks run over a Corpus of values generated from a fixed seed, half
+at random times and half close to the DST transitions of many zones (so
+including times which are ambiguous), so results can be compared between
+commits. Each benchmark is run a few times and the best rate is reported,
+along with the memory blocks and bytes per operation still alive in its
+results and the peak bytes per operation allocated while running, including
+short-lived temporaries (measured with tracemalloc).
+
+The corpus only uses public APIs, so the benchmarks can also be run against
+older versions; benchmarks of features a version doesn't have are reported as
+failed.
+
+Usage:
+  python -m datetime_tz.bench [--size N] [--repeat N] [--output FILE]
+                              [--compare FILE] [BENCHMARK ...]
+"""
+
+import argparse
+import collections
+import datetime
+import json
+import random
+import sys
+import time
+
+import dateutil.parser
+import pytz
+
+import datetime_tz
+from datetime_tz import pytz_abbr
+
+try:
+  import tracemalloc  # pylint: disable=g-import-not-at-top
+except ImportError:
+  # Python < 3.4
+  tracemalloc = None
+
+ZONES = ("US/Eastern", "US/Pacific", "America/Sao_Paulo", "Europe/London",
+         "Europe/Berlin", "Europe/Moscow", "Asia/Kolkata", "Asia/Tokyo",
+         "Australia/Sydney", "Australia/Lord_Howe", "Pacific/Auckland",
+         "Pacific/Chatham", "UTC")
+
+# Times are between the start of these years.
+YEARS = (2000, 2030)
+
+# Name -> function taking a Corpus and returning a sized result, with one
+# entry for each operation.
+BENCHMARKS = collections.OrderedDict()
+
+_timer = getattr(time, "perf_counter", time.time)
+
+
+def benchmark(name):
+  """Decorator registering a benchmark function."""
+  def register(function):
+    BENCHMARKS[name] = function
+    return function
+  return register
+
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _epoch_us(dt):
+  """Returns a naive UTC datetime as microseconds since the epoch."""
+  delta = dt - _EPOCH
+  return (delta.days * 86400 + delta.seconds) * 1000000 + delta.microseconds
+
+
+class Corpus(object):
+  """The values the benchmarks run over.
+
+  Attributes:
+    size: The number of values.
+    zones: The pytz zone of each value.
+    values: datetime_tz objects, shuffled.
+    naive: (naive datetime, zone, is_dst) for each value.
+    aware: Each value as an aware datetime.datetime.
+    timestamps: Each value as a (float) Unix timestamp.
+    local: Strings without a timezone, for times which exist exactly once in
+           their zone, as (string, zone).
+    abbreviated: Strings with a timezone abbreviation.
+  """
+
+  def __init__(self, size=10000, seed=0):
+    rand = random.Random(seed)
+    zones = [pytz.timezone(zone) for zone in ZONES]
+
+    lo = _epoch_us(datetime.datetime(YEARS[0], 1, 1))
+    hi = _epoch_us(datetime.datetime(YEARS[1], 1, 1))
+    edges = []
+    for zone in zones:
+      edges.extend(
+          utc for utc in map(_epoch_us, getattr(zone, "_utc_transition_times",
+                                                ()))
+          if lo <= utc < hi)
+    edges.sort()
+
+    self.size = size
+    self.zones = []
+    self.values = []
+    self.timestamps = []
+    for i in range(size):
+      zone_index = rand.randrange(len(zones))
+      if i % 2 and edges:
+        # Within two hours of a transition
+        epoch_us = rand.choice(edges) + rand.randint(-7200, 7200) * 1000000
+      else:
+        epoch_us = rand.randint(lo, hi)
+      epoch_us -= epoch_us % 1000
+      self.zones.append(zones[zone_index])
+      # Only public APIs, so the corpus can be built by older versions.
+      utc = datetime_tz.datetime_tz(pytz.utc.localize(
+          _EPOCH + datetime.timedelta(microseconds=epoch_us)))
+      self.values.append(utc.astimezone(zones[zone_index]))
+      self.timestamps.append(epoch_us / 1e6)
+
+    self.naive = [(value.asdatetime(), zone, value.is_dst)
+                  for value, zone in zip(self.values, self.zones)]
+    self.aware = [value.asdatetime(naive=False) for value in self.values]
+
+    self.local = []
+    for value, zone in zip(self.values, self.zones):
+      try:
+        zone.localize(value.asdatetime(), is_dst=None)
+      except pytz.InvalidTimeError:
+        continue
+      self.local.append(
+          (value.strftime("%Y-%m-%d %H:%M:%S.%f"), zone))
+
+    self.abbreviated = []
+    for value in self.values:
+      abbr = value.tzname()
+      if abbr not in pytz_abbr.all:
+        abbr = "UTC"
+        value = value.astimezone(pytz.utc)
+      self.abbreviated.append(
+          value.strftime("%a %b %d %H:%M:%S ") + abbr + value.strftime(" %Y"))
+
+
+# Creating datetime_tz objects
+
+
+@benchmark("new.naive")
+def _new_naive(corpus):
+  cls = datetime_tz.datetime_tz
+  return [cls(dt, zone, is_dst=is_dst) for dt, zone, is_dst in corpus.naive]
+
+
+@benchmark("new.aware")
+def _new_aware(corpus):
+  cls = datetime_tz.datetime_tz
+  return [cls(dt) for dt in corpus.aware]
+
+
+@benchmark("new.datetime_tz")
+def _new_datetime_tz(corpus):
+  cls = datetime_tz.datetime_tz
+  return [cls(dt) for dt in corpus.values]
+
+
+@benchmark("new.fields")
+def _new_fields(corpus):
+  cls = datetime_tz.datetime_tz
+  return [cls(dt.year, dt.month, dt.day, dt.hour, tzinfo="UTC")
+          for dt in corpus.values]
+
+
+# Operations on datetime_tz objects
+
+
+@benchmark("astimezone")
+def _astimezone(corpus):
+  zones = corpus.zones[1:] + corpus.zones[:1]
+  return [dt.astimezone(zone) for dt, zone in zip(corpus.values, zones)]
+
+
+@benchmark("replace")
+def _replace(corpus):
+  return [dt.replace(microsecond=0) for dt in corpus.values]
+
+
+@benchmark("add")
+def _add(corpus):
+  delta = datetime.timedelta(hours=1, minutes=30)
+  return [dt + delta for dt in corpus.values]
+
+
+@benchmark("sub.timedelta")
+def _sub_timedelta(corpus):
+  delta = datetime.timedelta(hours=1, minutes=30)
+  return [dt - delta for dt in corpus.values]
+
+
+@benchmark("sub.datetime")
+def _sub_datetime(corpus):
+  values = corpus.values
+  return [a - b for a, b in zip(values, values[1:])]
+
+
+@benchmark("totimestamp")
+def _totimestamp(corpus):
+  return [dt.totimestamp() for dt in corpus.values]
+
+
+@benchmark("totimestamp_us")
+def _totimestamp_us(corpus):
+  return [dt.totimestamp_us() for dt in corpus.values]
+
+
+@benchmark("fromtimestamp")
+def _fromtimestamp(corpus):
+  fromtimestamp = datetime_tz.datetime_tz.fromtimestamp
+  return [fromtimestamp(ts, zone)
+          for ts, zone in zip(corpus.timestamps, corpus.zones)]
+
+
+@benchmark("now")
+def _now(corpus):
+  now = datetime_tz.datetime_tz.now
+  return [now(zone) for zone in corpus.zones]
+
+
+# Comparing and sorting
+
+
+@benchmark("compare")
+def _compare(corpus):
+  values = corpus.values
+  return [a < b for a, b in zip(values, values[1:])]
+
+
+@benchmark("sort")
+def _sort(corpus):
+  return sorted(corpus.values)
+
+
+@benchmark("sort_key")
+def _sort_key(corpus):
+  return sorted(corpus.values, key=datetime_tz.sort_key)
+
+
+@benchmark("dedupe")
+def _dedupe(corpus):
+  return list(set(corpus.values))
+
+
+# Parsing
+
+
+def _repeat(strings, size):
+  return (strings * (size // len(strings) + 1))[:size]
+
+
+@benchmark("smartparse.keyword")
+def _smartparse_keyword(corpus):
+  smartparse = datetime_tz.datetime_tz.smartparse
+  strings = _repeat(["now", "today", "yesterday", "tomorrow"], corpus.size)
+  return [smartparse(s, "US/Eastern") for s in strings]
+
+
+@benchmark("smartparse.relative")
+def _smartparse_relative(corpus):
+  smartparse = datetime_tz.datetime_tz.smartparse
+  strings = _repeat(["5 minutes ago", "an hour ago", "1 day 2 hours ago",
+                     "3 weeks ago", "2h5m ago"], corpus.size)
+  return [smartparse(s, "US/Eastern") for s in strings]
+
+
+@benchmark("smartparse.startend")
+def _smartparse_startend(corpus):
+  smartparse = datetime_tz.datetime_tz.smartparse
+  strings = _repeat(["start of yesterday", "end of tomorrow",
+                     "start of today", "end of 3rd of March"], corpus.size)
+  return [smartparse(s, "US/Eastern") for s in strings]
+
+
+@benchmark("smartparse.iso")
+def _smartparse_iso(corpus):
+  smartparse = datetime_tz.datetime_tz.smartparse
+  return [smartparse(dt.isoformat()) for dt in corpus.values]
+
+
+@benchmark("smartparse.local")
+def _smartparse_local(corpus):
+  smartparse = datetime_tz.datetime_tz.smartparse
+  return [smartparse(s, zone) for s, zone in corpus.local]
+
+
+@benchmark("smartparse.abbreviation")
+def _smartparse_abbreviation(corpus):
+  smartparse = datetime_tz.datetime_tz.smartparse
+  return [smartparse(s) for s in corpus.abbreviated]
+
+
+@benchmark("pytz_abbr.parse")
+def _pytz_abbr_parse(corpus):
+  parse = dateutil.parser.parse
+  return [parse(s, tzinfos=pytz_abbr.tzinfos) for s in corpus.abbreviated]
+
+
+# Iterating
+
+
+def _start(zone="US/Eastern"):
+  return datetime_tz.datetime_tz(datetime.datetime(YEARS[0], 1, 1), zone)
+
+
+@benchmark("iterate.between")
+def _iterate_between(corpus):
+  delta = datetime.timedelta(minutes=7)
+  start = _start()
+  return list(datetime_tz.iterate.between(start, delta,
+                                          start + delta * corpus.size))
+
+
+@benchmark("iterate.hours")
+def _iterate_hours(corpus):
+  start = _start()
+  return list(datetime_tz.iterate.hours(
+      start, start + datetime.timedelta(hours=corpus.size)))
+
+
+@benchmark("iterate.days")
+def _iterate_days(corpus):
+  start = _start()
+  return list(datetime_tz.iterate.days(
+      start, start + datetime.timedelta(days=corpus.size)))
+
+
+@benchmark("iterate.days.wallclock")
+def _iterate_days_wallclock(corpus):
+  start = _start()
+  return list(datetime_tz.iterate.days(
+      start, start + datetime.timedelta(days=corpus.size), wallclock=True))
+
+
+@benchmark("iterate.range")
+def _iterate_range(corpus):
+  delta = datetime.timedelta(minutes=7)
+  start = _start("Australia/Lord_Howe")
+  return list(datetime_tz.iterate.range(start, delta,
+                                        start + delta * corpus.size))
+
+
+@benchmark("iterate.merge")
+def _iterate_merge(corpus):
+  values = corpus.values
+  streams = [sorted(values[i::16], key=datetime_tz.sort_key)
+             for i in range(16)]
+  return list(datetime_tz.iterate.merge(*streams))
+
+
+def run(function, corpus, repeat=3):
+  """Time a benchmark.
+
+  Args:
+    function: The benchmark function.
+    corpus: The Corpus to run it over.
+    repeat: Number of times to run the benchmark.
+
+  Returns:
+    The best rate, in operations per second.
+  """
+  best = None
+  for _ in range(repeat):
+    start = _timer()
+    ops = len(function(corpus))
+    elapsed = _timer() - start
+    rate = ops / max(elapsed, 1e-9)
+    if best is None or rate > best:
+      best = rate
+  return best
+
+
+def memory(function, corpus):
+  """Measure the memory a benchmark allocates.
+
+  The blocks come from comparing tracemalloc snapshots taken before and after
+  the benchmark runs, the bytes from tracemalloc's traced memory. The peak
+  includes short-lived allocations (like the temporaries of astimezone) as
+  well as the results, so it is at least the memory kept.
+
+  Args:
+    function: The benchmark function.
+    corpus: The Corpus to run it over.
+
+  Returns:
+    (blocks, kept, peak) per operation, where blocks is the number of memory
+    blocks still allocated for the results, kept is the bytes still alive in
+    the results and peak is the highest number of bytes traced while running,
+    all relative to before starting. (None, None, None) if tracemalloc isn't
+    available.
+  """
+  if tracemalloc is None:
+    return None, None, None
+  tracemalloc.start()
+  try:
+    before = tracemalloc.take_snapshot()
+    start, _ = tracemalloc.get_traced_memory()
+    result = function(corpus)
+    current, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+  finally:
+    tracemalloc.stop()
+  ops = float(max(len(result), 1))
+  blocks = sum(stat.count_diff for stat in after.compare_to(before, "filename"))
+  return blocks / ops, (current - start) / ops, (peak - start) / ops
+
+
+def _format(value, spec):
+  if value is None:
+    return "-"
+  return spec % value
+
+
+def main(argv=None):
+  parser = argparse.ArgumentParser(prog="python -m datetime_tz.bench")
+  parser.add_argument(
+      "benchmarks", nargs="*", metavar="BENCHMARK",
+      help="Benchmarks (or prefixes like 'smartparse') to run (default: all "
+      "of them).")
+  parser.add_argument("--size", type=int, default=10000,
+                      help="Number of values in the corpus.")
+  parser.add_argument("--repeat", type=int, default=3)
+  parser.add_argument("--seed", type=int, default=0)
+  parser.add_argument("--no-memory", action="store_true",
+                      help="Don't measure the memory used.")
+  parser.add_argument("--output", help="Write the results to a JSON file.")
+  parser.add_argument(
+      "--compare", help="Compare with the results in a JSON file from an "
+      "earlier run.")
+  parser.add_argument("--list", action="store_true",
+                      help="List the benchmarks.")
+  args = parser.parse_args(argv)
+
+  if args.list:
+    for name in BENCHMARKS:
+      sys.stdout.write(name + "\n")
+    return 0
+
+  names = []
+  for pattern in args.benchmarks or [""]:
+    matches = [name for name in BENCHMARKS
+               if name == pattern or name.startswith(pattern)]
+    if not matches:
+      parser.error("Unknown benchmark %r" % pattern)
+    names.extend(name for name in matches if name not in names)
+
+  baseline = {}
+  if args.compare:
+    with open(args.compare) as f:
+      baseline = json.load(f)
+
+  corpus = Corpus(args.size, args.seed)
+  results = collections.OrderedDict()
+  sys.stdout.write("%-24s %14s %10s %10s %10s\n" % (
+      "benchmark", "ops/sec", "blocks/op", "kept B/op", "peak B/op"))
+  for name in names:
+    function = BENCHMARKS[name]
+    try:
+      rate = run(function, corpus, args.repeat)
+    except Exception as e:  # pylint: disable=broad-except
+      # Older versions of datetime_tz don't have everything benchmarked.
+      sys.stdout.write("%-24s failed: %s: %s\n" % (
+          name, type(e).__name__, e))
+      continue
+    blocks = kept = peak = None
+    if not args.no_memory:
+      blocks, kept, peak = memory(function, corpus)
+    results[name] = {"ops_per_sec": rate, "blocks_per_op": blocks,
+                     "bytes_per_op": kept, "peak_bytes_per_op": peak}
+
+    line = "%-24s %14.0f %10s %10s %10s" % (
+        name, rate, _format(blocks, "%.1f"), _format(kept, "%.0f"),
+        _format(peak, "%.0f"))
+    if name in baseline:
+      line += "  %+6.1f%%" % (
+          (rate / baseline[name]["ops_per_sec"] - 1) * 100)
+    sys.stdout.write(line + "\n")
+
+  if args.output:
+    with open(args.output, "w") as f:
+      json.dump(results, f, indent=2)
+  return 0
+
+
+if __name__ == "__main__":
+  sys.exit(main())
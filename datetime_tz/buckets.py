@@ -0,0 +1,234 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""Bucket timestamps by local calendar units (hours, days, months, ...).
+
+The buckets are found with integer arithmetic on the zone's transition table
+(see datetime_tz.transitions), so no datetime_tz objects are created for the
+values being bucketed. Buckets follow the local wall clock:
+
+ * A day starts at the first local midnight (or the first time after
+   midnight if midnight doesn't exist that day), so days are 23 or 25 hours
+   long across DST changes.
+ * An hour repeated when the clocks go back is two separate buckets, each
+   starting at the moment it began.
+
+Example usage:
+  >>> floor_to(dt, "day", "US/Eastern")
+  datetime_tz(2009, 3, 8, 0, 0, tzinfo=<DstTzInfo 'US/Eastern' EST...>)
+  >>> for day, events in group_by_local(events, "day", "US/Eastern"):
+  ...   print day, len(events)
+"""
+
+import array
+import datetime
+
+import datetime_tz
+from datetime_tz import transitions
+
+MINUTE_US = 60 * 1000000
+HOUR_US = 60 * MINUTE_US
+DAY_US = 24 * HOUR_US
+
+# Units shorter than a day, as microseconds.
+_FIXED_UNITS = {
+    "second": 1000000,
+    "minute": MINUTE_US,
+    "hour": HOUR_US,
+}
+
+# Units of whole local days or more.
+_CALENDAR_UNITS = ("day", "week", "month", "year")
+
+UNITS = tuple(sorted(_FIXED_UNITS)) + _CALENDAR_UNITS
+
+
+def _ordinal_us(ordinal):
+  """Returns local midnight of a date ordinal as microseconds."""
+  return (ordinal - transitions.EPOCH_ORDINAL) * DAY_US
+
+
+class Bucketer(object):
+  """Finds the local calendar bucket of epoch microseconds in a timezone.
+
+  The last bucket found is remembered, so sorted (or mostly sorted) input
+  only does a table lookup when it moves into a new bucket.
+  """
+
+  def __init__(self, unit, tzinfo=None):
+    """Create a Bucketer.
+
+    Args:
+      unit: One of UNITS.
+      tzinfo: Timezone to bucket in. (Defaults to your local timezone.)
+
+    Raises:
+      ValueError: If the unit is unknown or tzinfo isn't a pytz timezone.
+    """
+    if unit not in UNITS:
+      raise ValueError("Unknown unit %r, should be one of %s" % (
+          unit, ", ".join(UNITS)))
+    if tzinfo is None:
+      tzinfo = datetime_tz.localtz()
+    self.table = transitions.zone_table(datetime_tz._tzinfome(tzinfo))
+    if self.table is None:
+      raise ValueError("Bucketing needs a pytz timezone.")
+    self.unit = unit
+
+    # The bucket [_start, _end) was the last one found.
+    self._start = 0
+    self._end = 0
+
+  def _calendar(self, local_us):
+    """Returns local (start, end) of the calendar bucket holding local_us."""
+    ordinal = local_us // DAY_US + transitions.EPOCH_ORDINAL
+    if self.unit == "day":
+      return ordinal, ordinal + 1
+    if self.unit == "week":
+      start = ordinal - datetime.date.fromordinal(ordinal).weekday()
+      return start, start + 7
+
+    date = datetime.date.fromordinal(ordinal)
+    if self.unit == "month":
+      start = date.replace(day=1)
+      if start.month == 12:
+        end = start.replace(year=start.year + 1, month=1)
+      else:
+        end = start.replace(month=start.month + 1)
+    else:
+      start = date.replace(month=1, day=1)
+      end = start.replace(year=start.year + 1)
+    return start.toordinal(), end.toordinal()
+
+  def _find(self, epoch_us):
+    """Returns the UTC (start, end) of the bucket holding epoch_us."""
+    table = self.table
+    i = table.index(epoch_us)
+    offset = table.offsets[i]
+    local_us = epoch_us + offset
+
+    size = _FIXED_UNITS.get(self.unit)
+    if size is not None:
+      local_start = local_us - local_us % size
+      start = max(local_start - offset, table.utc[i])
+      end = min(local_start + size - offset, table.until(i))
+      return start, end
+
+    start, end = self._calendar(local_us)
+    return (table.fromlocal(_ordinal_us(start))[0],
+            table.fromlocal(_ordinal_us(end))[0])
+
+  def floor(self, epoch_us):
+    """Returns the start of the bucket holding epoch_us (in epoch_us)."""
+    if not self._start <= epoch_us < self._end:
+      self._start, self._end = self._find(epoch_us)
+    return self._start
+
+  def todatetime(self, epoch_us):
+    """Returns epoch_us as a datetime_tz in the bucketing timezone."""
+    return datetime_tz.datetime_tz._fromepoch_us(epoch_us, self.table)
+
+
+def _epoch_us(value):
+  """Returns an aware datetime or epoch microseconds as epoch microseconds."""
+  if isinstance(value, datetime.datetime):
+    if value.tzinfo is None:
+      raise TypeError("Can only bucket timezone aware datetime objects!")
+    return transitions.datetime_us(value)
+  return value
+
+
+def floor_to(values, unit, tz=None):
+  """Find the start of the local calendar bucket of values.
+
+  Args:
+    values: A timezone aware datetime, an integer number of microseconds
+            since the epoch or a sequence of them (including an array.array
+            or DatetimeTZArray).
+    unit: The size of the bucket, one of UNITS.
+    tz: Timezone to bucket in. (Defaults to your local timezone.)
+
+  Returns:
+    The start of the bucket in the same form as values. Datetimes give a
+    datetime_tz in tz, epoch microseconds give epoch microseconds, an
+    array.array gives an array.array, a DatetimeTZArray gives a
+    DatetimeTZArray (in tz) and other sequences give a list.
+
+  Raises:
+    ValueError: If the unit is unknown or tz isn't a pytz timezone.
+    TypeError: If given a naive datetime.
+  """
+  bucketer = Bucketer(unit, tz)
+
+  if isinstance(values, datetime.datetime):
+    return bucketer.todatetime(bucketer.floor(_epoch_us(values)))
+  if isinstance(values, datetime_tz.DatetimeTZArray):
+    return datetime_tz.DatetimeTZArray.fromepochs(
+        [bucketer.floor(e) for e in values.epochs], bucketer.table.zone)
+  if isinstance(values, array.array):
+    return array.array(values.typecode, [bucketer.floor(e) for e in values])
+  try:
+    iterator = iter(values)
+  except TypeError:
+    return bucketer.floor(values)
+
+  result = []
+  for value in iterator:
+    if isinstance(value, datetime.datetime):
+      result.append(bucketer.todatetime(bucketer.floor(_epoch_us(value))))
+    else:
+      result.append(bucketer.floor(value))
+  return result
+
+
+def group_by_local(stream, unit, tz=None):
+  """Group a stream of timestamps by local calendar bucket.
+
+  Like itertools.groupby, consecutive values in the same bucket are grouped
+  together, so a sorted stream gives each bucket once.
+
+  Args:
+    stream: Iterable of timezone aware datetimes or epoch microseconds.
+    unit: The size of the bucket, one of UNITS.
+    tz: Timezone to bucket in. (Defaults to your local timezone.)
+
+  Yields:
+    (bucket, values) tuples, where bucket is a datetime_tz for the start of
+    the bucket (in tz) and values is a list of the values from stream.
+
+  Raises:
+    ValueError: If the unit is unknown or tz isn't a pytz timezone.
+    TypeError: If given a naive datetime.
+  """
+  bucketer = Bucketer(unit, tz)
+
+  current = None
+  values = []
+  for value in stream:
+    bucket = bucketer.floor(_epoch_us(value))
+    if bucket != current:
+      if values:
+        yield bucketer.todatetime(current), values
+      current = bucket
+      values = []
+    values.append(value)
+
+  if values:
+    yield bucketer.todatetime(current), values
@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""A fast, optionally coarse, clock for datetime_tz.now() and utcnow().
+
+Normally now() creates a UTC datetime_tz and then converts it with
+astimezone. A CoarseClock instead reads time.time_ns() and remembers the
+offset of each timezone until its next transition, so the common case is a
+comparison and creating a single object.
+
+With a tick, calls in the same tick (for example the same millisecond) return
+the same object.
+
+Example usage:
+  >>> datetime_tz.coarse_clock_set(tick=0.001)
+  >>> datetime_tz.datetime_tz.now()
+"""
+
+import time
+
+from datetime_tz import transitions
+
+try:
+  _time_ns = time.time_ns
+except AttributeError:
+  # Python < 3.7
+  def _time_ns():
+    return int(time.time() * 1e9)
+
+
+class CoarseClock(object):
+  """Creates datetime_tz objects for the current time."""
+
+  def __init__(self, tick=0, timer=_time_ns):
+    """Create a clock.
+
+    Args:
+      tick: Length of a tick in seconds. Calls in the same tick return the
+            same object. (0 creates a new object for every call.)
+      timer: Function returning the current time as integer nanoseconds
+             since the epoch.
+
+    Raises:
+      ValueError: If tick is negative.
+    """
+    if tick < 0:
+      raise ValueError("tick can not be negative.")
+    self.tick_ns = int(tick * 1e9)
+    self.timer = timer
+
+    # tzinfo -> (from_us, until_us, offset_us, tzinfo, is_dst)
+    self._zones = {}
+    # (cls, tzinfo) -> (tick start in ns, datetime_tz)
+    self._last = {}
+
+  def _zone(self, tzinfo, epoch_us):
+    """Returns the cached transition for tzinfo in effect at epoch_us."""
+    zone = self._zones.get(tzinfo)
+    if zone is None or not zone[0] <= epoch_us < zone[1]:
+      table = transitions.zone_table(tzinfo)
+      if table is None:
+        return None
+      i = table.index(epoch_us)
+      zone = (table.utc[i], table.until(i), table.offsets[i],
+              table.tzinfos[i], table.dsts[i])
+      self._zones[tzinfo] = zone
+    return zone
+
+  def now(self, cls, tzinfo):
+    """Returns the current time.
+
+    Args:
+      cls: The datetime_tz class to create.
+      tzinfo: The tzinfo object for the result.
+
+    Returns:
+      A datetime_tz object.
+    """
+    ns = self.timer()
+
+    if self.tick_ns:
+      tick = ns - ns % self.tick_ns
+      key = (cls, tzinfo)
+      last = self._last.get(key)
+      if last is not None and last[0] == tick:
+        return last[1]
+
+    epoch_us = ns // 1000
+    zone = self._zone(tzinfo, epoch_us)
+    if zone is None:
+      obj = cls.fromtimestamp(epoch_us / 1e6, tzinfo)
+    else:
+      obj = cls._fromlocal(transitions.us_naive(epoch_us + zone[2]),
+                           zone[3], zone[4], epoch_us)
+
+    if self.tick_ns:
+      self._last[key] = (tick, obj)
+    return obj
@@ -0,0 +1,456 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""Timezones compiled into packed offset tables.
+
+A pytz zone finds the offset for a local time by trying every tzinfo the zone
+has ever used, and each localize, normalize and fromutc walks lists of
+datetime objects. compile_zone() turns a pytz zone into CompiledTzInfo objects
+which answer the same questions with a single bisect of an array of integers.
+
+Like pytz, a compiled zone has one tzinfo object for each offset it uses, all
+created up front, and supports localize() and normalize(). The tzinfo objects
+have the same attributes pytz uses internally, so they work everywhere a pytz
+zone does.
+
+The tables can be limited to a range of years. Times outside the range are
+still handled correctly, by asking the pytz zone.
+
+Example usage:
+  >>> eastern = compile_zone("US/Eastern", years=(2000, 2040))
+  >>> eastern.localize(datetime.datetime(2009, 3, 8, 12))
+  >>> datetime_tz.hot_zones_set(["US/Eastern"])  # Use it everywhere.
+"""
+
+import array
+import bisect
+import collections
+import datetime
+
+import pytz
+
+from datetime_tz import instrument
+from datetime_tz import transitions
+
+DAY_US = 24 * 60 * 60 * 1000000
+
+# The kinds of local time segment.
+_UNIQUE = 0
+_AMBIGUOUS = 1
+_GAP = 2
+_UNKNOWN = 3
+
+
+class _ZoneData(object):
+  """The tables shared by all the tzinfo objects of a compiled zone.
+
+  Attributes:
+    zone: The name of the zone.
+    years: The (first, last) years the tables cover, or None for all.
+    keys: Dictionary of pytz (utcoffset, dst, tzname) keys to variant index.
+    variants: The CompiledTzInfo objects.
+    root: The variant for the start of the zone (what pytz.timezone gives).
+    utc_lo, utc_hi: The tables cover UTC times in [utc_lo, utc_hi).
+    utc: The UTC time (microseconds) of each transition.
+    utc_variants: The variant in effect from each transition.
+    local_lo, local_hi: The tables cover local times in [local_lo, local_hi).
+    local: The local times (microseconds) where the possible variants change.
+    local_kinds: The kind of each local segment.
+    local_variants: The variant (the earlier one if there are two) for each
+                    local segment.
+    local_later: The later variant for ambiguous and gap local segments.
+  """
+
+  def __init__(self, zone, years, keys, root, tables, pytz_zone=None):
+    """Create the zone data.
+
+    Args:
+      zone: The name of the zone.
+      years: The (first, last) years the tables cover, or None for all.
+      keys: List of the pytz (utcoffset, dst, tzname) key of each variant.
+      root: Index of the root variant.
+      tables: Dictionary of the tables (utc, utc_variants, local, local_kinds,
+              local_variants, local_later) as arrays or memoryviews.
+      pytz_zone: The pytz zone (loaded on demand if not given).
+    """
+    self.zone = zone
+    self.years = years
+    self._pytz_zone = pytz_zone
+
+    self.keys = {}
+    self.variants = []
+    for key in keys:
+      self.keys[key] = len(self.variants)
+      self.variants.append(CompiledTzInfo(self, key))
+    self.root = self.variants[root]
+
+    for name in _TABLES:
+      setattr(self, name, tables[name])
+
+    if years is None:
+      self.utc_lo, self.utc_hi = transitions.MIN_US, transitions.MAX_US
+    else:
+      self.utc_lo, self.utc_hi = _year_bounds(years)
+    # Offsets are always less than a day, so local times a day inside the
+    # window only depend on transitions in the window.
+    self.local_lo = self.utc_lo + DAY_US
+    self.local_hi = self.utc_hi - DAY_US
+
+  @property
+  def pytz_zone(self):
+    """The pytz zone this data was compiled from."""
+    if self._pytz_zone is None:
+      self._pytz_zone = pytz.timezone(self.zone)
+    return self._pytz_zone
+
+  @classmethod
+  def frompytz(cls, pytz_zone, years):
+    """Compile a pytz zone."""
+    keys, root, tables = compile_tables(pytz_zone, years)
+    return cls(pytz_zone.zone, years, keys, root, tables, pytz_zone)
+
+  def variant(self, pytz_tzinfo):
+    """Returns the variant matching a (localized) pytz tzinfo."""
+    return self.variants[self.keys[(
+        pytz_tzinfo._utcoffset, pytz_tzinfo._dst, pytz_tzinfo._tzname)]]
+
+
+# The tables of a compiled zone, with their array typecodes.
+_TABLES = collections.OrderedDict([
+    ("utc", transitions.EPOCH_TYPECODE),
+    ("utc_variants", "H"),
+    ("local", transitions.EPOCH_TYPECODE),
+    ("local_kinds", "b"),
+    ("local_variants", "H"),
+    ("local_later", "H"),
+])
+
+
+def _year_bounds(years):
+  """Returns the UTC [lo, hi) microseconds covered by a range of years."""
+  lo = transitions.naive_us(datetime.datetime(years[0], 1, 1))
+  hi = transitions.naive_us(datetime.datetime(years[1] + 1, 1, 1))
+  return lo - DAY_US, hi + DAY_US
+
+
+def _classify(window, local_us):
+  """Returns (kind, index) for the local segment starting at local_us."""
+  guess = window.index(local_us)
+  candidates = range(max(guess - 1, 0), min(guess + 2, len(window.utc)))
+  valid = [i for i in candidates
+           if window.utc[i] <= local_us - window.offsets[i] < window.until(i)]
+  if len(valid) == 1:
+    return _UNIQUE, valid[0]
+  if len(valid) == 2 and valid[1] == valid[0] + 1:
+    return _AMBIGUOUS, valid[0]
+  if not valid:
+    for i in reversed(candidates):
+      if local_us - window.offsets[i] >= window.until(i):
+        if i + 1 < len(window.utc):
+          return _GAP, i
+  return _UNKNOWN, None
+
+
+def compile_tables(pytz_zone, years=None):
+  """Build the tables for a pytz zone.
+
+  Args:
+    pytz_zone: A pytz zone with transitions.
+    years: (first, last) years to build tables for, or None for all.
+
+  Returns:
+    (keys, root, tables) as needed by _ZoneData.
+  """
+  table = transitions.ZoneTable.frompytz(pytz_zone)
+
+  # One variant for each tzinfo the pytz zone uses.
+  keys = []
+  variant_ids = {}
+  for tz in table.tzinfos:
+    key = (tz._utcoffset, tz._dst, tz._tzname)
+    if key not in variant_ids:
+      variant_ids[key] = len(keys)
+      keys.append(key)
+  root = variant_ids[(table.zone._utcoffset, table.zone._dst,
+                      table.zone._tzname)]
+
+  if years is None:
+    utc_lo, utc_hi = transitions.MIN_US, transitions.MAX_US
+  else:
+    utc_lo, utc_hi = _year_bounds(years)
+  first = table.index(utc_lo)
+  last = table.index(utc_hi - 1)
+
+  utc = [utc_lo] + table.utc[first + 1:last + 1]
+  offsets = table.offsets[first:last + 1]
+  ids = [variant_ids[(tz._utcoffset, tz._dst, tz._tzname)]
+         for tz in table.tzinfos[first:last + 1]]
+
+  local_lo, local_hi = utc_lo + DAY_US, utc_hi - DAY_US
+  window = transitions.ZoneTable(
+      None, utc, offsets, [False] * len(utc), [None] * len(utc))
+
+  points = set([local_lo])
+  for i in range(1, len(utc)):
+    points.add(utc[i] + offsets[i - 1])
+    points.add(utc[i] + offsets[i])
+  points = sorted(p for p in points if local_lo <= p < local_hi)
+
+  kinds, local_ids, later_ids = [], [], []
+  for point in points:
+    kind, i = _classify(window, point)
+    kinds.append(kind)
+    local_ids.append(ids[i] if i is not None else 0)
+    later_ids.append(ids[i + 1] if kind in (_AMBIGUOUS, _GAP) else 0)
+
+  tables = {
+      "utc": utc,
+      "utc_variants": ids,
+      "local": points,
+      "local_kinds": kinds,
+      "local_variants": local_ids,
+      "local_later": later_ids,
+  }
+  for name, typecode in _TABLES.items():
+    tables[name] = array.array(typecode, tables[name])
+  return keys, root, tables
+
+
+class CompiledTzInfo(datetime.tzinfo):
+  """A compiled timezone with a fixed offset, dst and name (like pytz's).
+
+  Attributes:
+    zone: The name of the zone.
+  """
+
+  def __init__(self, data, key):
+    datetime.tzinfo.__init__(self)
+    self._data = data
+    self._utcoffset, self._dst, self._tzname = key
+    self.zone = data.zone
+
+    # pytz's internal attributes, so code written for pytz zones works.
+    self._tzinfos = _TzInfos(data)
+
+  @property
+  def _utc_transition_times(self):
+    return self._data.pytz_zone._utc_transition_times
+
+  @property
+  def _transition_info(self):
+    return self._data.pytz_zone._transition_info
+
+  @property
+  def _root(self):
+    """The tzinfo for the zone (rather than this offset)."""
+    return self._data.root
+
+  def _zone_table(self):
+    """Returns the transitions.ZoneTable for this zone."""
+    data = self._data
+    if data.years is not None:
+      return transitions.ZoneTable.frompytz(self)
+    tzinfos = [data.variants[i] for i in data.utc_variants]
+    return transitions.ZoneTable(
+        data.root, data.utc,
+        [transitions.timedelta_us(tz._utcoffset) for tz in tzinfos],
+        [bool(tz._dst) for tz in tzinfos], tzinfos)
+
+  def fromutc(self, dt):
+    """See datetime.tzinfo.fromutc."""
+    if (dt.tzinfo is not None and
+        getattr(dt.tzinfo, "_data", None) is not self._data):
+      raise ValueError("fromutc: dt.tzinfo is not self")
+    data = self._data
+    utc_us = transitions.naive_us(dt)
+    if data.utc_lo <= utc_us < data.utc_hi:
+      variant = data.variants[
+          data.utc_variants[bisect.bisect_right(data.utc, utc_us) - 1]]
+    else:
+      variant = data.variant(
+          data.pytz_zone.fromutc(dt.replace(tzinfo=None)).tzinfo)
+    return (dt + variant._utcoffset).replace(tzinfo=variant)
+
+  def normalize(self, dt):
+    """Correct the timezone information on the given datetime (see pytz)."""
+    if dt.tzinfo is None:
+      raise ValueError("Naive time - no tzinfo set")
+    return self.fromutc((dt - dt.tzinfo._utcoffset).replace(tzinfo=None))
+
+  def localize(self, dt, is_dst=False):
+    """Convert naive time to local time (see pytz).
+
+    Args:
+      dt: Naive datetime.
+      is_dst: Which time to use for ambiguous or non-existent times. None
+              raises an exception instead.
+
+    Returns:
+      dt with the correct tzinfo.
+
+    Raises:
+      ValueError: If dt isn't naive.
+      pytz.AmbiguousTimeError: If dt is ambiguous and is_dst is None.
+      pytz.NonExistentTimeError: If dt doesn't exist and is_dst is None.
+    """
+    if dt.tzinfo is not None:
+      raise ValueError("Not naive datetime (tzinfo is already set)")
+    data = self._data
+    local_us = transitions.naive_us(dt)
+    if not data.local_lo <= local_us < data.local_hi:
+      return self._localize_pytz(dt, is_dst)
+
+    i = bisect.bisect_right(data.local, local_us) - 1
+    kind = data.local_kinds[i]
+    earlier = data.variants[data.local_variants[i]]
+    if kind == _UNIQUE:
+      return dt.replace(tzinfo=earlier)
+    if kind == _UNKNOWN:
+      return self._localize_pytz(dt, is_dst)
+
+    later = data.variants[data.local_later[i]]
+    if kind == _GAP:
+      if is_dst is None:
+        raise pytz.NonExistentTimeError(dt)
+      return dt.replace(tzinfo=later if is_dst else earlier)
+
+    if is_dst is None:
+      raise pytz.AmbiguousTimeError(dt)
+    matching = [v for v in (earlier, later) if bool(v._dst) == is_dst]
+    if len(matching) == 1:
+      return dt.replace(tzinfo=matching[0])
+    return dt.replace(tzinfo=earlier if is_dst else later)
+
+  def _localize_pytz(self, dt, is_dst):
+    localized = self._data.pytz_zone.localize(dt, is_dst)
+    return localized.replace(tzinfo=self._data.variant(localized.tzinfo))
+
+  def utcoffset(self, dt, is_dst=None):
+    """See datetime.tzinfo.utcoffset."""
+    if dt is None:
+      return None
+    if dt.tzinfo is not self:
+      return self.localize(dt.replace(tzinfo=None), is_dst).tzinfo._utcoffset
+    return self._utcoffset
+
+  def dst(self, dt, is_dst=None):
+    """See datetime.tzinfo.dst."""
+    if dt is None:
+      return None
+    if dt.tzinfo is not self:
+      return self.localize(dt.replace(tzinfo=None), is_dst).tzinfo._dst
+    return self._dst
+
+  def tzname(self, dt, is_dst=None):
+    """See datetime.tzinfo.tzname."""
+    if dt is None:
+      return self.zone
+    if dt.tzinfo is not self:
+      return self.localize(dt.replace(tzinfo=None), is_dst).tzinfo._tzname
+    return self._tzname
+
+  def __reduce__(self):
+    return _unpickle, (self.zone, self._data.years,
+                       transitions.timedelta_us(self._utcoffset),
+                       transitions.timedelta_us(self._dst), self._tzname)
+
+  def __repr__(self):
+    return "<%s %r %s%s %s>" % (
+        type(self).__name__, self.zone, self._tzname, self._utcoffset,
+        self._dst and "DST" or "STD")
+
+  def __str__(self):
+    return self.zone
+
+
+class _TzInfos(object):
+  """Maps pytz's (utcoffset, dst, tzname) keys to a compiled zone's tzinfos.
+
+  pytz zones have a dictionary like this in their _tzinfos attribute.
+  """
+
+  def __init__(self, data):
+    self._data = data
+
+  def __getitem__(self, key):
+    return self._data.variants[self._data.keys[key]]
+
+  def values(self):
+    return list(self._data.variants)
+
+
+# Compiled zones, keyed by (name, years).
+_compiled = {}
+
+
+def compile_zone(name, years=None):
+  """Compile a timezone into packed offset tables.
+
+  Args:
+    name: Name of the zone (or a pytz zone object).
+    years: (first, last) years to build tables for, or None for the whole
+           history of the zone. Times outside the years are passed to pytz.
+
+  Returns:
+    The CompiledTzInfo for the zone (or the pytz zone itself if it has a
+    single offset, as there is nothing to compile).
+
+  Raises:
+    pytz.UnknownTimeZoneError: If the zone doesn't exist.
+  """
+  if not isinstance(name, datetime.tzinfo):
+    pytz_zone = pytz.timezone(name)
+  else:
+    pytz_zone = name
+  if years is not None:
+    years = tuple(years)
+  if not getattr(pytz_zone, "_utc_transition_times", None):
+    return pytz_zone
+  pytz_zone = pytz.timezone(pytz_zone.zone)
+
+  key = (pytz_zone.zone, years)
+  try:
+    compiled_zone = _compiled[key]
+  except KeyError:
+    pass
+  else:
+    instrument.cache("compiled", True)
+    return compiled_zone
+
+  instrument.cache("compiled", False)
+  data = _ZoneData.frompytz(pytz_zone, years)
+  return _compiled.setdefault(key, data.root)
+
+
+def _unpickle(zone, years, utcoffset_us, dst_us, tzname):
+  """Find the compiled tzinfo for an unpickled datetime."""
+  root = None
+  if years is None:
+    # Share the tables of the zone database if one is in use.
+    from datetime_tz import _zonedb  # pylint: disable=g-import-not-at-top
+    if _zonedb is not None:
+      root = _zonedb.zone(zone)
+  if root is None:
+    root = compile_zone(zone, years)
+  data = root._data
+  return data.variants[data.keys[(
+      datetime.timedelta(microseconds=utcoffset_us),
+      datetime.timedelta(microseconds=dst_us), tzname)]]
+_unpickle.__safe_for_unpickling__ = True
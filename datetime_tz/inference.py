@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""Learn the format of a column of timestamps and parse the rest quickly.
+
+A column of timestamps almost always shares one format, but smartparse has to
+rediscover it (via dateutil) for every value. FormatParser parses the first few
+values with smartparse, finds a strptime style format which gives exactly the
+same results and then parses the remaining values with a compiled regular
+expression for that format. Values which don't match the format still go
+through smartparse.
+
+Example usage:
+  >>> parser = FormatParser()
+  >>> values = [parser.parse(line) for line in lines]
+  >>> parser.stats()
+  {'format': '%Y-%m-%d %H:%M:%S %Z', 'samples': 20, 'fast': 99980,
+   'fallback': 0}
+"""
+
+import datetime
+import re
+
+import datetime_tz
+from datetime_tz import pytz_abbr
+
+# Format of the date (and time) part of the timestamp, most common first.
+DATE_FORMATS = (
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y-%m-%dT%H:%M",
+    "%Y-%m-%d",
+    "%Y/%m/%d %H:%M:%S.%f",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y/%m/%d %H:%M",
+    "%Y/%m/%d",
+    "%Y%m%d",
+    "%Y%m%dT%H%M%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%m/%d/%Y %H:%M",
+    "%m/%d/%Y",
+    "%a, %d %b %Y %H:%M:%S",
+    "%d %b %Y %H:%M:%S",
+    "%a %b %d %H:%M:%S %Y",
+    "%b %d %Y %H:%M:%S",
+)
+
+# Ways the timezone can follow the date part.
+ZONE_SUFFIXES = ("", "%z", " %z", " %Z", " %Z%z")
+
+# Formats which don't fit the DATE_FORMATS + ZONE_SUFFIXES pattern.
+EXTRA_FORMATS = (
+    "%a %b %d %H:%M:%S %Z %Y",
+)
+
+FORMATS = tuple(
+    [d + z for d in DATE_FORMATS for z in ZONE_SUFFIXES] +
+    list(EXTRA_FORMATS))
+
+# Names dateutil treats as UTC.
+_UTC_ABBRS = ("UTC", "GMT", "Z", "z")
+
+_MONTHS = {}
+for _i, _name in enumerate((
+    "january", "february", "march", "april", "may", "june", "july",
+    "august", "september", "october", "november", "december")):
+  _MONTHS[_name] = _i + 1
+  _MONTHS[_name[:3]] = _i + 1
+_MONTHS["sept"] = 9
+
+_DIRECTIVES = {
+    "Y": r"(?P<year>\d{4})",
+    "m": r"(?P<month>\d{1,2})",
+    "d": r"(?P<day>\d{1,2})",
+    "H": r"(?P<hour>\d{1,2})",
+    "M": r"(?P<minute>\d{2})",
+    "S": r"(?P<second>\d{2})",
+    "f": r"(?P<microsecond>\d{1,6})",
+    "b": r"(?P<monthname>[A-Za-z]{3,4})",
+    "B": r"(?P<monthname>[A-Za-z]{3,9})",
+    "a": r"[A-Za-z]{3}",
+    "A": r"[A-Za-z]{6,9}",
+    "z": r"(?P<offset>Z|[+-]\d{2}(?::?\d{2})?)",
+    "Z": r"(?P<abbr>[A-Za-z]{1,5})",
+    "%": "%",
+}
+
+
+def compile_format(fmt):
+  """Compile a strptime style format into a regular expression.
+
+  Only the directives in _DIRECTIVES are supported. %Z matches a timezone
+  abbreviation which is looked up with pytz_abbr.
+
+  Args:
+    fmt: The format string.
+
+  Returns:
+    A compiled regular expression with named groups for each field.
+
+  Raises:
+    ValueError: If the format contains an unsupported directive.
+  """
+  regex = []
+  i = 0
+  while i < len(fmt):
+    char = fmt[i]
+    if char == "%":
+      i += 1
+      directive = fmt[i:i+1]
+      if directive not in _DIRECTIVES:
+        raise ValueError("Unsupported directive %%%s in %r" % (directive, fmt))
+      regex.append(_DIRECTIVES[directive])
+    elif char == " ":
+      regex.append(r"\s+")
+    else:
+      regex.append(re.escape(char))
+    i += 1
+  return re.compile("^%s$" % "".join(regex))
+
+
+def _offset_seconds(offset):
+  """Convert a +HH:MM, +HHMM, +HH or Z offset into seconds."""
+  if offset in ("Z", "z"):
+    return 0
+  sign = -1 if offset[0] == "-" else 1
+  digits = offset[1:].replace(":", "")
+  seconds = int(digits[:2]) * 3600
+  if len(digits) > 2:
+    seconds += int(digits[2:]) * 60
+  return sign * seconds
+
+
+class CompiledFormat(object):
+  """A strptime style format compiled to a regular expression."""
+
+  def __init__(self, fmt, tzinfos=pytz_abbr.tzinfos):
+    self.format = fmt
+    self.regex = compile_format(fmt)
+    self.tzinfos = tzinfos
+    self.has_zone = "%z" in fmt or "%Z" in fmt
+
+  def _tzinfo(self, abbr, offset):
+    """Returns the tzinfo dateutil would have found for abbr and offset."""
+    # Mirror how dateutil.parser calls the tzinfos callback so the results
+    # are identical to smartparse.
+    if offset is not None:
+      offset = _offset_seconds(offset)
+    if abbr is not None:
+      if abbr in _UTC_ABBRS:
+        if offset:
+          # "UTC+3" is POSIX style, IE 3 hours *behind* UTC.
+          return self.tzinfos(None, -offset)
+        return self.tzinfos("UTC", 0)
+      if offset is not None:
+        offset = -offset
+    elif offset == 0:
+      abbr = "UTC"
+    return self.tzinfos(abbr, offset)
+
+  def match(self, toparse, tzinfo=None, cls=datetime_tz.datetime_tz):
+    """Parse a string with this format.
+
+    Args:
+      toparse: The string to parse.
+      tzinfo: Timezone for values which don't include one.
+              (Defaults to your local timezone.)
+      cls: The datetime_tz class to create.
+
+    Returns:
+      New datetime_tz object or None if the string doesn't match.
+    """
+    m = self.regex.match(toparse)
+    if m is None:
+      return None
+
+    fields = m.groupdict()
+    try:
+      if fields.get("monthname") is not None:
+        month = _MONTHS[fields["monthname"].lower()]
+      else:
+        month = int(fields["month"])
+
+      microsecond = fields.get("microsecond")
+      if microsecond is not None:
+        microsecond = int(microsecond.ljust(6, "0"))
+
+      zone = None
+      if self.has_zone:
+        zone = self._tzinfo(fields.get("abbr"), fields.get("offset"))
+
+      dt = datetime.datetime(
+          int(fields["year"]), month, int(fields["day"]),
+          int(fields.get("hour") or 0), int(fields.get("minute") or 0),
+          int(fields.get("second") or 0), microsecond or 0, zone)
+    except (KeyError, ValueError):
+      return None
+
+    return cls._fromparsed(dt, tzinfo)
+
+
+def _same(a, b):
+  """Is a exactly the same as b (including the timezone)?"""
+  return repr(a) == repr(b)
+
+
+class FormatParser(object):
+  """Parse values sharing a format, inferring the format from samples.
+
+  The first `samples` values are parsed with smartparse and used to choose a
+  format from `formats`. The rest are parsed with that format, falling back to
+  smartparse for values which don't match it.
+  """
+
+  def __init__(self, tzinfo=None, samples=20, formats=FORMATS,
+               cls=datetime_tz.datetime_tz):
+    """Create a parser.
+
+    Args:
+      tzinfo: Timezone for values which don't include one.
+              (Defaults to your local timezone.)
+      samples: Number of values to learn the format from.
+      formats: The candidate formats, in order of preference.
+      cls: The datetime_tz class to create.
+    """
+    self.tzinfo = tzinfo
+    self.cls = cls
+    self.formats = formats
+    self.samples = samples
+    self.format = None
+
+    self._samples = []
+    self._fast = 0
+    self._fallback = 0
+    self._candidates = None
+
+  def _infer(self):
+    """Choose the format which reproduces the most of the samples."""
+    if self._candidates is None:
+      self._candidates = [CompiledFormat(fmt) for fmt in self.formats]
+
+    best, best_count = None, 0
+    for candidate in self._candidates:
+      count = 0
+      for toparse, expected in self._samples:
+        try:
+          result = candidate.match(toparse, self.tzinfo, self.cls)
+        except Exception:  # pylint: disable=broad-except
+          result = None
+        if result is not None and _same(result, expected):
+          count += 1
+      if count > best_count:
+        best, best_count = candidate, count
+        if count == len(self._samples):
+          break
+
+    self.format = best
+
+  def parse(self, toparse):
+    """Parse a string.
+
+    Args:
+      toparse: The string to parse.
+
+    Returns:
+      New datetime_tz object.
+
+    Raises:
+      ValueError: If unable to make sense of the input.
+    """
+    toparse = toparse.strip()
+
+    if len(self._samples) < self.samples:
+      result = self.cls.smartparse(toparse, self.tzinfo)
+      self._samples.append((toparse, result))
+      if len(self._samples) == self.samples:
+        self._infer()
+      return result
+
+    if self.format is not None:
+      result = self.format.match(toparse, self.tzinfo, self.cls)
+      if result is not None:
+        self._fast += 1
+        return result
+
+    self._fallback += 1
+    return self.cls.smartparse(toparse, self.tzinfo)
+
+  __call__ = parse
+
+  def stats(self):
+    """Returns how values have been parsed.
+
+    Returns:
+      A dictionary with the format found (or None), the number of samples
+      parsed while learning the format, the number of values parsed with the
+      format and the number of values which had to fall back to smartparse.
+    """
+    return {
+        "format": self.format and self.format.format,
+        "samples": len(self._samples),
+        "fast": self._fast,
+        "fallback": self._fallback,
+    }
@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name
+
+"""Opt-in counters and timers for the paths taken inside datetime_tz.
+
+Collection is off by default. The instrumented code only checks whether
+collector is None, so the cost when it is off is a global lookup.
+
+The counters are:
+  new.normalize, new.localize, new.ambiguous
+      How datetime_tz objects were created (from an aware datetime, from a
+      naive one, and naive ones which needed is_dst to pick a time).
+  tzinfome.hot, tzinfome.zonedb, tzinfome.pytz, tzinfome.posix,
+  tzinfome.tzinfo
+      Where timezones were found (compiled hot zones, the zone database,
+      pytz by name, a POSIX TZ rule, or already a tzinfo object).
+  smartparse.keyword, smartparse.relative, smartparse.startend,
+  smartparse.dateutil, smartparse.abbreviation
+      The smartparse branches taken ("now"/"yesterday"/..., "... ago",
+      "start of"/"end of", parsed with dateutil, and dateutil results using
+      a timezone abbreviation).
+  cache.<name>.hit, cache.<name>.miss
+      Lookups in the zone_table, compiled, zonedb, abbr_year, posix and
+      posix_year caches.
+  detect.success.<method>, detect.failed, detect.default, detect.timeout
+      Which local timezone detection method succeeded (or if none did, if
+      the default zone was used instead, and if detection ran out of time).
+
+The timers are reported as <name>.calls and <name>.seconds:
+  detect.<method>
+      Each attempt to detect the local timezone (always timed).
+  new, smartparse
+      Creating datetime_tz objects and parsing (only with timing=True).
+
+Example usage:
+  >>> with datetime_tz.collect_stats(timing=True) as collected:
+  ...   handle_request()
+  >>> metrics.send(collected.asdict())
+"""
+
+import contextlib
+import time
+
+timer = getattr(time, "perf_counter", time.time)
+
+
+class Collector(object):
+  """Counts and times the paths taken.
+
+  Attributes:
+    timing: Time the frequent operations too (rather than just counting).
+    counters: Dictionary of counter name to count.
+    timers: Dictionary of timer name to [calls, total seconds].
+  """
+
+  def __init__(self, timing=False):
+    self.timing = timing
+    self.counters = {}
+    self.timers = {}
+
+  def count(self, name, n=1):
+    """Add n to a counter."""
+    self.counters[name] = self.counters.get(name, 0) + n
+
+  def time(self, name, seconds):
+    """Record a call to a timer which took seconds."""
+    timed = self.timers.get(name)
+    if timed is None:
+      self.timers[name] = [1, seconds]
+    else:
+      timed[0] += 1
+      timed[1] += seconds
+
+  def reset(self):
+    """Clear all the counters and timers."""
+    self.counters = {}
+    self.timers = {}
+
+  def asdict(self):
+    """Returns the counters and timers as a flat dictionary of numbers."""
+    result = dict(self.counters)
+    for name, (calls, seconds) in self.timers.items():
+      result[name + ".calls"] = calls
+      result[name + ".seconds"] = seconds
+    return result
+
+
+# The active Collector, or None when collection is off.
+collector = None
+
+
+def enable(timing=False):
+  """Start collecting into a new Collector.
+
+  Args:
+    timing: Time the frequent operations too.
+
+  Returns:
+    The Collector.
+  """
+  # pylint: disable=global-statement
+  global collector
+  collector = Collector(timing)
+  return collector
+
+
+def disable():
+  """Stop collecting."""
+  # pylint: disable=global-statement
+  global collector
+  collector = None
+
+
+@contextlib.contextmanager
+def collecting(timing=False):
+  """Collect into a new Collector while in a with block.
+
+  Any collection going on outside the block is paused inside it.
+
+  Args:
+    timing: Time the frequent operations too.
+
+  Yields:
+    The Collector.
+  """
+  # pylint: disable=global-statement
+  global collector
+  previous = collector
+  collector = current = Collector(timing)
+  try:
+    yield current
+  finally:
+    collector = previous
+
+
+def count(name, n=1):
+  """Add n to a counter, if collecting.
+
+  For code which isn't hot, hot paths should check collector themselves.
+  """
+  if collector is not None:
+    collector.count(name, n)
+
+
+def cache(name, hit):
+  """Count a cache hit or miss, if collecting."""
+  if collector is not None:
+    collector.count("cache.%s.%s" % (name, "hit" if hit else "miss"))
@@ -0,0 +1,355 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""Intervals of time and an index for finding the ones which overlap.
+
+A TimeRange is a half open [start, end) interval between two datetime_tz
+objects, which can be in different timezones. Comparisons use the integer UTC
+keys of the ends (see datetime_tz.datetime_tz.utc_us), so durations are the
+real time elapsed even across DST changes.
+
+An IntervalIndex holds many intervals sorted by start in integer arrays,
+with the largest end of each subtree of an implicit balanced tree over them
+(an augmented interval tree), so finding the intervals overlapping a query
+takes O(log n + k) rather than comparing against every interval.
+
+Example usage:
+  >>> bookings = IntervalIndex(ranges, payloads=ids)
+  >>> bookings.overlapping(TimeRange(start, end))
+  [...]
+  >>> bookings.free(TimeRange(day_start, day_end))
+  [<TimeRange ...>, ...]
+"""
+
+import array
+import datetime
+
+import pytz
+
+import datetime_tz
+from datetime_tz import transitions
+
+
+def _todatetime_tz(dt):
+  """Returns an aware datetime as a datetime_tz object."""
+  if isinstance(dt, datetime_tz.datetime_tz):
+    return dt
+  if not isinstance(dt, datetime.datetime) or dt.tzinfo is None:
+    raise TypeError("Ranges need timezone aware datetime objects!")
+  return datetime_tz.datetime_tz(dt)
+
+
+def _epoch_us(value):
+  """Returns an aware datetime or epoch microseconds as epoch microseconds."""
+  if isinstance(value, datetime.datetime):
+    return datetime_tz.sort_key(value)
+  return value
+
+
+class TimeRange(object):
+  """An immutable, half open interval of time.
+
+  Attributes:
+    start: The datetime_tz the range starts at.
+    end: The datetime_tz the range ends at (not included).
+  """
+  __slots__ = ["start", "end"]
+
+  def __init__(self, start, end):
+    """Create a range.
+
+    Args:
+      start: Timezone aware datetime the range starts at.
+      end: Timezone aware datetime the range ends before.
+
+    Raises:
+      TypeError: If start or end are naive.
+      ValueError: If end is before start.
+    """
+    self.start = _todatetime_tz(start)
+    self.end = _todatetime_tz(end)
+    if self.end.utc_us < self.start.utc_us:
+      raise ValueError("Range ends (%s) before it starts (%s)" % (
+          self.end, self.start))
+
+  @property
+  def start_us(self):
+    """The start as integer microseconds since the epoch (in UTC)."""
+    return self.start.utc_us
+
+  @property
+  def end_us(self):
+    """The end as integer microseconds since the epoch (in UTC)."""
+    return self.end.utc_us
+
+  @property
+  def duration(self):
+    """The time elapsed between start and end, as a timedelta."""
+    return datetime.timedelta(microseconds=self.end.utc_us - self.start.utc_us)
+
+  def __bool__(self):
+    return self.end.utc_us > self.start.utc_us
+  __nonzero__ = __bool__
+
+  def __contains__(self, dt):
+    """Is a datetime, epoch microseconds or all of another range inside?"""
+    if isinstance(dt, TimeRange):
+      return (self.start.utc_us <= dt.start.utc_us and
+              dt.end.utc_us <= self.end.utc_us)
+    return self.start.utc_us <= _epoch_us(dt) < self.end.utc_us
+
+  def overlaps(self, other):
+    """Does this range share any time with another range?"""
+    return (self.start.utc_us < other.end.utc_us and
+            other.start.utc_us < self.end.utc_us)
+
+  def intersection(self, other):
+    """Get the time shared with another range.
+
+    Args:
+      other: A TimeRange.
+
+    Returns:
+      A TimeRange, or None if the ranges don't overlap.
+    """
+    if not self.overlaps(other):
+      return None
+    start = max(self.start, other.start)
+    end = min(self.end, other.end)
+    return TimeRange(start, end)
+
+  def __eq__(self, other):
+    if not isinstance(other, TimeRange):
+      return NotImplemented
+    return (self.start.utc_us == other.start.utc_us and
+            self.end.utc_us == other.end.utc_us)
+
+  def __ne__(self, other):
+    result = self.__eq__(other)
+    if result is NotImplemented:
+      return result
+    return not result
+
+  def __hash__(self):
+    return hash((self.start.utc_us, self.end.utc_us))
+
+  def __repr__(self):
+    return "<%s %s to %s>" % (type(self).__name__, self.start, self.end)
+
+
+def _bounds(start, end=None):
+  """Returns a TimeRange or (start, end) as UTC microseconds."""
+  if end is None:
+    return start.start.utc_us, start.end.utc_us
+  return _epoch_us(start), _epoch_us(end)
+
+
+class IntervalIndex(object):
+  """Many TimeRanges (and payloads), indexed for overlap queries.
+
+  Adding ranges is cheap, the index is rebuilt by the next query.
+  """
+
+  def __init__(self, ranges=(), payloads=None):
+    """Create an index.
+
+    Args:
+      ranges: Iterable of TimeRange objects.
+      payloads: Iterable of the payload of each range. (Defaults to the
+                ranges themselves.)
+
+    Raises:
+      ValueError: If there are a different number of ranges and payloads.
+    """
+    ranges = list(ranges)
+    if payloads is None:
+      payloads = ranges
+    else:
+      payloads = list(payloads)
+      if len(payloads) != len(ranges):
+        raise ValueError("Got %d ranges but %d payloads." % (
+            len(ranges), len(payloads)))
+
+    # Ranges added since the index was built, as (start, end, range, payload)
+    self._pending = [(r.start.utc_us, r.end.utc_us, r, payload)
+                     for r, payload in zip(ranges, payloads)]
+    self._starts = array.array(transitions.EPOCH_TYPECODE)
+    self._ends = array.array(transitions.EPOCH_TYPECODE)
+    self._max_ends = array.array(transitions.EPOCH_TYPECODE)
+    self._ranges = []
+    self._payloads = []
+
+  def add(self, time_range, payload=None):
+    """Add a range.
+
+    Args:
+      time_range: A TimeRange.
+      payload: The payload for the range. (Defaults to the range.)
+    """
+    if payload is None:
+      payload = time_range
+    self._pending.append((time_range.start.utc_us, time_range.end.utc_us,
+                          time_range, payload))
+
+  def _build(self):
+    """Merge the pending ranges into the sorted arrays and tree."""
+    entries = list(zip(self._starts, self._ends, self._ranges, self._payloads))
+    entries.extend(self._pending)
+    entries.sort(key=lambda entry: entry[0])
+    self._pending = []
+
+    typecode = transitions.EPOCH_TYPECODE
+    self._starts = array.array(typecode, [entry[0] for entry in entries])
+    self._ends = array.array(typecode, [entry[1] for entry in entries])
+    self._ranges = [entry[2] for entry in entries]
+    self._payloads = [entry[3] for entry in entries]
+
+    # The tree node for the ranges [lo, hi) is at (lo + hi) // 2 and holds
+    # the largest end in [lo, hi).
+    ends = self._ends
+    max_ends = array.array(typecode, ends)
+
+    def build(lo, hi):
+      if lo >= hi:
+        return transitions.MIN_US
+      mid = (lo + hi) // 2
+      largest = max(ends[mid], build(lo, mid), build(mid + 1, hi))
+      max_ends[mid] = largest
+      return largest
+
+    build(0, len(ends))
+    self._max_ends = max_ends
+
+  def __len__(self):
+    return len(self._starts) + len(self._pending)
+
+  def __iter__(self):
+    """Iterate over the payloads in order of start."""
+    if self._pending:
+      self._build()
+    return iter(self._payloads)
+
+  def _overlapping(self, start_us, end_us):
+    """Returns the indexes, in order, of the ranges overlapping a range."""
+    if self._pending:
+      self._build()
+    starts, ends, max_ends = self._starts, self._ends, self._max_ends
+
+    result = []
+    # (lo, hi) subtrees to search, or (index, None) for a match, popped so
+    # the matches come out in order.
+    stack = [(0, len(starts))]
+    while stack:
+      lo, hi = stack.pop()
+      if hi is None:
+        result.append(lo)
+        continue
+      if lo >= hi:
+        continue
+      mid = (lo + hi) // 2
+      if max_ends[mid] <= start_us:
+        # Everything in this subtree ends before the query starts.
+        continue
+      if starts[mid] < end_us:
+        stack.append((mid + 1, hi))
+        if ends[mid] > start_us:
+          stack.append((mid, None))
+      stack.append((lo, mid))
+    return result
+
+  def overlapping(self, start, end=None):
+    """Get the payloads of the ranges which overlap a range.
+
+    Args:
+      start: A TimeRange, or the start as an aware datetime (or epoch
+             microseconds).
+      end: The end, if start isn't a TimeRange.
+
+    Returns:
+      List of payloads, in order of start.
+    """
+    # _overlapping builds the index, which replaces the payloads list.
+    indexes = self._overlapping(*_bounds(start, end))
+    payloads = self._payloads
+    return [payloads[i] for i in indexes]
+
+  def at(self, dt):
+    """Get the payloads of the ranges which contain a time.
+
+    Args:
+      dt: A timezone aware datetime (or epoch microseconds).
+
+    Returns:
+      List of payloads, in order of start.
+    """
+    epoch_us = _epoch_us(dt)
+    indexes = self._overlapping(epoch_us, epoch_us + 1)
+    payloads = self._payloads
+    return [payloads[i] for i in indexes]
+
+  def intersections(self, start, end=None):
+    """Get the parts of the ranges which overlap a range.
+
+    Args:
+      start: A TimeRange, or the start as an aware datetime.
+      end: The end, if start isn't a TimeRange.
+
+    Returns:
+      List of (TimeRange, payload) tuples, with the part of each range
+      overlapping the query, in order of start.
+    """
+    query = start if end is None else TimeRange(start, end)
+    start_us, end_us = _bounds(query)
+    return [(self._ranges[i].intersection(query), self._payloads[i])
+            for i in self._overlapping(start_us, end_us)]
+
+  def free(self, start, end=None):
+    """Find the gaps in a range which no range in the index covers.
+
+    Args:
+      start: A TimeRange, or the start as an aware datetime.
+      end: The end, if start isn't a TimeRange.
+
+    Returns:
+      List of TimeRange objects, in order, in the timezone of the query's
+      start.
+    """
+    query = start if end is None else TimeRange(start, end)
+    start_us, end_us = _bounds(query)
+
+    cls = type(query.start)
+    table = (transitions.zone_table(query.start.tzinfo) or
+             transitions.zone_table(pytz.utc))
+
+    gaps = []
+    cursor = start_us
+    for i in self._overlapping(start_us, end_us):
+      if self._starts[i] > cursor:
+        gaps.append((cursor, self._starts[i]))
+      cursor = max(cursor, self._ends[i])
+    if cursor < end_us:
+      gaps.append((cursor, end_us))
+
+    return [TimeRange(cls._fromepoch_us(gap_start, table),
+                      cls._fromepoch_us(gap_end, table))
+            for gap_start, gap_end in gaps]
+
+  def __repr__(self):
+    return "<%s of %d ranges>" % (type(self).__name__, len(self))
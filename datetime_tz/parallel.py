@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""Multi-process parsing of timestamps in large text and CSV files.
+
+smartparse is pure Python and CPU bound, so threads don't help. Instead the
+file is split into byte ranges which are aligned to line boundaries and each
+range is parsed in a separate process. Workers send back the compact buffers
+of a DatetimeTZArray rather than pickled datetime objects.
+
+Example usage:
+  >>> values = parse_file("access.log.csv", column=3, workers=8)
+  >>> len(values)
+  123456789
+  >>> values[0]
+  datetime_tz(2010, 7, 3, 6, 0, 1, tzinfo=<UTC>)
+"""
+
+import csv
+import io
+import os
+
+import datetime_tz
+from datetime_tz import tzarray
+
+# The default size of the chunks a file is split into.
+CHUNK_SIZE = 64 * 1024 * 1024
+
+
+def chunk_file(path, chunk_size=CHUNK_SIZE):
+  """Split a file into byte ranges which start and end on line boundaries.
+
+  Args:
+    path: The file to split.
+    chunk_size: The approximate size (in bytes) of each range.
+
+  Returns:
+    A list of (start, end) byte offsets.
+  """
+  if chunk_size < 1:
+    raise ValueError("chunk_size must be positive, not %r" % chunk_size)
+
+  size = os.path.getsize(path)
+  ranges = []
+  with open(path, "rb") as f:
+    start = 0
+    while start < size:
+      end = start + chunk_size
+      if end >= size:
+        end = size
+      else:
+        # Move the end to just after the next newline.
+        f.seek(end - 1)
+        f.readline()
+        end = f.tell()
+      ranges.append((start, end))
+      start = end
+  return ranges
+
+
+def _line_count(path, offset):
+  """Returns the number of lines in a file before a byte offset."""
+  count = 0
+  with open(path, "rb") as f:
+    while offset > 0:
+      block = f.read(min(offset, 1024 * 1024))
+      if not block:
+        break
+      count += block.count(b"\n")
+      offset -= len(block)
+  return count
+
+
+def _values(lines, column, delimiter, line_number):
+  """Yields the (line index, value) to parse from the given lines.
+
+  Args:
+    lines: The lines of a chunk, including their line endings.
+    column: Index of the CSV column to use, or None for the whole line.
+    delimiter: The CSV delimiter.
+    line_number: Function turning a line index into the line number in the
+                 file, for error messages.
+
+  Raises:
+    ValueError: If a row doesn't have the column or has a quoted field with a
+                newline in it.
+  """
+  if column is None:
+    for index, line in enumerate(lines):
+      yield index, line
+  else:
+    reader = csv.reader(lines, delimiter=delimiter)
+    index = 0
+    for row in reader:
+      # The file is split between lines, so a quoted newline could be split
+      # between chunks. An unterminated quote at the end of a chunk takes in
+      # the newline as well.
+      if reader.line_num != index + 1 or (row and row[-1].endswith("\n")):
+        raise ValueError(
+            "Line %d has a quoted field with a newline in it, which isn't "
+            "supported" % line_number(index))
+      if row:
+        try:
+          yield index, row[column]
+        except IndexError:
+          raise ValueError("Line %d has no column %d: %r" % (
+              line_number(index), column, row))
+      index = reader.line_num
+
+
+def _parse_chunk(path, start, end, column, delimiter, tzinfo, encoding,
+                 skip_first, errors):
+  """Parse a single chunk of a file (run in a worker process).
+
+  Returns:
+    The buffers of a tzarray.DatetimeTZArray, see DatetimeTZArray.tobuffers.
+  """
+  with open(path, "rb") as f:
+    f.seek(start)
+    data = f.read(end - start)
+
+  # Split on newlines only, like chunk_file, so line numbers match the file.
+  lines = io.StringIO(data.decode(encoding), newline="\n").readlines()
+  skip = 1 if skip_first else 0
+  lines = lines[skip:]
+
+  def line_number(index):
+    # Only needed for errors, so the lines before the chunk are counted then.
+    return _line_count(path, start) + skip + index + 1
+
+  result = tzarray.DatetimeTZArray()
+  for index, value in _values(lines, column, delimiter, line_number):
+    value = value.strip()
+    if not value:
+      continue
+    try:
+      result.append(datetime_tz.datetime_tz.smartparse(value, tzinfo))
+    except ValueError:
+      if errors == "skip":
+        continue
+      raise ValueError("Unable to parse %r (line %d of %s)" % (
+          value, line_number(index), path))
+
+  return result.tobuffers()
+
+
+def parse_file(path, column=None, delimiter=",", tzinfo=None, workers=None,
+               chunk_size=CHUNK_SIZE, encoding="utf-8", header=False,
+               errors="raise"):
+  """Parse the timestamps in a file using multiple processes.
+
+  Each value is parsed with datetime_tz.smartparse semantics.
+
+  Args:
+    path: The text or CSV file to parse.
+    column: (Optional) Index of the CSV column holding the timestamp. If not
+            given the whole of each line is parsed. As the file is split
+            between lines, quoted CSV fields can't contain newlines.
+    delimiter: The CSV delimiter used when column is given.
+    tzinfo: Timezone for values which don't include one. (Defaults to your
+            local timezone.)
+    workers: Number of worker processes. (Defaults to the number of CPUs.) If
+             1, the file is parsed in this process.
+    chunk_size: Approximate size (in bytes) of the piece of the file given to
+                a worker at a time.
+    encoding: The encoding of the file.
+    header: Skip the first line of the file.
+    errors: "raise" to raise a ValueError on values which can't be parsed or
+            "skip" to ignore them.
+
+  Returns:
+    A tzarray.DatetimeTZArray of the parsed values, in file order.
+
+  Raises:
+    ValueError: If a value can't be parsed and errors is "raise", or a quoted
+                CSV field contains a newline.
+  """
+  if errors not in ("raise", "skip"):
+    raise ValueError("errors must be 'raise' or 'skip', not %r" % errors)
+
+  # Resolve the timezone here so every worker uses the same one.
+  if tzinfo is None:
+    tzinfo = datetime_tz.localtz()
+  tzinfo = datetime_tz._tzinfome(tzinfo)
+
+  ranges = chunk_file(path, chunk_size)
+  args = [(path, start, end, column, delimiter, tzinfo, encoding,
+           header and i == 0, errors)
+          for i, (start, end) in enumerate(ranges)]
+
+  futures = None
+  if workers != 1 and len(args) > 1:
+    try:
+      # Imported here as it is slow to import.
+      # pylint: disable=g-import-not-at-top
+      from concurrent import futures
+    except ImportError:
+      pass
+
+  if futures is None:
+    chunks = [_parse_chunk(*a) for a in args]
+  else:
+    with futures.ProcessPoolExecutor(max_workers=workers) as pool:
+      chunks = list(pool.map(_parse_chunk, *zip(*args)))
+
+  result = tzarray.DatetimeTZArray()
+  for buffers in chunks:
+    result.extend(tzarray.DatetimeTZArray.frombuffers(*buffers))
+  return result
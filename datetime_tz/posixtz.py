@@ -0,0 +1,466 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""Timezones from POSIX TZ rule strings, without the zone database.
+
+A POSIX TZ value such as "EST5EDT,M3.2.0,M11.1.0" or
+"AEST-10AEDT,M10.1.0,M4.1.0/3" gives the standard and daylight saving names
+and offsets, and the rules for when daylight saving starts and ends each year.
+compile_rule() turns one into PosixTzInfo objects which work like a pytz zone
+(with localize() and normalize()), working out the transitions for each year
+when first needed and caching them.
+
+Note that the offsets in the rule are west of UTC, so "EST5" is UTC-5.
+
+Rules with daylight saving transitions can be used anywhere datetime_tz takes
+a zone name. Rules without them (like "EST5") need compile_rule(), so a
+mistyped zone name is still an error.
+
+Example usage:
+  >>> eastern = compile_rule("EST5EDT,M3.2.0,M11.1.0")
+  >>> eastern.localize(datetime.datetime(2009, 3, 8, 12))
+  >>> datetime_tz.datetime_tz.now("AEST-10AEDT,M10.1.0,M4.1.0/3")
+"""
+
+import bisect
+import calendar
+import datetime
+import re
+
+import pytz
+
+from datetime_tz import instrument
+from datetime_tz import transitions
+
+DAY_US = 24 * 60 * 60 * 1000000
+HOUR_US = 60 * 60 * 1000000
+
+# The years a rule is followed in. Like before the first and after the last
+# transition of a pytz zone, earlier and later times stay in the state the
+# rule gives at the start and end of these years. The transitions.ZoneTable
+# used by the fast paths (astimezone, fromtimestamp, ...) covers the same
+# years, so it always agrees with localize() and fromutc().
+TABLE_YEARS = (1900, 2199)
+
+# The rules used when a rule string has daylight saving but doesn't say when
+# (what glibc does).
+DEFAULT_RULES = ",M3.2.0,M11.1.0"
+
+_NAME = r"(?:([A-Za-z]{3,})|<([A-Za-z0-9+-]{3,})>)"
+_OFFSET = r"([+-]?\d{1,3}(?::\d{1,2}){0,2})"
+_RULE_RE = re.compile(
+    r"^" + _NAME + _OFFSET +
+    r"(?:" + _NAME + _OFFSET + r"?" +
+    r"(?:,([^,/]+)(?:/([^,]+))?,([^,/]+)(?:/([^,]+))?)?)?$")
+_DATE_RE = re.compile(
+    r"^(?:J(\d{1,3})|(\d{1,3})|M(\d{1,2})\.(\d)\.(\d))$")
+
+
+def _parse_time(value, limit):
+  """Parse [+-]hh[:mm[:ss]] into microseconds.
+
+  Args:
+    value: The string to parse.
+    limit: The largest allowed number of hours.
+
+  Returns:
+    The time as microseconds.
+
+  Raises:
+    ValueError: If the time isn't valid.
+  """
+  sign = 1
+  if value[:1] in "+-":
+    if value[0] == "-":
+      sign = -1
+    value = value[1:]
+  parts = [int(part) for part in value.split(":")]
+  if not 1 <= len(parts) <= 3 or parts[0] > limit or any(
+      part > 59 for part in parts[1:]):
+    raise ValueError("Invalid time %r in POSIX TZ rule." % value)
+  parts += [0] * (3 - len(parts))
+  return sign * ((parts[0] * 60 + parts[1]) * 60 + parts[2]) * 1000000
+
+
+class PosixRule(object):
+  """A parsed POSIX TZ rule string.
+
+  Attributes:
+    rule: The rule string.
+    std_name: The name of standard time ("EST").
+    std_offset: The offset from UTC of standard time, in microseconds (east
+                is positive, unlike in the rule string).
+    dst_name: The name of daylight saving time, or None if there isn't any.
+    dst_offset: The offset from UTC of daylight saving time, in microseconds.
+    start: The (kind, values, time) daylight saving starts at, in standard
+           time. kind is "J" (day of the year ignoring leap days), "N" (day
+           of the year from 0) or "M" (month, week, weekday), and time is in
+           microseconds after midnight.
+    end: The (kind, values, time) daylight saving ends at, in daylight
+         saving time.
+  """
+
+  def __init__(self, rule):
+    """Parse a rule string.
+
+    Args:
+      rule: A POSIX TZ rule, such as "EST5EDT,M3.2.0,M11.1.0".
+
+    Raises:
+      ValueError: If the rule isn't valid.
+    """
+    self.rule = rule
+    match = _RULE_RE.match(rule)
+    if match is None:
+      raise ValueError("Invalid POSIX TZ rule %r." % rule)
+    (std_name, std_quoted, std_offset, dst_name, dst_quoted, dst_offset,
+     start, start_time, end, end_time) = match.groups()
+
+    self.std_name = std_name or std_quoted
+    self.std_offset = -_parse_time(std_offset, 24)
+    self.dst_name = dst_name or dst_quoted
+    self.dst_offset = None
+    self.start = self.end = None
+    if self.dst_name is None:
+      return
+
+    if dst_offset is None:
+      self.dst_offset = self.std_offset + HOUR_US
+    else:
+      self.dst_offset = -_parse_time(dst_offset, 24)
+    if start is None:
+      start, _, end = DEFAULT_RULES[1:].partition(",")
+    self.start = self._parse_date(start, start_time)
+    self.end = self._parse_date(end, end_time)
+
+  @staticmethod
+  def _parse_date(date, time_of_day):
+    match = _DATE_RE.match(date)
+    if match is None:
+      raise ValueError("Invalid date %r in POSIX TZ rule." % date)
+    julian, day, month, week, weekday = match.groups()
+    if julian is not None:
+      kind, values = "J", (int(julian),)
+      valid = 1 <= values[0] <= 365
+    elif day is not None:
+      kind, values = "N", (int(day),)
+      valid = values[0] <= 365
+    else:
+      kind, values = "M", (int(month), int(week), int(weekday))
+      valid = 1 <= values[0] <= 12 and 1 <= values[1] <= 5 and values[2] <= 6
+    if not valid:
+      raise ValueError("Invalid date %r in POSIX TZ rule." % date)
+
+    if time_of_day is None:
+      time_us = 2 * HOUR_US
+    else:
+      # Times from -167 to 167 hours are allowed (RFC 8536).
+      time_us = _parse_time(time_of_day, 167)
+    return kind, values, time_us
+
+  @staticmethod
+  def _local_us(year, date):
+    """Returns a (kind, values, time) date in a year as local microseconds."""
+    kind, values, time_us = date
+    if kind == "J":
+      ordinal = datetime.date(year, 1, 1).toordinal() + values[0] - 1
+      if values[0] >= 60 and calendar.isleap(year):
+        ordinal += 1
+    elif kind == "N":
+      ordinal = datetime.date(year, 1, 1).toordinal() + values[0]
+    else:
+      month, week, weekday = values
+      first = datetime.date(year, month, 1)
+      # POSIX weekdays start on Sunday, Python's on Monday.
+      day = 1 + (weekday - first.isoweekday()) % 7 + (week - 1) * 7
+      days_in_month = calendar.monthrange(year, month)[1]
+      while day > days_in_month:
+        day -= 7
+      ordinal = first.toordinal() + day - 1
+    return (ordinal - transitions.EPOCH_ORDINAL) * DAY_US + time_us
+
+  def year_transitions(self, year):
+    """Get the daylight saving transitions of a year.
+
+    Args:
+      year: The year.
+
+    Returns:
+      List of (utc_us, is_dst) for the UTC time (in microseconds) daylight
+      saving starts (True) and ends (False) in the year, sorted.
+    """
+    if self.dst_name is None:
+      return []
+    return sorted([
+        (self._local_us(year, self.start) - self.std_offset, True),
+        (self._local_us(year, self.end) - self.dst_offset, False)])
+
+  def __repr__(self):
+    return "<%s %r>" % (type(self).__name__, self.rule)
+
+
+class _RuleData(object):
+  """The rule and transitions shared by all the tzinfo objects of a rule.
+
+  Attributes:
+    rule: The PosixRule.
+    std: The PosixTzInfo for standard time (the root).
+    dst: The PosixTzInfo for daylight saving time (or None).
+    keys: Dictionary of pytz (utcoffset, dst, tzname) keys to tzinfo.
+  """
+
+  def __init__(self, rule):
+    self.rule = rule
+    self.std = PosixTzInfo(self, (
+        datetime.timedelta(microseconds=rule.std_offset),
+        datetime.timedelta(0), rule.std_name))
+    self.dst = None
+    self.keys = {self.std._key: self.std}
+    if rule.dst_name is not None:
+      self.dst = PosixTzInfo(self, (
+          datetime.timedelta(microseconds=rule.dst_offset),
+          datetime.timedelta(microseconds=rule.dst_offset - rule.std_offset),
+          rule.dst_name))
+      self.keys[self.dst._key] = self.dst
+    # Year -> ([utc_us], [is_dst]) of the transitions of that year and the
+    # ones either side of it.
+    self._years = {}
+    # The first and last transitions in TABLE_YEARS, as (utc_us, is_dst).
+    self._first = self._last = None
+    if self.dst is not None:
+      self._first = rule.year_transitions(TABLE_YEARS[0])[0]
+      self._last = rule.year_transitions(TABLE_YEARS[1])[-1]
+
+  def _year_window(self, year):
+    """Returns the sorted transitions of year - 1 to year + 1 (cached)."""
+    try:
+      window = self._years[year]
+    except KeyError:
+      pass
+    else:
+      if instrument.collector is not None:
+        instrument.cache("posix_year", True)
+      return window
+
+    instrument.cache("posix_year", False)
+    found = []
+    for near in range(max(year - 1, datetime.MINYEAR),
+                      min(year + 1, datetime.MAXYEAR) + 1):
+      found.extend(self.rule.year_transitions(near))
+    found.sort()
+    window = ([utc_us for utc_us, _ in found], [dst for _, dst in found])
+    return self._years.setdefault(year, window)
+
+  def is_dst(self, utc_us):
+    """Is daylight saving in effect at a UTC time (in microseconds)?"""
+    if self.dst is None:
+      return False
+    if utc_us < self._first[0]:
+      return not self._first[1]
+    if utc_us >= self._last[0]:
+      return self._last[1]
+    year = datetime.date.fromordinal(
+        utc_us // DAY_US + transitions.EPOCH_ORDINAL).year
+    utc, dsts = self._year_window(year)
+    i = bisect.bisect_right(utc, utc_us) - 1
+    if i < 0:
+      return not dsts[0]
+    return dsts[i]
+
+  def zone_table(self):
+    """Build the transitions.ZoneTable for TABLE_YEARS."""
+    if self.dst is None:
+      return transitions.ZoneTable(
+          self.std, [transitions.MIN_US], [self.rule.std_offset], [False],
+          [self.std])
+
+    found = []
+    for year in range(TABLE_YEARS[0], TABLE_YEARS[1] + 1):
+      found.extend(self.rule.year_transitions(year))
+    found.sort()
+    # Each year starts and ends in the same state, so the first transition
+    # says what was in effect before it.
+    utc = [transitions.MIN_US]
+    tzinfos = [self.std if found[0][1] else self.dst]
+    for utc_us, dst in found:
+      utc.append(utc_us)
+      tzinfos.append(self.dst if dst else self.std)
+    return transitions.ZoneTable(
+        self.std, utc,
+        [transitions.timedelta_us(tz._utcoffset) for tz in tzinfos],
+        [bool(tz._dst) for tz in tzinfos], tzinfos)
+
+
+class PosixTzInfo(datetime.tzinfo):
+  """A POSIX TZ rule timezone with a fixed offset, dst and name (like pytz's).
+
+  Attributes:
+    zone: The rule string.
+  """
+
+  def __init__(self, data, key):
+    datetime.tzinfo.__init__(self)
+    self._data = data
+    self._key = key
+    self._utcoffset, self._dst, self._tzname = key
+    self.zone = data.rule.rule
+
+  @property
+  def _tzinfos(self):
+    return self._data.keys
+
+  @property
+  def _root(self):
+    """The tzinfo for the zone (rather than this offset)."""
+    return self._data.std
+
+  def _zone_table(self):
+    """Returns the transitions.ZoneTable for this zone."""
+    return self._data.zone_table()
+
+  def fromutc(self, dt):
+    """See datetime.tzinfo.fromutc."""
+    if (dt.tzinfo is not None and
+        getattr(dt.tzinfo, "_data", None) is not self._data):
+      raise ValueError("fromutc: dt.tzinfo is not self")
+    data = self._data
+    if data.is_dst(transitions.naive_us(dt)):
+      variant = data.dst
+    else:
+      variant = data.std
+    return (dt + variant._utcoffset).replace(tzinfo=variant)
+
+  def normalize(self, dt):
+    """Correct the timezone information on the given datetime (see pytz)."""
+    if dt.tzinfo is None:
+      raise ValueError("Naive time - no tzinfo set")
+    return self.fromutc((dt - dt.tzinfo._utcoffset).replace(tzinfo=None))
+
+  def localize(self, dt, is_dst=False):
+    """Convert naive time to local time (see pytz).
+
+    Args:
+      dt: Naive datetime.
+      is_dst: Which time to use for ambiguous or non-existent times. None
+              raises an exception instead.
+
+    Returns:
+      dt with the correct tzinfo.
+
+    Raises:
+      ValueError: If dt isn't naive.
+      pytz.AmbiguousTimeError: If dt is ambiguous and is_dst is None.
+      pytz.NonExistentTimeError: If dt doesn't exist and is_dst is None.
+    """
+    if dt.tzinfo is not None:
+      raise ValueError("Not naive datetime (tzinfo is already set)")
+    data = self._data
+    if data.dst is None:
+      return dt.replace(tzinfo=data.std)
+
+    local_us = transitions.naive_us(dt)
+    std_valid = not data.is_dst(local_us - data.rule.std_offset)
+    dst_valid = data.is_dst(local_us - data.rule.dst_offset)
+    if std_valid != dst_valid:
+      return dt.replace(tzinfo=data.std if std_valid else data.dst)
+
+    if is_dst is None:
+      if std_valid:
+        raise pytz.AmbiguousTimeError(dt)
+      raise pytz.NonExistentTimeError(dt)
+    return dt.replace(tzinfo=data.dst if is_dst else data.std)
+
+  def utcoffset(self, dt, is_dst=None):
+    """See datetime.tzinfo.utcoffset."""
+    if dt is None:
+      if self._data.dst is None:
+        return self._utcoffset
+      return None
+    if dt.tzinfo is not self:
+      return self.localize(dt.replace(tzinfo=None), is_dst).tzinfo._utcoffset
+    return self._utcoffset
+
+  def dst(self, dt, is_dst=None):
+    """See datetime.tzinfo.dst."""
+    if dt is None:
+      if self._data.dst is None:
+        return self._dst
+      return None
+    if dt.tzinfo is not self:
+      return self.localize(dt.replace(tzinfo=None), is_dst).tzinfo._dst
+    return self._dst
+
+  def tzname(self, dt, is_dst=None):
+    """See datetime.tzinfo.tzname."""
+    if dt is None:
+      return self.zone
+    if dt.tzinfo is not self:
+      return self.localize(dt.replace(tzinfo=None), is_dst).tzinfo._tzname
+    return self._tzname
+
+  def __reduce__(self):
+    return _unpickle, (self.zone, transitions.timedelta_us(self._utcoffset),
+                       transitions.timedelta_us(self._dst), self._tzname)
+
+  def __repr__(self):
+    return "<%s %r %s%s %s>" % (
+        type(self).__name__, self.zone, self._tzname, self._utcoffset,
+        self._dst and "DST" or "STD")
+
+  def __str__(self):
+    return self.zone
+
+
+# Compiled rules, keyed by the rule string.
+_compiled = {}
+
+
+def compile_rule(rule):
+  """Compile a POSIX TZ rule string into a timezone.
+
+  Args:
+    rule: A POSIX TZ rule, such as "EST5EDT,M3.2.0,M11.1.0".
+
+  Returns:
+    The PosixTzInfo for standard time in the zone (the equivalent of what
+    pytz.timezone gives).
+
+  Raises:
+    ValueError: If the rule isn't valid.
+  """
+  try:
+    compiled_rule = _compiled[rule]
+  except KeyError:
+    pass
+  else:
+    instrument.cache("posix", True)
+    return compiled_rule
+
+  instrument.cache("posix", False)
+  data = _RuleData(PosixRule(rule))
+  return _compiled.setdefault(rule, data.std)
+
+
+def _unpickle(rule, utcoffset_us, dst_us, tzname):
+  """Find the tzinfo for an unpickled datetime."""
+  return compile_rule(rule)._data.keys[(
+      datetime.timedelta(microseconds=utcoffset_us),
+      datetime.timedelta(microseconds=dst_us), tzname)]
+_unpickle.__safe_for_unpickling__ = True
@@ -43,10 +43,22 @@ each year it is needed to determine which time you are actually talking about.
     2002-10-27 01:20:00 EST != 2002-10-27 01:20:00 EDT
 """
 
+import bisect
 import datetime
+import time
+
 import pytz
 import pytz.tzfile
 
+from datetime_tz import instrument
+
+try:
+  # pylint: disable=g-import-not-at-top
+  from collections.abc import MutableMapping
+except ImportError:
+  # pylint: disable=g-import-not-at-top
+  from collections import MutableMapping
+
 try:
   basestring
 except NameError:
@@ -54,6 +66,17 @@ except NameError:
   basestring = str
 
 
+def _seconds(td):
+  """Returns a timedelta as an integer number of seconds."""
+  return td.days * 86400 + td.seconds
+
+
+def _local_key(dt):
+  """Returns an integer which orders (naive) local times."""
+  return ((dt.toordinal() * 86400 + dt.hour * 3600 + dt.minute * 60 +
+           dt.second) * 1000000 + dt.microsecond)
+
+
 class tzabbr(datetime.tzinfo):
   """A timezone abbreviation.
 
@@ -76,20 +99,104 @@ class tzabbr(datetime.tzinfo):
     self.zone = zone
     self.is_dst = dst
 
+    # Year -> ([local time keys], [(tzname, utcoffset, dst)]), see _year_table
+    self._years = {}
+    self._offsets = None
+
+  @property
+  def offsets(self):
+    """The offsets from UTC (in seconds) this abbreviation is used for."""
+    if self._offsets is None:
+      infos = getattr(self.zone, "_transition_info", None)
+      if infos is None:
+        offsets = [self.zone.utcoffset(None)]
+      else:
+        # Prefer the periods where the zone actually used this abbreviation,
+        # otherwise fall back to the ones with the same DST setting.
+        named = [i for i in infos if i[2] == self.abbr]
+        if not named:
+          named = [i for i in infos if bool(i[1]) == self.is_dst] or infos
+        offsets = [i[0] for i in named]
+      self._offsets = frozenset(_seconds(o) for o in offsets)
+    return self._offsets
+
   def _get_localized(self, dt):
     # To make this a fully-functioning pass-through to the underlying pytz
     # zone, we would want to use `fold` to set `is_dst`, but since this is
     # only a temporary proxy for the zone, we will fix the DST status
     return self.zone.localize(dt.replace(tzinfo=None), is_dst=self.is_dst)
 
+  def _year_table(self, year):
+    """Get the table of (tzname, utcoffset, dst) values for a year.
+
+    dateutil probes the tzinfo several times for every string it parses, so
+    rather than localizing each time we work out where in the year the result
+    of localizing can change (the local times either side of each transition)
+    and localize once for each of those segments.
+
+    Args:
+      year: The year to get the table for.
+
+    Returns:
+      ([local time keys], [(tzname, utcoffset, dst)]), where the values apply
+      from the matching key until the next one.
+    """
+    try:
+      table = self._years[year]
+    except KeyError:
+      pass
+    else:
+      if instrument.collector is not None:
+        instrument.cache("abbr_year", True)
+      return table
+
+    instrument.cache("abbr_year", False)
+
+    start = datetime.datetime(year, 1, 1)
+    if year < datetime.MAXYEAR:
+      end = datetime.datetime(year + 1, 1, 1)
+    else:
+      end = datetime.datetime.max
+
+    points = set([start])
+    transitions = getattr(self.zone, "_utc_transition_times", None)
+    if transitions:
+      infos = self.zone._transition_info
+      margin = datetime.timedelta(days=2)
+      lo = bisect.bisect_right(transitions, max(start, datetime.datetime.min +
+                                                margin) - margin)
+      hi = bisect.bisect_right(transitions, min(end, datetime.datetime.max -
+                                                margin) + margin)
+      for i in range(max(lo, 1), hi):
+        for offset in (infos[i - 1][0], infos[i][0]):
+          point = transitions[i] + offset
+          if start < point < end:
+            points.add(point)
+
+    keys = []
+    values = []
+    for point in sorted(points):
+      localized = self._get_localized(point)
+      keys.append(_local_key(point))
+      values.append(
+          (localized.tzname(), localized.utcoffset(), localized.dst()))
+
+    table = (keys, values)
+    self._years[year] = table
+    return table
+
+  def _lookup(self, dt):
+    keys, values = self._year_table(dt.year)
+    return values[bisect.bisect_right(keys, _local_key(dt)) - 1]
+
   def tzname(self, dt):
-    return self._get_localized(dt).tzname()
+    return self._lookup(dt)[0]
 
   def utcoffset(self, dt):
-    return self._get_localized(dt).utcoffset() # pragma: no cover
+    return self._lookup(dt)[1]
 
   def dst(self, dt):
-    return self._get_localized(dt).dst() # pragma: no cover
+    return self._lookup(dt)[2]
 
 
 # A "marker" tzinfo object which is used to signify an unknown timezone.
@@ -106,7 +213,107 @@ class _UnknownZone(datetime.tzinfo):
 unknown = _UnknownZone()
 
 
-regions = {"all": {}, "military": {}}
+# The tzabbr object for each registered (abbr, name, region, zone, dst), so the
+# same object is found in every region dictionary it appears in.
+_tzabbrs = {}
+
+
+def _tzabbr_get(spec):
+  if isinstance(spec, tzabbr):
+    return spec
+  try:
+    return _tzabbrs[spec]
+  except KeyError:
+    return _tzabbrs.setdefault(spec, tzabbr(*spec))
+
+
+class _lazy_region(MutableMapping):
+  """A dictionary of abbreviation -> tzabbr for a region.
+
+  Registering an abbreviation only records its details, the tzabbr object (and
+  the pytz zone it uses) is created the first time it is looked up.
+  """
+
+  def __init__(self, specs=None):
+    self._specs = dict(specs or {})
+    self._abbrs = {}
+
+  def __getitem__(self, abbr):
+    try:
+      return self._abbrs[abbr]
+    except KeyError:
+      value = self._abbrs[abbr] = _tzabbr_get(self._specs[abbr])
+      return value
+
+  def __setitem__(self, abbr, value):
+    self._specs[abbr] = value
+    self._abbrs.pop(abbr, None)
+
+  def __delitem__(self, abbr):
+    del self._specs[abbr]
+    self._abbrs.pop(abbr, None)
+
+  def __contains__(self, abbr):
+    return abbr in self._specs
+
+  def __iter__(self):
+    return iter(self._specs)
+
+  def __len__(self):
+    return len(self._specs)
+
+  def __repr__(self):
+    return "<%s of %s>" % (type(self).__name__, sorted(self._specs))
+
+
+class _lazy_regions(MutableMapping):
+  """A dictionary of region name -> _lazy_region.
+
+  The dictionary for a region is only created the first time it is looked up.
+  """
+
+  def __init__(self, names=()):
+    self._specs = dict((name, {}) for name in names)
+    self._regions = {}
+
+  def _register(self, region, spec):
+    abbr = spec[0]
+    specs = self._specs.setdefault(region, {})
+    assert abbr not in specs
+    specs[abbr] = spec
+    if region in self._regions:
+      self._regions[region][abbr] = spec
+
+  def _contains(self, region, abbr):
+    return abbr in self._specs.get(region, ())
+
+  def __getitem__(self, region):
+    try:
+      return self._regions[region]
+    except KeyError:
+      value = self._regions[region] = _lazy_region(self._specs[region])
+      return value
+
+  def __setitem__(self, region, value):
+    self._specs[region] = {}
+    self._regions[region] = _lazy_region()
+    self._regions[region].update(value)
+
+  def __delitem__(self, region):
+    del self._specs[region]
+    self._regions.pop(region, None)
+
+  def __contains__(self, region):
+    return region in self._specs
+
+  def __iter__(self):
+    return iter(self._specs)
+
+  def __len__(self):
+    return len(self._specs)
+
+
+regions = _lazy_regions(["all", "military"])
 # Create a special alias for the all and military regions
 all = regions["all"]
 military = regions["military"]
@@ -117,37 +324,129 @@ def tzabbr_register(abbr, name, region, zone, dst):
 
   If another abbreviation with the same name has already been registered it new
   abbreviation will only be registered in region specific dictionary.
+
+  The tzabbr object (and the pytz zone) is only created when the abbreviation
+  is first looked up.
   """
-  newabbr = tzabbr(abbr, name, region, zone, dst)
+  # pylint: disable=protected-access
+  spec = (abbr, name, region, zone, dst)
+
+  if not regions._contains("all", abbr):
+    regions._register("all", spec)
+
+  regions._register(region, spec)
+
+  # Existing tzinfos callbacks hold on to the indexes, so reset them in place.
+  for index_region in ("all", region):
+    index = _indexes.get(index_region)
+    if index is not None:
+      index._by_offset = None
+
 
-  if abbr not in all:
-    all[abbr] = newabbr
+# Shared FixedOffset instances keyed by offset in seconds, prefilled with every
+# quarter hour offset in use.
+_fixed_offsets = {0: pytz.utc}
+for _minutes in range(-12 * 60, 14 * 60 + 1, 15):
+  if _minutes:
+    _fixed_offsets[_minutes * 60] = pytz.FixedOffset(_minutes)
 
-  if not region in regions:
-    regions[region] = {}
 
-  assert abbr not in regions[region]
-  regions[region][abbr] = newabbr
+def fixed_offset(offset):
+  """Returns a shared tzinfo object for an offset from UTC in seconds."""
+  try:
+    return _fixed_offsets[offset]
+  except KeyError:
+    return _fixed_offsets.setdefault(offset, pytz.FixedOffset(offset // 60))
 
 
-def tzinfos_create(use_region):
-  abbrs = regions[use_region]
+class tzabbr_index(object):
+  """Lookup tables for the abbreviations in a region.
+
+  Attributes:
+    abbrs: Dictionary of abbreviation to tzabbr object.
+    by_offset: Dictionary of offset from UTC (in seconds) to the set of
+               abbreviations used for that offset. Built on first use.
+  """
+
+  def __init__(self, abbrs):
+    self.abbrs = abbrs
+    self._by_offset = None
+
+  @property
+  def by_offset(self):
+    if self._by_offset is None:
+      by_offset = {}
+      for abbr, record in self.abbrs.items():
+        for offset in record.offsets:
+          by_offset.setdefault(offset, set()).add(abbr)
+      self._by_offset = by_offset
+    return self._by_offset
+
+
+_indexes = {}
+
+
+def region_index(region):
+  """Get the (cached) tzabbr_index for a region."""
+  try:
+    return _indexes[region]
+  except KeyError:
+    return _indexes.setdefault(region, tzabbr_index(regions[region]))
+
+
+def warm(year=None, region="all"):
+  """Do the work parsing abbreviations normally does lazily on first use.
+
+  Creates every abbreviation in the region (and its pytz zone), the region's
+  offset index and each abbreviation's table for the year.
+
+  Args:
+    year: The year to build the tables for. (Defaults to the current year.)
+    region: The region to warm.
+  """
+  if year is None:
+    year = time.gmtime().tm_year
+  abbrs = regions[region]
+  for abbr in abbrs:
+    abbrs[abbr]._year_table(year)
+  len(region_index(region).by_offset)
+
+
+def tzinfos_create(use_region, strict=False):
+  """Create a tzinfos callback for dateutil.parser.parse.
+
+  When both an abbreviation and an offset are found, the offset is checked
+  against the offsets the abbreviation is used for. dateutil always passes the
+  offset in seconds east of UTC, having already flipped the sign of offsets
+  directly after an abbreviation, which it treats as POSIX style ("EST+5" is
+  5 hours *behind* UTC).
+
+  Args:
+    use_region: The region to look abbreviations up in.
+    strict: If True, raise a ValueError when the offset doesn't match the
+            abbreviation, otherwise the abbreviation is used regardless.
+
+  Returns:
+    A function taking (abbr, offset) and returning a datetime.tzinfo.
+  """
+  index = region_index(use_region)
+  abbrs = index.abbrs
 
   def tzinfos(abbr, offset):
     if abbr:
       if abbr in abbrs:
         result = abbrs[abbr]
-        if offset:
-          # FIXME: Check the offset matches the abbreviation we just selected.
-          pass
+        if (strict and offset is not None and
+            offset not in result.offsets):
+          raise ValueError(
+              "Offset %s doesn't match timezone %s (that offset is used by "
+              "%s)" % (offset, abbr, sorted(index.by_offset.get(offset, ()))))
         return result
       else:
         raise ValueError("Unknown timezone found %s" % abbr)
-    if offset == 0:
-      return pytz.utc
-    if offset:
-      return pytz.FixedOffset(offset/60)
-    return unknown
+    if offset is None:
+      return unknown
+    return fixed_offset(offset)
 
   return tzinfos
 
@@ -156,126 +455,131 @@ def tzinfos_create(use_region):
 tzinfos = tzinfos_create("all")
 
 
-# Create the abbreviations.
+# The abbreviations, as (abbr, name, region, zone, dst).
 # *WARNING*: Order matters!
-tzabbr_register("A", u"Alpha Time Zone", u"Military", "Etc/GMT-1", False)
-tzabbr_register("ACDT", u"Australian Central Daylight Time", u"Australia",
-                "Australia/Adelaide", True)
-tzabbr_register("ACST", u"Australian Central Standard Time", u"Australia",
-                "Australia/Adelaide", False)
-tzabbr_register("ADT", u"Atlantic Daylight Time", u"North America",
-                "America/Halifax", True)
-tzabbr_register("AEDT", u"Australian Eastern Daylight Time", u"Australia",
-                "Australia/Sydney", True)
-tzabbr_register("AEST", u"Australian Eastern Standard Time", u"Australia",
-                "Australia/Sydney", False)
-tzabbr_register("AKDT", u"Alaska Daylight Time", u"North America",
-                "US/Alaska", True)
-tzabbr_register("AKST", u"Alaska Standard Time", u"North America",
-                "US/Alaska", False)
-tzabbr_register("AST", u"Atlantic Standard Time", u"North America",
-                "America/Halifax", False)
-tzabbr_register("AWDT", u"Australian Western Daylight Time", u"Australia",
-                "Australia/West", True)
-tzabbr_register("AWST", u"Australian Western Standard Time", u"Australia",
-                "Australia/West", False)
-tzabbr_register("B", u"Bravo Time Zone", u"Military", "Etc/GMT-2", False)
-tzabbr_register("BST", u"British Summer Time", u"Europe", "Europe/London", True)
-tzabbr_register("C", u"Charlie Time Zone", u"Military", "Etc/GMT-2", False)
-tzabbr_register("CDT", u"Central Daylight Time", u"North America",
-                "US/Central", True)
-tzabbr_register("CEDT", u"Central European Daylight Time", u"Europe",
-                "Etc/GMT+2", True)
-tzabbr_register("CEST", u"Central European Summer Time", u"Europe",
-                "Etc/GMT+2", True)
-tzabbr_register("CET", u"Central European Time", u"Europe", "Etc/GMT+1", False)
-tzabbr_register("CST", u"Central Standard Time", u"North America",
-                "US/Central", False)
-tzabbr_register("CXT", u"Christmas Island Time", u"Australia",
-                "Indian/Christmas", False)
-tzabbr_register("D", u"Delta Time Zone", u"Military", "Etc/GMT-2", False)
-tzabbr_register("E", u"Echo Time Zone", u"Military", "Etc/GMT-2", False)
-tzabbr_register("EDT", u"Eastern Daylight Time", u"North America",
-                "US/Eastern", True)
-tzabbr_register("EEDT", u"Eastern European Daylight Time", u"Europe",
-                "Etc/GMT+3", True)
-tzabbr_register("EEST", u"Eastern European Summer Time", u"Europe",
-                "Etc/GMT+3", True)
-tzabbr_register("EET", u"Eastern European Time", u"Europe", "Etc/GMT+2", False)
-tzabbr_register("EST", u"Eastern Standard Time", u"North America",
-                "US/Eastern", False)
-tzabbr_register("F", u"Foxtrot Time Zone", u"Military", "Etc/GMT-6", False)
-tzabbr_register("G", u"Golf Time Zone", u"Military", "Etc/GMT-7", False)
-tzabbr_register("GMT", u"Greenwich Mean Time", u"Europe", pytz.utc, False)
-tzabbr_register("H", u"Hotel Time Zone", u"Military", "Etc/GMT-8", False)
-#tzabbr_register("HAA", u"Heure Avancée de l'Atlantique", u"North America", u"UTC - 3 hours")
-#tzabbr_register("HAC", u"Heure Avancée du Centre", u"North America", u"UTC - 5 hours")
-tzabbr_register("HADT", u"Hawaii-Aleutian Daylight Time", u"North America",
-                "Pacific/Honolulu", True)
-#tzabbr_register("HAE", u"Heure Avancée de l'Est", u"North America", u"UTC - 4 hours")
-#tzabbr_register("HAP", u"Heure Avancée du Pacifique", u"North America", u"UTC - 7 hours")
-#tzabbr_register("HAR", u"Heure Avancée des Rocheuses", u"North America", u"UTC - 6 hours")
-tzabbr_register("HAST", u"Hawaii-Aleutian Standard Time", u"North America",
-                "Pacific/Honolulu", False)
-#tzabbr_register("HAT", u"Heure Avancée de Terre-Neuve", u"North America", u"UTC - 2:30 hours")
-#tzabbr_register("HAY", u"Heure Avancée du Yukon", u"North America", u"UTC - 8 hours")
-tzabbr_register("HDT", u"Hawaii Daylight Time", u"North America",
-                "Pacific/Honolulu", True)
-#tzabbr_register("HNA", u"Heure Normale de l'Atlantique", u"North America", u"UTC - 4 hours")
-#tzabbr_register("HNC", u"Heure Normale du Centre", u"North America", u"UTC - 6 hours")
-#tzabbr_register("HNE", u"Heure Normale de l'Est", u"North America", u"UTC - 5 hours")
-#tzabbr_register("HNP", u"Heure Normale du Pacifique", u"North America", u"UTC - 8 hours")
-#tzabbr_register("HNR", u"Heure Normale des Rocheuses", u"North America", u"UTC - 7 hours")
-#tzabbr_register("HNT", u"Heure Normale de Terre-Neuve", u"North America", u"UTC - 3:30 hours")
-#tzabbr_register("HNY", u"Heure Normale du Yukon", u"North America", u"UTC - 9 hours")
-tzabbr_register("HST", u"Hawaii Standard Time", u"North America",
-                "Pacific/Honolulu", False)
-tzabbr_register("I", u"India Time Zone", u"Military", "Etc/GMT-9", False)
-tzabbr_register("IST", u"Irish Summer Time", u"Europe", "Europe/Dublin", True)
-tzabbr_register("K", u"Kilo Time Zone", u"Military", "Etc/GMT-10", False)
-tzabbr_register("L", u"Lima Time Zone", u"Military", "Etc/GMT-11", False)
-tzabbr_register("M", u"Mike Time Zone", u"Military", "Etc/GMT-12", False)
-tzabbr_register("MDT", u"Mountain Daylight Time", u"North America",
-                "US/Mountain", True)
-#tzabbr_register("MESZ", u"Mitteleuroäische Sommerzeit", u"Europe", u"UTC + 2 hours")
-#tzabbr_register("MEZ", u"Mitteleuropäische Zeit", u"Europe", u"UTC + 1 hour")
-tzabbr_register("MSD", u"Moscow Daylight Time", u"Europe",
-                "Europe/Moscow", True)
-tzabbr_register("MSK", u"Moscow Standard Time", u"Europe",
-                "Europe/Moscow", False)
-tzabbr_register("MST", u"Mountain Standard Time", u"North America",
-                "US/Mountain", False)
-tzabbr_register("N", u"November Time Zone", u"Military", "Etc/GMT+1", False)
-tzabbr_register("NDT", u"Newfoundland Daylight Time", u"North America",
-                "America/St_Johns", True)
-tzabbr_register("NFT", u"Norfolk (Island) Time", u"Australia",
-                "Pacific/Norfolk", False)
-tzabbr_register("NST", u"Newfoundland Standard Time", u"North America",
-                "America/St_Johns", False)
-tzabbr_register("O", u"Oscar Time Zone", u"Military", "Etc/GMT+2", False)
-tzabbr_register("P", u"Papa Time Zone", u"Military", "Etc/GMT+3", False)
-tzabbr_register("PDT", u"Pacific Daylight Time", u"North America",
-                "US/Pacific", True)
-tzabbr_register("PST", u"Pacific Standard Time", u"North America",
-                "US/Pacific", False)
-tzabbr_register("Q", u"Quebec Time Zone", u"Military", "Etc/GMT+4", False)
-tzabbr_register("R", u"Romeo Time Zone", u"Military", "Etc/GMT+5", False)
-tzabbr_register("S", u"Sierra Time Zone", u"Military", "Etc/GMT+6", False)
-tzabbr_register("T", u"Tango Time Zone", u"Military", "Etc/GMT+7", False)
-tzabbr_register("U", u"Uniform Time Zone", u"Military", "Etc/GMT+8", False)
-tzabbr_register("UTC", u"Coordinated Universal Time", u"Europe",
-                pytz.utc, False)
-tzabbr_register("V", u"Victor Time Zone", u"Military", "Etc/GMT+9", False)
-tzabbr_register("W", u"Whiskey Time Zone", u"Military", "Etc/GMT+10", False)
-tzabbr_register("WDT", u"Western Daylight Time", u"Australia",
-                "Australia/West", True)
-tzabbr_register("WEDT", u"Western European Daylight Time", u"Europe",
-                "Etc/GMT+1", True)
-tzabbr_register("WEST", u"Western European Summer Time", u"Europe",
-                "Etc/GMT+1", True)
-tzabbr_register("WET", u"Western European Time", u"Europe", pytz.utc, False)
-tzabbr_register("WST", u"Western Standard Time", u"Australia",
-                "Australia/West", False)
-tzabbr_register("X", u"X-ray Time Zone", u"Military", "Etc/GMT+11", False)
-tzabbr_register("Y", u"Yankee Time Zone", u"Military", "Etc/GMT+12", False)
-tzabbr_register("Z", u"Zulu Time Zone", u"Military", pytz.utc, False)
+_REGISTRY = (
+    ("A", u"Alpha Time Zone", u"Military", "Etc/GMT-1", False),
+    ("ACDT", u"Australian Central Daylight Time", u"Australia",
+     "Australia/Adelaide", True),
+    ("ACST", u"Australian Central Standard Time", u"Australia",
+     "Australia/Adelaide", False),
+    ("ADT", u"Atlantic Daylight Time", u"North America",
+     "America/Halifax", True),
+    ("AEDT", u"Australian Eastern Daylight Time", u"Australia",
+     "Australia/Sydney", True),
+    ("AEST", u"Australian Eastern Standard Time", u"Australia",
+     "Australia/Sydney", False),
+    ("AKDT", u"Alaska Daylight Time", u"North America",
+     "US/Alaska", True),
+    ("AKST", u"Alaska Standard Time", u"North America",
+     "US/Alaska", False),
+    ("AST", u"Atlantic Standard Time", u"North America",
+     "America/Halifax", False),
+    ("AWDT", u"Australian Western Daylight Time", u"Australia",
+     "Australia/West", True),
+    ("AWST", u"Australian Western Standard Time", u"Australia",
+     "Australia/West", False),
+    ("B", u"Bravo Time Zone", u"Military", "Etc/GMT-2", False),
+    ("BST", u"British Summer Time", u"Europe", "Europe/London", True),
+    ("C", u"Charlie Time Zone", u"Military", "Etc/GMT-2", False),
+    ("CDT", u"Central Daylight Time", u"North America",
+     "US/Central", True),
+    ("CEDT", u"Central European Daylight Time", u"Europe",
+     "Etc/GMT+2", True),
+    ("CEST", u"Central European Summer Time", u"Europe",
+     "Etc/GMT+2", True),
+    ("CET", u"Central European Time", u"Europe", "Etc/GMT+1", False),
+    ("CST", u"Central Standard Time", u"North America",
+     "US/Central", False),
+    ("CXT", u"Christmas Island Time", u"Australia",
+     "Indian/Christmas", False),
+    ("D", u"Delta Time Zone", u"Military", "Etc/GMT-2", False),
+    ("E", u"Echo Time Zone", u"Military", "Etc/GMT-2", False),
+    ("EDT", u"Eastern Daylight Time", u"North America",
+     "US/Eastern", True),
+    ("EEDT", u"Eastern European Daylight Time", u"Europe",
+     "Etc/GMT+3", True),
+    ("EEST", u"Eastern European Summer Time", u"Europe",
+     "Etc/GMT+3", True),
+    ("EET", u"Eastern European Time", u"Europe", "Etc/GMT+2", False),
+    ("EST", u"Eastern Standard Time", u"North America",
+     "US/Eastern", False),
+    ("F", u"Foxtrot Time Zone", u"Military", "Etc/GMT-6", False),
+    ("G", u"Golf Time Zone", u"Military", "Etc/GMT-7", False),
+    ("GMT", u"Greenwich Mean Time", u"Europe", pytz.utc, False),
+    ("H", u"Hotel Time Zone", u"Military", "Etc/GMT-8", False),
+    #("HAA", u"Heure Avancée de l'Atlantique", u"North America", u"UTC - 3 hours")
+    #("HAC", u"Heure Avancée du Centre", u"North America", u"UTC - 5 hours")
+    ("HADT", u"Hawaii-Aleutian Daylight Time", u"North America",
+     "Pacific/Honolulu", True),
+    #("HAE", u"Heure Avancée de l'Est", u"North America", u"UTC - 4 hours")
+    #("HAP", u"Heure Avancée du Pacifique", u"North America", u"UTC - 7 hours")
+    #("HAR", u"Heure Avancée des Rocheuses", u"North America", u"UTC - 6 hours")
+    ("HAST", u"Hawaii-Aleutian Standard Time", u"North America",
+     "Pacific/Honolulu", False),
+    #("HAT", u"Heure Avancée de Terre-Neuve", u"North America", u"UTC - 2:30 hours")
+    #("HAY", u"Heure Avancée du Yukon", u"North America", u"UTC - 8 hours")
+    ("HDT", u"Hawaii Daylight Time", u"North America",
+     "Pacific/Honolulu", True),
+    #("HNA", u"Heure Normale de l'Atlantique", u"North America", u"UTC - 4 hours")
+    #("HNC", u"Heure Normale du Centre", u"North America", u"UTC - 6 hours")
+    #("HNE", u"Heure Normale de l'Est", u"North America", u"UTC - 5 hours")
+    #("HNP", u"Heure Normale du Pacifique", u"North America", u"UTC - 8 hours")
+    #("HNR", u"Heure Normale des Rocheuses", u"North America", u"UTC - 7 hours")
+    #("HNT", u"Heure Normale de Terre-Neuve", u"North America", u"UTC - 3:30 hours")
+    #("HNY", u"Heure Normale du Yukon", u"North America", u"UTC - 9 hours")
+    ("HST", u"Hawaii Standard Time", u"North America",
+     "Pacific/Honolulu", False),
+    ("I", u"India Time Zone", u"Military", "Etc/GMT-9", False),
+    ("IST", u"Irish Summer Time", u"Europe", "Europe/Dublin", True),
+    ("K", u"Kilo Time Zone", u"Military", "Etc/GMT-10", False),
+    ("L", u"Lima Time Zone", u"Military", "Etc/GMT-11", False),
+    ("M", u"Mike Time Zone", u"Military", "Etc/GMT-12", False),
+    ("MDT", u"Mountain Daylight Time", u"North America",
+     "US/Mountain", True),
+    #("MESZ", u"Mitteleuroäische Sommerzeit", u"Europe", u"UTC + 2 hours")
+    #("MEZ", u"Mitteleuropäische Zeit", u"Europe", u"UTC + 1 hour")
+    ("MSD", u"Moscow Daylight Time", u"Europe",
+     "Europe/Moscow", True),
+    ("MSK", u"Moscow Standard Time", u"Europe",
+     "Europe/Moscow", False),
+    ("MST", u"Mountain Standard Time", u"North America",
+     "US/Mountain", False),
+    ("N", u"November Time Zone", u"Military", "Etc/GMT+1", False),
+    ("NDT", u"Newfoundland Daylight Time", u"North America",
+     "America/St_Johns", True),
+    ("NFT", u"Norfolk (Island) Time", u"Australia",
+     "Pacific/Norfolk", False),
+    ("NST", u"Newfoundland Standard Time", u"North America",
+     "America/St_Johns", False),
+    ("O", u"Oscar Time Zone", u"Military", "Etc/GMT+2", False),
+    ("P", u"Papa Time Zone", u"Military", "Etc/GMT+3", False),
+    ("PDT", u"Pacific Daylight Time", u"North America",
+     "US/Pacific", True),
+    ("PST", u"Pacific Standard Time", u"North America",
+     "US/Pacific", False),
+    ("Q", u"Quebec Time Zone", u"Military", "Etc/GMT+4", False),
+    ("R", u"Romeo Time Zone", u"Military", "Etc/GMT+5", False),
+    ("S", u"Sierra Time Zone", u"Military", "Etc/GMT+6", False),
+    ("T", u"Tango Time Zone", u"Military", "Etc/GMT+7", False),
+    ("U", u"Uniform Time Zone", u"Military", "Etc/GMT+8", False),
+    ("UTC", u"Coordinated Universal Time", u"Europe",
+     pytz.utc, False),
+    ("V", u"Victor Time Zone", u"Military", "Etc/GMT+9", False),
+    ("W", u"Whiskey Time Zone", u"Military", "Etc/GMT+10", False),
+    ("WDT", u"Western Daylight Time", u"Australia",
+     "Australia/West", True),
+    ("WEDT", u"Western European Daylight Time", u"Europe",
+     "Etc/GMT+1", True),
+    ("WEST", u"Western European Summer Time", u"Europe",
+     "Etc/GMT+1", True),
+    ("WET", u"Western European Time", u"Europe", pytz.utc, False),
+    ("WST", u"Western Standard Time", u"Australia",
+     "Australia/West", False),
+    ("X", u"X-ray Time Zone", u"Military", "Etc/GMT+11", False),
+    ("Y", u"Yankee Time Zone", u"Military", "Etc/GMT+12", False),
+    ("Z", u"Zulu Time Zone", u"Military", pytz.utc, False),
+)
+
+for _spec in _REGISTRY:
+  tzabbr_register(*_spec)
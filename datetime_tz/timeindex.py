@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""A sorted index of timestamps supporting local calendar range queries.
+
+A TimeIndex keeps its values sorted by UTC time in an array of integer
+microseconds since the epoch. Queries in local time ("everything on
+2009-03-08 in US/Eastern", "between 09:00 and 17:00 local") convert the local
+bounds to UTC once using the zone's transitions (see datetime_tz.transitions)
+and then bisect, rather than converting every value to the local timezone.
+
+Example usage:
+  >>> index = TimeIndex(events, payloads=[e.id for e in events])
+  >>> index.local_day(datetime.date(2009, 3, 8), "US/Eastern")
+  [...]
+  >>> index.daily(datetime.time(9), datetime.time(17), "Australia/Sydney")
+  [...]
+"""
+
+import array
+import bisect
+import datetime
+
+import datetime_tz
+from datetime_tz import transitions
+from datetime_tz.buckets import DAY_US
+
+
+def _epoch_us(value):
+  """Returns an aware datetime or epoch microseconds as epoch microseconds."""
+  if isinstance(value, datetime.datetime):
+    return datetime_tz.sort_key(value)
+  return value
+
+
+def _local_us(value):
+  """Returns a date or naive datetime as microseconds since the local epoch."""
+  if isinstance(value, datetime.datetime):
+    if value.tzinfo is not None:
+      raise TypeError("Local bounds must be naive datetime or date objects!")
+    return transitions.naive_us(value)
+  return (value.toordinal() - transitions.EPOCH_ORDINAL) * DAY_US
+
+
+def _time_us(value):
+  """Returns a time of day as microseconds since midnight."""
+  return ((value.hour * 60 + value.minute) * 60 +
+          value.second) * 1000000 + value.microsecond
+
+
+class TimeIndex(object):
+  """Values (and payloads) sorted by time.
+
+  Attributes:
+    epochs: array.array of the integer microseconds since the epoch (in UTC)
+            of the values, sorted.
+    payloads: List of the payload of each value, in the same order.
+  """
+  __slots__ = ["epochs", "payloads"]
+
+  def __init__(self, values=(), payloads=None):
+    """Create an index.
+
+    Args:
+      values: Iterable of timezone aware datetimes or integer microseconds
+              since the epoch. They don't need to be sorted.
+      payloads: Iterable of the payload for each value. (Defaults to the
+                values themselves.)
+
+    Raises:
+      TypeError: If given a naive datetime.
+      ValueError: If there are a different number of values and payloads.
+    """
+    values = list(values)
+    if payloads is None:
+      payloads = values
+    else:
+      payloads = list(payloads)
+      if len(payloads) != len(values):
+        raise ValueError("Got %d values but %d payloads." % (
+            len(values), len(payloads)))
+
+    keys = [_epoch_us(value) for value in values]
+    order = sorted(range(len(keys)), key=keys.__getitem__)
+    self.epochs = array.array(transitions.EPOCH_TYPECODE,
+                              [keys[i] for i in order])
+    self.payloads = [payloads[i] for i in order]
+
+  def __len__(self):
+    return len(self.epochs)
+
+  def __iter__(self):
+    """Iterate over the payloads in time order."""
+    return iter(self.payloads)
+
+  def __repr__(self):
+    return "<%s of %d values>" % (type(self).__name__, len(self))
+
+  def add(self, value, payload=None):
+    """Add a value to the index.
+
+    Args:
+      value: A timezone aware datetime or integer microseconds since the
+             epoch.
+      payload: The payload for the value. (Defaults to the value.)
+    """
+    if payload is None:
+      payload = value
+    epoch_us = _epoch_us(value)
+    i = bisect.bisect_right(self.epochs, epoch_us)
+    self.epochs.insert(i, epoch_us)
+    self.payloads.insert(i, payload)
+
+  def _slice(self, start_us, end_us):
+    return self.payloads[bisect.bisect_left(self.epochs, start_us):
+                         bisect.bisect_left(self.epochs, end_us)]
+
+  def between(self, start, end):
+    """Get the payloads of the values in [start, end).
+
+    Args:
+      start: A timezone aware datetime or epoch microseconds.
+      end: A timezone aware datetime or epoch microseconds.
+
+    Returns:
+      List of payloads, in time order.
+    """
+    return self._slice(_epoch_us(start), _epoch_us(end))
+
+  def local_between(self, start, end, tz=None):
+    """Get the payloads of the values between two local times.
+
+    A local time which happens twice (when the clocks go back) means the
+    first occurrence, and one which doesn't exist (when they go forward) is
+    moved forward by the size of the gap.
+
+    Args:
+      start: Local start time, a naive datetime or a date (for midnight).
+      end: Local end time (not included), a naive datetime or a date.
+      tz: The timezone of start and end. (Defaults to your local timezone.)
+
+    Returns:
+      List of payloads, in time order.
+
+    Raises:
+      TypeError: If start or end are aware datetimes.
+      ValueError: If tz isn't a pytz timezone.
+    """
+    table = self._table(tz)
+    return self._slice(table.fromlocal(_local_us(start))[0],
+                       table.fromlocal(_local_us(end))[0])
+
+  def local_day(self, day, tz=None):
+    """Get the payloads of the values on a local day.
+
+    The day runs from local midnight to the next local midnight, so can be
+    23 or 25 hours long when the clocks change.
+
+    Args:
+      day: A date.
+      tz: The timezone of the day. (Defaults to your local timezone.)
+
+    Returns:
+      List of payloads, in time order.
+    """
+    return self.local_between(day, day + datetime.timedelta(days=1), tz)
+
+  def daily(self, start_time, end_time, tz=None, first=None, last=None):
+    """Get the payloads of the values in a window of local time each day.
+
+    Args:
+      start_time: The datetime.time the window opens each day.
+      end_time: The datetime.time the window closes (not included). If it is
+                not after start_time the window runs past midnight into the
+                next day.
+      tz: The timezone of the window. (Defaults to your local timezone.)
+      first: The date of the first window. (Defaults to the local date of
+             the first value.)
+      last: The date of the last window. (Defaults to the local date of the
+            last value.)
+
+    Returns:
+      List of payloads, in time order.
+    """
+    table = self._table(tz)
+    if not self.epochs:
+      return []
+
+    def local_ordinal(epoch_us):
+      local_us = epoch_us + table.utcoffset_us(epoch_us)
+      return local_us // DAY_US + transitions.EPOCH_ORDINAL
+
+    if first is None:
+      first = local_ordinal(self.epochs[0])
+      if end_time <= start_time:
+        # The first value could be in the window opened the day before.
+        first -= 1
+    else:
+      first = first.toordinal()
+    if last is None:
+      last = local_ordinal(self.epochs[-1])
+    else:
+      last = last.toordinal()
+
+    open_us = _time_us(start_time)
+    close_us = _time_us(end_time)
+    if close_us <= open_us:
+      close_us += DAY_US
+
+    result = []
+    for ordinal in range(first, last + 1):
+      day_us = (ordinal - transitions.EPOCH_ORDINAL) * DAY_US
+      start_us = table.fromlocal(day_us + open_us)[0]
+      if start_us > self.epochs[-1]:
+        break
+      result.extend(self._slice(start_us,
+                                table.fromlocal(day_us + close_us)[0]))
+    return result
+
+  @staticmethod
+  def _table(tz):
+    if tz is None:
+      tz = datetime_tz.localtz()
+    table = transitions.zone_table(datetime_tz._tzinfome(tz))
+    if table is None:
+      raise ValueError("Local queries need a pytz timezone.")
+    return table
@@ -0,0 +1,300 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""Transition tables for pytz zones using integer microseconds.
+
+pytz spreads the information about a zone over a list of naive UTC datetimes
+and a dictionary of tzinfo objects. A ZoneTable flattens that into parallel
+lists indexed by transition, with the times as integer microseconds since the
+Unix epoch, so converting a UTC time to local time is a single bisect and some
+integer arithmetic.
+"""
+
+import array
+import bisect
+import datetime
+
+from datetime_tz import instrument
+
+EPOCH = datetime.datetime(1970, 1, 1)
+EPOCH_ORDINAL = EPOCH.toordinal()
+
+# Before any real transition.
+MIN_US = -(1 << 63)
+# After any real transition.
+MAX_US = (1 << 63) - 1
+
+# array.array typecode for microseconds since the epoch, which are too big
+# for a 32bit integer. Python 2 has no "q", but "l" is 64 bits on 64 bit
+# platforms.
+try:
+  array.array("q")
+  EPOCH_TYPECODE = "q"
+except ValueError:
+  EPOCH_TYPECODE = "l"
+
+try:
+  _xrange = xrange
+except NameError:
+  _xrange = range
+
+
+class EpochRange(object):
+  """An arithmetic range of integers, like range on Python 3.
+
+  Python 2's range builds a list, and its xrange can't be sliced or
+  searched, so this stores start, step and length itself.
+
+  Attributes:
+    start: The first value.
+    stop: The range stops before reaching this value.
+    step: The (non-zero) difference between values.
+  """
+  __slots__ = ["start", "stop", "step", "_len"]
+
+  def __init__(self, start, stop, step=1):
+    if not step:
+      raise ValueError("EpochRange() arg 3 must not be zero")
+    self.start = start
+    self.stop = stop
+    self.step = step
+    if step > 0:
+      self._len = max(0, (stop - start + step - 1) // step)
+    else:
+      self._len = max(0, (start - stop - step - 1) // -step)
+
+  def __len__(self):
+    return self._len
+
+  def __bool__(self):
+    return self._len > 0
+  __nonzero__ = __bool__
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      first, last, step = index.indices(self._len)
+      length = len(_xrange(first, last, step))
+      start = self.start + first * self.step
+      step *= self.step
+      return EpochRange(start, start + length * step, step)
+    if index < 0:
+      index += self._len
+    if not 0 <= index < self._len:
+      raise IndexError("EpochRange object index out of range")
+    return self.start + index * self.step
+
+  def __iter__(self):
+    # Values fit in a C long on 64 bit platforms, so xrange can iterate.
+    return iter(_xrange(self.start, self.start + self._len * self.step,
+                        self.step))
+
+  def __reversed__(self):
+    last = self.start + (self._len - 1) * self.step
+    return iter(_xrange(last, self.start - self.step, -self.step))
+
+  def __contains__(self, value):
+    offset = value - self.start
+    return offset % self.step == 0 and 0 <= offset // self.step < self._len
+
+  def index(self, value):
+    """Returns the index of value, raising ValueError if it isn't in range."""
+    if value not in self:
+      raise ValueError("%r is not in range" % (value,))
+    return (value - self.start) // self.step
+
+  def _key(self):
+    # Ranges with the same values are equal (like Python 3's range).
+    if not self._len:
+      return (0, None, None)
+    if self._len == 1:
+      return (1, self.start, None)
+    return (self._len, self.start, self.step)
+
+  def __eq__(self, other):
+    if not isinstance(other, EpochRange):
+      return NotImplemented
+    return self._key() == other._key()
+
+  def __ne__(self, other):
+    result = self.__eq__(other)
+    if result is NotImplemented:
+      return result
+    return not result
+
+  def __hash__(self):
+    return hash(self._key())
+
+  def __repr__(self):
+    return "%s(%r, %r, %r)" % (
+        type(self).__name__, self.start, self.stop, self.step)
+
+
+def timedelta_us(td):
+  """Returns a timedelta as an integer number of microseconds."""
+  return (td.days * 86400 + td.seconds) * 1000000 + td.microseconds
+
+
+def naive_us(dt):
+  """Returns the microseconds between the epoch and dt, ignoring tzinfo."""
+  return (((dt.toordinal() - EPOCH_ORDINAL) * 86400 + dt.hour * 3600 +
+           dt.minute * 60 + dt.second) * 1000000 + dt.microsecond)
+
+
+def datetime_us(dt):
+  """Returns the microseconds since the epoch (in UTC) of an aware datetime."""
+  return naive_us(dt) - timedelta_us(dt.utcoffset())
+
+
+def us_naive(us):
+  """Returns the naive datetime which is us microseconds after the epoch."""
+  return EPOCH + datetime.timedelta(microseconds=us)
+
+
+class ZoneTable(object):
+  """The transitions of a pytz zone.
+
+  Attributes:
+    zone: The pytz zone.
+    utc: Sorted list of the UTC times (in microseconds) each transition
+         happens at. The first entry is always before any datetime.
+    offsets: The offset from UTC (in microseconds) from each transition.
+    dsts: If DST is in effect from each transition.
+    tzinfos: The pytz tzinfo object to use from each transition.
+  """
+  __slots__ = ["zone", "utc", "offsets", "dsts", "tzinfos"]
+
+  def __init__(self, zone, utc, offsets, dsts, tzinfos):
+    self.zone = zone
+    self.utc = utc
+    self.offsets = offsets
+    self.dsts = dsts
+    self.tzinfos = tzinfos
+
+  @classmethod
+  def frompytz(cls, zone):
+    """Create a ZoneTable for a pytz zone (or None if it isn't supported)."""
+    transitions = getattr(zone, "_utc_transition_times", None)
+    if transitions:
+      zone = zone._tzinfos[zone._transition_info[0]]
+      utc = [MIN_US] + [naive_us(t) for t in transitions[1:]]
+      tzinfos = [zone._tzinfos[info] for info in zone._transition_info]
+      offsets = [timedelta_us(tz._utcoffset) for tz in tzinfos]
+      dsts = [bool(tz._dst) for tz in tzinfos]
+      return cls(zone, utc, offsets, dsts, tzinfos)
+
+    # Static zones (UTC, Etc/GMT+X, FixedOffset) have a single offset.
+    if not hasattr(zone, "localize"):
+      return None
+    try:
+      offset = zone.utcoffset(None)
+    except Exception:  # pylint: disable=broad-except
+      offset = None
+    if offset is None:
+      return None
+    return cls(zone, [MIN_US], [timedelta_us(offset)], [False], [zone])
+
+  def index(self, utc_us):
+    """Returns the index of the transition in effect at utc_us."""
+    return bisect.bisect_right(self.utc, utc_us) - 1
+
+  def until(self, index):
+    """Returns the UTC time the transition at index is in effect until."""
+    if index + 1 < len(self.utc):
+      return self.utc[index + 1]
+    return MAX_US
+
+  def utcoffset_us(self, utc_us):
+    """Returns the offset from UTC (in microseconds) in effect at utc_us."""
+    return self.offsets[self.index(utc_us)]
+
+  def fromlocal(self, local_us):
+    """Convert a local time to UTC.
+
+    A local time which happens twice (when the clocks go back) gives the
+    first occurrence. A local time which doesn't exist (when the clocks go
+    forward) is moved forward by the size of the gap, as a wall clock would.
+
+    Args:
+      local_us: Local time as microseconds since the (local) epoch.
+
+    Returns:
+      (utc_us, index) with the UTC time and the index of the transition in
+      effect at it.
+    """
+    # Offsets are much smaller than the time between transitions, so the
+    # answer is the transition local_us falls in (if it were UTC) or one of
+    # its neighbours.
+    guess = self.index(local_us)
+    candidates = range(max(guess - 1, 0), min(guess + 2, len(self.utc)))
+    for i in candidates:
+      utc_us = local_us - self.offsets[i]
+      if self.utc[i] <= utc_us < self.until(i):
+        return utc_us, i
+
+    # In a gap, so use the offset from before the gap.
+    for i in reversed(candidates):
+      utc_us = local_us - self.offsets[i]
+      if utc_us >= self.until(i):
+        return utc_us, i + 1
+    raise ValueError("Unable to convert %r to UTC" % local_us)
+
+
+# ZoneTable for each zone, keyed by the zone's base tzinfo object.
+_tables = {}
+
+
+def zone_root(tzinfo):
+  """Returns the zone tzinfo object for a (possibly localized) pytz tzinfo."""
+  root = getattr(tzinfo, "_root", None)
+  if root is not None:
+    return root
+  tzinfos = getattr(tzinfo, "_tzinfos", None)
+  if tzinfos is not None and getattr(tzinfo, "_transition_info", None):
+    return tzinfos[tzinfo._transition_info[0]]
+  return tzinfo
+
+
+def zone_table(tzinfo):
+  """Get the (cached) ZoneTable for a tzinfo.
+
+  Args:
+    tzinfo: A pytz tzinfo object (either the zone or a localized version).
+
+  Returns:
+    A ZoneTable, or None if tzinfo isn't a pytz style zone.
+  """
+  key = zone_root(tzinfo)
+  try:
+    table = _tables[key]
+  except KeyError:
+    pass
+  except TypeError:
+    # Unhashable tzinfo
+    return None
+  else:
+    if instrument.collector is not None:
+      instrument.cache("zone_table", True)
+    return table
+
+  instrument.cache("zone_table", False)
+  build = getattr(key, "_zone_table", None)
+  if build is not None:
+    return _tables.setdefault(key, build())
+  return _tables.setdefault(key, ZoneTable.frompytz(tzinfo))
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""A compact, array backed container of datetime_tz values.
+
+Rather than holding one Python object per value, a DatetimeTZArray stores the
+integer number of microseconds since the Unix epoch (which is in UTC!) in an
+array.array and a small integer index into a table of timezones. The
+datetime_tz objects are only created when an element is accessed.
+
+The buffers can be shipped between processes as raw bytes, which is much
+cheaper than pickling millions of datetime objects.
+"""
+
+import array
+import datetime
+
+import pytz
+
+import datetime_tz
+from datetime_tz import transitions
+
+EPOCH_TYPECODE = transitions.EPOCH_TYPECODE
+ZONE_ID_TYPECODE = "H"
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def _zone_key(tzinfo):
+  """Returns a hashable key which identifies the zone of a tzinfo object."""
+  zone = getattr(tzinfo, "zone", None)
+  if zone is not None:
+    return zone
+  # pytz.FixedOffset objects don't have a zone name, but are cached by pytz.
+  return tzinfo
+
+
+totimestamp_us = transitions.datetime_us
+
+
+def _frombytes(values, data):
+  """Append bytes to an array.array (fromstring on Python 2)."""
+  if hasattr(values, "frombytes"):
+    values.frombytes(data)
+  else:
+    values.fromstring(data)
+
+
+def _tobytes(values):
+  """Returns the bytes of an array.array (tostring on Python 2)."""
+  if hasattr(values, "tobytes"):
+    return values.tobytes()
+  return values.tostring()
+
+
+class DatetimeTZArray(object):
+  """An array of datetime_tz objects stored as epoch microseconds and zones.
+
+  Attributes:
+    epochs: array.array of integer microseconds since the Unix epoch.
+    zone_ids: array.array of indexes into zones, one for each value.
+    zones: List of the tzinfo objects values are in.
+  """
+  __slots__ = ["epochs", "zone_ids", "zones", "_zone_index"]
+
+  def __init__(self, values=None):
+    self.epochs = array.array(EPOCH_TYPECODE)
+    self.zone_ids = array.array(ZONE_ID_TYPECODE)
+    self.zones = []
+    self._zone_index = {}
+
+    if values is not None:
+      for value in values:
+        self.append(value)
+
+  @classmethod
+  def frombuffers(cls, epochs, zone_ids, zones):
+    """Create a DatetimeTZArray from the raw buffers.
+
+    Args:
+      epochs: bytes (or array.array) of epoch microseconds.
+      zone_ids: bytes (or array.array) of indexes into zones.
+      zones: List of tzinfo objects.
+
+    Returns:
+      A DatetimeTZArray object.
+
+    Raises:
+      ValueError: If the buffers are not the same length.
+    """
+    obj = cls()
+    if isinstance(epochs, array.array):
+      obj.epochs.extend(epochs)
+    else:
+      _frombytes(obj.epochs, epochs)
+    if isinstance(zone_ids, array.array):
+      obj.zone_ids.extend(zone_ids)
+    else:
+      _frombytes(obj.zone_ids, zone_ids)
+    if len(obj.epochs) != len(obj.zone_ids):
+      raise ValueError("Epoch and zone buffers have different lengths!")
+    for zone in zones:
+      obj.zone_id(zone)
+    return obj
+
+  @classmethod
+  def fromepochs(cls, epochs, tzinfo=pytz.utc):
+    """Create a DatetimeTZArray of values all in one timezone.
+
+    Args:
+      epochs: Iterable of integer microseconds since the epoch (in UTC).
+      tzinfo: The timezone of all the values.
+
+    Returns:
+      A DatetimeTZArray object.
+    """
+    obj = cls()
+    obj.epochs.extend(epochs)
+    obj.zone_ids = array.array(
+        ZONE_ID_TYPECODE, [obj.zone_id(tzinfo)]) * len(obj.epochs)
+    return obj
+
+  def tobuffers(self):
+    """Returns (epochs bytes, zone_ids bytes, zones list) for this array."""
+    return _tobytes(self.epochs), _tobytes(self.zone_ids), list(self.zones)
+
+  def zone_id(self, tzinfo):
+    """Get the index of a timezone in the zone table, adding it if needed.
+
+    Args:
+      tzinfo: A datetime.tzinfo object.
+
+    Returns:
+      Integer index into zones.
+    """
+    key = _zone_key(tzinfo)
+    try:
+      return self._zone_index[key]
+    except KeyError:
+      zone_id = len(self.zones)
+      self.zones.append(transitions.zone_root(tzinfo))
+      self._zone_index[key] = zone_id
+      return zone_id
+
+  def append(self, dt):
+    """Append a timezone aware datetime."""
+    if dt.tzinfo is None:
+      raise TypeError("Can only store timezone aware datetime objects!")
+    self.epochs.append(totimestamp_us(dt))
+    self.zone_ids.append(self.zone_id(dt.tzinfo))
+
+  def append_epoch(self, epoch_us, tzinfo=pytz.utc):
+    """Append a value given as epoch microseconds and a tzinfo."""
+    self.epochs.append(epoch_us)
+    self.zone_ids.append(self.zone_id(tzinfo))
+
+  def extend(self, other):
+    """Append all the values from another DatetimeTZArray."""
+    remap = [self.zone_id(zone) for zone in other.zones]
+    self.epochs.extend(other.epochs)
+    self.zone_ids.extend(remap[zone_id] for zone_id in other.zone_ids)
+
+  def __len__(self):
+    return len(self.epochs)
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      result = type(self)()
+      epochs = self.epochs[index]
+      zone_ids = self.zone_ids[index]
+      remap = {}
+      for zone_id in set(zone_ids):
+        remap[zone_id] = result.zone_id(self.zones[zone_id])
+      result.epochs = epochs
+      result.zone_ids = array.array(
+          ZONE_ID_TYPECODE, [remap[zone_id] for zone_id in zone_ids])
+      return result
+
+    epoch_us = self.epochs[index]
+    tzinfo = self.zones[self.zone_ids[index]]
+    table = transitions.zone_table(tzinfo)
+    if table is not None:
+      return datetime_tz.datetime_tz._fromepoch_us(epoch_us, table)
+    utc = datetime_tz.datetime_tz(
+        _EPOCH + datetime.timedelta(microseconds=epoch_us), pytz.utc)
+    return utc.astimezone(tzinfo)
+
+  def __iter__(self):
+    for i in range(len(self)):
+      yield self[i]
+
+  def __repr__(self):
+    return "<%s of %d values in %d zones>" % (
+        type(self).__name__, len(self), len(self.zones))
@@ -0,0 +1,179 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""A random access, evenly spaced range of datetime_tz values.
+
+DatetimeTZRange is to iterate.between what range is to a while loop. The
+values are stored as a range of integer microseconds since the Unix epoch, so
+the length, any element, slices and membership are all computed with
+arithmetic rather than by walking the values.
+
+Example usage:
+  >>> r = iterate.range(start, timedelta(minutes=1), end)
+  >>> len(r)
+  525600
+  >>> r[-1]
+  datetime_tz(2009, 12, 31, 23, 59, tzinfo=<UTC>)
+  >>> r[::60]  # Every hour
+  <DatetimeTZRange ...>
+"""
+
+import datetime
+
+import datetime_tz
+from datetime_tz import transitions
+
+
+class DatetimeTZRange(object):
+  """An immutable sequence of datetime_tz values a fixed time apart.
+
+  Attributes:
+    epochs: transitions.EpochRange of the values as integer microseconds
+            since the epoch.
+    table: transitions.ZoneTable for the timezone of the values.
+    cls: The datetime_tz class of the values.
+  """
+  __slots__ = ["epochs", "table", "cls"]
+
+  def __init__(self, start, delta, end):
+    """Create a range.
+
+    Args:
+      start: The first value, a datetime_tz in a pytz timezone.
+      delta: The (non-zero) timedelta between values.
+      end: The range stops before reaching this value.
+
+    Raises:
+      ValueError: If delta is zero or start isn't in a pytz timezone.
+    """
+    table = transitions.zone_table(start.tzinfo)
+    if table is None:
+      raise ValueError("A range needs a pytz timezone.")
+    step = transitions.timedelta_us(delta)
+    if not step:
+      raise ValueError("delta can not be zero.")
+
+    cls = type(start)
+    if not isinstance(start, datetime_tz.datetime_tz):
+      cls = datetime_tz.datetime_tz
+
+    self.epochs = transitions.EpochRange(transitions.datetime_us(start),
+                                         transitions.datetime_us(end), step)
+    self.table = table
+    self.cls = cls
+
+  @classmethod
+  def _fromepochs(cls, epochs, table, dtcls):
+    obj = cls.__new__(cls)
+    obj.epochs = epochs
+    obj.table = table
+    obj.cls = dtcls
+    return obj
+
+  def _fromepoch(self, epoch_us):
+    return self.cls._fromepoch_us(epoch_us, self.table)
+
+  @property
+  def start(self):
+    """The first value of the range (even if the range is empty)."""
+    return self._fromepoch(self.epochs.start)
+
+  @property
+  def end(self):
+    """The value the range stops before."""
+    return self._fromepoch(self.epochs.stop)
+
+  @property
+  def delta(self):
+    """The timedelta between values."""
+    return datetime.timedelta(microseconds=self.epochs.step)
+
+  def __len__(self):
+    return len(self.epochs)
+
+  def __bool__(self):
+    return bool(self.epochs)
+  __nonzero__ = __bool__
+
+  def __getitem__(self, index):
+    if isinstance(index, slice):
+      return self._fromepochs(self.epochs[index], self.table, self.cls)
+    return self._fromepoch(self.epochs[index])
+
+  def __iter__(self):
+    return self.cls._fromepochs_us(self.epochs, self.table)
+
+  def __reversed__(self):
+    return self.cls._fromepochs_us(reversed(self.epochs), self.table)
+
+  def _epoch(self, dt):
+    """Returns dt as epoch microseconds, or None if it can't be in a range."""
+    if not isinstance(dt, datetime.datetime) or dt.tzinfo is None:
+      return None
+    return transitions.datetime_us(dt)
+
+  def __contains__(self, dt):
+    epoch_us = self._epoch(dt)
+    return epoch_us is not None and epoch_us in self.epochs
+
+  def index(self, dt):
+    """Returns the index of dt in the range.
+
+    Args:
+      dt: A timezone aware datetime.
+
+    Returns:
+      The integer index.
+
+    Raises:
+      ValueError: If dt isn't in the range.
+    """
+    epoch_us = self._epoch(dt)
+    if epoch_us is None or epoch_us not in self.epochs:
+      raise ValueError("%r is not in range" % (dt,))
+    return self.epochs.index(epoch_us)
+
+  def count(self, dt):
+    """Returns the number of times dt is in the range (0 or 1)."""
+    return int(dt in self)
+
+  def toarray(self):
+    """Returns the values of the range as a DatetimeTZArray."""
+    return datetime_tz.DatetimeTZArray.fromepochs(self.epochs, self.table.zone)
+
+  def __eq__(self, other):
+    if not isinstance(other, DatetimeTZRange):
+      return NotImplemented
+    return (self.epochs == other.epochs and
+            self.table.zone is other.table.zone)
+
+  def __ne__(self, other):
+    result = self.__eq__(other)
+    if result is NotImplemented:
+      return result
+    return not result
+
+  def __hash__(self):
+    return hash((self.epochs, self.table.zone))
+
+  def __repr__(self):
+    return "<%s of %d values from %s every %s in %s>" % (
+        type(self).__name__, len(self), self.start, self.delta,
+        getattr(self.table.zone, "zone", self.table.zone))
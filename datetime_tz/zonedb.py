@@ -0,0 +1,274 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# vim: set ts=2 sw=2 et sts=2 ai:
+#
+# Copyright 2009 Google Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+#
+# pylint: disable=invalid-name,protected-access
+
+"""A memory mapped database of compiled timezones (requires Python 3).
+
+Every process which uses pytz loads and parses its own copy of each zone
+file. build() compiles all the zones (see datetime_tz.compiled) into a single
+file of packed tables once, and ZoneDB maps that file into memory read-only,
+so all the processes on a machine share one copy in the page cache and no zone
+files need to be parsed.
+
+The file is named after (and records) the tzdata version of pytz, so a new
+pytz release gets a new database.
+
+Example usage:
+  $ python -m datetime_tz build-zonedb
+  >>> datetime_tz.zonedb_set()  # Use the database for all zones.
+"""
+
+import datetime
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+
+import pytz
+
+from datetime_tz import compiled
+from datetime_tz import instrument
+
+MAGIC = b"DTZDB\x00\x01\x00"
+
+# Magic, then the length of the JSON header.
+_PREFIX = struct.Struct("<8sQ")
+
+# Tables start on a multiple of this.
+_ALIGN = 8
+
+
+def default_path(version=None):
+  """Returns where the database for a tzdata version is kept.
+
+  This is $DATETIME_TZ_ZONEDB if set, otherwise a file in the user's cache
+  directory.
+
+  Args:
+    version: The tzdata version. (Defaults to pytz's.)
+
+  Returns:
+    Path to the database file.
+  """
+  if version is None:
+    version = pytz.OLSON_VERSION
+  path = os.environ.get("DATETIME_TZ_ZONEDB")
+  if path:
+    return path
+  cache = os.environ.get("XDG_CACHE_HOME") or os.path.join(
+      os.path.expanduser("~"), ".cache")
+  return os.path.join(cache, "datetime_tz", "zones-%s.db" % version)
+
+
+def _timedelta_json(td):
+  return td.days * 86400 + td.seconds
+
+
+def build(path=None, zones=None):
+  """Compile timezones into a database file.
+
+  The file is written to a temporary file and then renamed, so processes
+  never see a partly written database.
+
+  Args:
+    path: Where to write the database. (Defaults to default_path().)
+    zones: Names of the zones to include. (Defaults to all pytz zones.)
+
+  Returns:
+    The path of the database.
+
+  Raises:
+    NotImplementedError: On Python 2, which can't map the tables.
+  """
+  if sys.version_info < (3,):
+    raise NotImplementedError("The zone database needs Python 3.")
+  if path is None:
+    path = default_path()
+  if zones is None:
+    zones = pytz.all_timezones
+
+  header = {
+      "version": pytz.OLSON_VERSION,
+      "byteorder": sys.byteorder,
+      "zones": {},
+  }
+  blobs = []
+  blob_offsets = {}
+  size = [0]
+
+  def add(table):
+    data = table.tobytes()
+    if data not in blob_offsets:
+      blob_offsets[data] = size[0]
+      padding = -len(data) % _ALIGN
+      blobs.append(data + b"\0" * padding)
+      size[0] += len(data) + padding
+    return [blob_offsets[data], len(table)]
+
+  for name in zones:
+    zone = pytz.timezone(name)
+    if not getattr(zone, "_utc_transition_times", None):
+      # Zones with a single offset don't need compiling.
+      continue
+    keys, root, tables = compiled.compile_tables(zone)
+    entry = {
+        "keys": [[_timedelta_json(offset), _timedelta_json(dst), tzname]
+                 for offset, dst, tzname in keys],
+        "root": root,
+    }
+    for table_name in compiled._TABLES:
+      entry[table_name] = add(tables[table_name])
+    header["zones"][name] = entry
+
+  header = json.dumps(header, sort_keys=True).encode("utf-8")
+  header += b" " * (-(_PREFIX.size + len(header)) % _ALIGN)
+
+  directory = os.path.dirname(path)
+  if directory and not os.path.isdir(directory):
+    os.makedirs(directory)
+  fd, tmp = tempfile.mkstemp(dir=directory or ".", prefix=".zonedb")
+  try:
+    with os.fdopen(fd, "wb") as f:
+      f.write(_PREFIX.pack(MAGIC, len(header)))
+      f.write(header)
+      for blob in blobs:
+        f.write(blob)
+    # mkstemp makes the file private, but the database is shared between users.
+    umask = os.umask(0)
+    os.umask(umask)
+    os.chmod(tmp, 0o644 & ~umask)
+    # os.rename fails on Windows if the database already exists.
+    getattr(os, "replace", os.rename)(tmp, path)
+  finally:
+    if os.path.exists(tmp):
+      os.unlink(tmp)
+  return path
+
+
+class ZoneDB(object):
+  """A read-only, memory mapped database of compiled zones.
+
+  Attributes:
+    path: The database file.
+    version: The tzdata version the database was built from.
+  """
+
+  def __init__(self, path):
+    """Open a database.
+
+    Args:
+      path: The database file.
+
+    Raises:
+      ValueError: If the file isn't a database for this machine.
+    """
+    self.path = path
+    with open(path, "rb") as f:
+      self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, header_size = _PREFIX.unpack_from(self._mmap)
+    if magic != MAGIC:
+      raise ValueError("%s is not a datetime_tz zone database." % path)
+    start = _PREFIX.size
+    header = json.loads(self._mmap[start:start + header_size].decode("utf-8"))
+    if header["byteorder"] != sys.byteorder:
+      raise ValueError("%s was built on a %s endian machine." % (
+          path, header["byteorder"]))
+
+    self.version = header["version"]
+    self._zones = header["zones"]
+    self._data_start = start + header_size
+    self._view = memoryview(self._mmap)
+    self._compiled = {}
+
+  def __contains__(self, name):
+    return name in self._zones
+
+  def names(self):
+    """Returns the names of the zones in the database."""
+    return sorted(self._zones)
+
+  def zone(self, name):
+    """Get a compiled zone from the database.
+
+    Args:
+      name: The name of the zone.
+
+    Returns:
+      The CompiledTzInfo for the zone, or None if it isn't in the database.
+    """
+    try:
+      zone = self._compiled[name]
+    except KeyError:
+      pass
+    else:
+      if instrument.collector is not None:
+        instrument.cache("zonedb", True)
+      return zone
+
+    entry = self._zones.get(name)
+    if entry is None:
+      return None
+    instrument.cache("zonedb", False)
+
+    tables = {}
+    for table_name, typecode in compiled._TABLES.items():
+      offset, length = entry[table_name]
+      start = self._data_start + offset
+      size = struct.calcsize(typecode) * length
+      tables[table_name] = self._view[start:start + size].cast(typecode)
+
+    keys = [(datetime.timedelta(seconds=offset),
+             datetime.timedelta(seconds=dst), tzname)
+            for offset, dst, tzname in entry["keys"]]
+    data = compiled._ZoneData(name, None, keys, entry["root"], tables)
+    return self._compiled.setdefault(name, data.root)
+
+
+def open_db(path=None, build_missing=True):
+  """Open the database for pytz's tzdata version, building it if needed.
+
+  Args:
+    path: The database file. (Defaults to default_path().)
+    build_missing: Build the database if it doesn't exist or is for another
+                   version of tzdata.
+
+  Returns:
+    A ZoneDB object.
+
+  Raises:
+    IOError: If the database doesn't exist and build_missing is False.
+    ValueError: If the database is for another tzdata version and
+                build_missing is False.
+  """
+  if path is None:
+    path = default_path()
+  try:
+    db = ZoneDB(path)
+    if db.version == pytz.OLSON_VERSION:
+      return db
+    if not build_missing:
+      raise ValueError("%s is for tzdata %s not %s" % (
+          path, db.version, pytz.OLSON_VERSION))
+  except (IOError, OSError, ValueError):
+    if not build_missing:
+      raise
+  return ZoneDB(build(path))
@@ -39,13 +39,21 @@
 
 __author__ = "tansell@google.com (Tim Ansell)"
 
+import array
+import calendar
+import collections
 import copy
 import ctypes
 import datetime
 import itertools
 import os
+import pickle
 import random
+import shutil
+import subprocess
 import sys
+import tempfile
+import time
 import unittest
 import warnings
 
@@ -55,9 +63,16 @@ import pytz
 
 import datetime_tz
 # To test these, we still import them
+import datetime_tz.__main__
 from datetime_tz import detect_windows
 from datetime_tz import update_win32tz_map
 
+try:
+  # pylint: disable=g-import-not-at-top
+  import asyncio
+except ImportError:
+  asyncio = None
+
 try:
   # pylint: disable=g-import-not-at-top
   import win32timezone
@@ -246,6 +261,58 @@ class TestLocalTimezoneDetection(TestTimeZoneBase):
     tzinfo = datetime_tz._detect_timezone_environ()
     self.assertEqual(None, tzinfo)
 
+  def testEnvironPathMethod(self):
+    tzdir = tempfile.mkdtemp()
+    self.addCleanup(shutil.rmtree, tzdir)
+    os.makedirs(os.path.join(tzdir, "posix", "Europe"))
+    berlin = os.path.join(tzdir, "posix", "Europe", "Berlin")
+    with open(berlin, "wb") as f:
+      f.write(pytz.open_resource("Europe/Berlin").read())
+    copied = os.path.join(tzdir, "localtime")
+    shutil.copy(berlin, copied)
+
+    old_environ = dict(os.environ)
+    try:
+      os.environ["TZDIR"] = tzdir
+
+      os.environ["TZ"] = ":" + berlin
+      self.assertTimezoneEqual(datetime_tz._detect_timezone_environ(),
+                               pytz.timezone("Europe/Berlin"))
+      os.environ["TZ"] = berlin
+      self.assertTimezoneEqual(datetime_tz._detect_timezone_environ(),
+                               pytz.timezone("Europe/Berlin"))
+      os.environ["TZ"] = ":Europe/Berlin"
+      self.assertTimezoneEqual(datetime_tz._detect_timezone_environ(),
+                               pytz.timezone("Europe/Berlin"))
+
+      if hasattr(os, "symlink"):
+        linked = os.path.join(tzdir, "linked")
+        os.symlink(berlin, linked)
+        os.environ["TZ"] = ":" + linked
+        self.assertTimezoneEqual(datetime_tz._detect_timezone_environ(),
+                                 pytz.timezone("Europe/Berlin"))
+
+      # Not under a zoneinfo directory, so found by content.
+      os.environ["TZ"] = ":" + copied
+      self.assertTimezoneEqual(datetime_tz._detect_timezone_environ(),
+                               pytz.timezone("Europe/Berlin"))
+
+      # Doesn't match any zone, so used as is.
+      sydney = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                            "test_zonedata_sydney")
+      os.environ["TZ"] = ":" + sydney
+      tzinfo = datetime_tz._detect_timezone_environ()
+      self.assertEqual(tzinfo.zone, sydney)
+      self.assertEqual(
+          tzinfo.localize(datetime.datetime(2009, 1, 1)).utcoffset(),
+          datetime.timedelta(hours=11))
+
+      os.environ["TZ"] = ":" + os.path.join(tzdir, "missing")
+      self.assertEqual(datetime_tz._detect_timezone_environ(), None)
+    finally:
+      os.environ.clear()
+      os.environ.update(old_environ)
+
   def testEtcTimezoneMethod(self):
     def os_path_exists_fake(filename, os_path_exists=os.path.exists):
       if filename == "/etc/timezone":
@@ -400,6 +467,137 @@ class TestLocalTimezoneDetection(TestTimeZoneBase):
     # FIXME: Actually test this method sometime in the future.
     pass
 
+  def testDetectStats(self):
+    self.mocked("datetime_tz._detect_timezone_environ", lambda: None)
+    sydney = pytz.timezone("Australia/Sydney")
+    self.mocked("datetime_tz._detect_timezone_etc_timezone", lambda: sydney)
+
+    with datetime_tz.collect_stats() as collected:
+      self.assertTimezoneEqual(datetime_tz.detect_timezone(), sydney)
+    stats = collected.asdict()
+    self.assertEqual(stats["detect.environ.calls"], 1)
+    self.assertEqual(stats["detect.etc_timezone.calls"], 1)
+    self.assertTrue(stats["detect.etc_timezone.seconds"] >= 0)
+    self.assertEqual(stats["detect.success.etc_timezone"], 1)
+    self.assertFalse("detect.success.environ" in stats)
+    self.assertFalse("detect.etc_localtime.calls" in stats)
+
+    for method in ("etc_timezone", "etc_localtime", "php"):
+      self.mocked("datetime_tz._detect_timezone_%s" % method, lambda: None)
+    with datetime_tz.collect_stats() as collected:
+      self.assertRaises(pytz.UnknownTimeZoneError,
+                        datetime_tz.detect_timezone)
+    stats = collected.asdict()
+    self.assertEqual(stats["detect.php.calls"], 1)
+    self.assertEqual(stats["detect.failed"], 1)
+
+  def testDetectSet(self):
+    sydney = pytz.timezone("Australia/Sydney")
+    tried = []
+
+    def method(name, result=None, seconds=0):
+      def fake():
+        tried.append(name)
+        time.sleep(seconds)
+        return result
+      return fake
+
+    self.mocked("datetime_tz._detect_timezone_environ", method("environ"))
+    self.mocked("datetime_tz._detect_timezone_etc_timezone",
+                method("etc_timezone", seconds=0.05))
+    self.mocked("datetime_tz._detect_timezone_etc_localtime",
+                method("etc_localtime", sydney))
+    self.mocked("datetime_tz._detect_timezone_php", method("php", pytz.utc))
+
+    try:
+      datetime_tz.detect_set(methods=["etc_localtime", "environ"])
+      self.assertTimezoneEqual(datetime_tz.detect_timezone(), sydney)
+      self.assertEqual(tried, ["etc_localtime"])
+
+      del tried[:]
+      datetime_tz.detect_set(methods=["environ", "etc_timezone"])
+      self.assertRaises(pytz.UnknownTimeZoneError,
+                        datetime_tz.detect_timezone)
+      self.assertEqual(tried, ["environ", "etc_timezone"])
+
+      # Runs out of time after etc_timezone, so never gets to php.
+      del tried[:]
+      datetime_tz.detect_set(methods=["etc_timezone", "php"], budget=0.01,
+                             default="US/Eastern", warn=False)
+      with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        self.assertTimezoneEqual(datetime_tz.detect_timezone(),
+                                 pytz.timezone("US/Eastern"))
+      self.assertEqual(tried, ["etc_timezone"])
+      self.assertEqual(caught, [])
+
+      del tried[:]
+      datetime_tz.detect_set(methods=["etc_timezone", "php"], budget=0.01)
+      self.assertRaises(pytz.UnknownTimeZoneError,
+                        datetime_tz.detect_timezone)
+
+      datetime_tz.detect_set()
+      self.assertTimezoneEqual(datetime_tz.detect_timezone(), sydney)
+
+      self.assertRaises(ValueError, datetime_tz.detect_set, ["nothing"])
+      self.assertRaises(pytz.UnknownTimeZoneError, datetime_tz.detect_set,
+                        default="Not/AZone")
+    finally:
+      datetime_tz.detect_set()
+
+  def testDetectBudgetStopsScan(self):
+    self.mocked("datetime_tz._detect_deadline", 0)
+    self.assertTrue(datetime_tz._detect_expired())
+    self.assertEqual(datetime_tz._detect_timezone_php(), None)
+
+  def testDetectBudgetStopsLocalDatabase(self):
+    test_zonedata_sydney = os.path.join(
+        os.path.dirname(__file__), "test_zonedata_sydney")
+    tzdir = tempfile.mkdtemp()
+    try:
+      for name in ("Australia/Sydney", "Etc/Sydney"):
+        os.mkdir(os.path.join(tzdir, os.path.dirname(name)))
+        shutil.copy(test_zonedata_sydney, os.path.join(tzdir, name))
+      self.mocked("os.environ", {"TZDIR": tzdir})
+
+      # Runs out of time after loading the first directory.
+      os_walk = os.walk
+      def os_walk_slowly(dirname, *args, **kw):
+        for entry in os_walk(dirname, *args, **kw):
+          yield entry
+          if entry[2]:
+            time.sleep(0.05)
+      self.mocked("os.walk", os_walk_slowly)
+
+      def os_path_exists_fake(filename, os_path_exists=os.path.exists):
+        return filename == "/etc/localtime" or os_path_exists(filename)
+      self.mocked("os.path.exists", os_path_exists_fake)
+
+      real_open = builtins.open
+      def localtime_fake(filename, *args, **kw):
+        if filename == "/etc/localtime":
+          filename = test_zonedata_sydney
+        return real_open(filename, *args, **kw)
+      self.mocked("builtins.open", localtime_fake)
+
+      self.mocked("datetime_tz._detect_deadline",
+                  datetime_tz.instrument.timer() + 0.01)
+      self.assertEqual(datetime_tz._load_local_tzinfo(), None)
+
+      # Matching against the partial database would find Sydney from only one
+      # of its names; falling back to pytz would take more time.
+      self.mocked("pytz.all_timezones", ["Australia/Sydney"])
+      self.mocked("datetime_tz._detect_deadline",
+                  datetime_tz.instrument.timer() + 0.01)
+      self.assertEqual(datetime_tz._detect_timezone_etc_localtime(), None)
+
+      # With time, the whole database is loaded.
+      self.mocked("datetime_tz._detect_deadline", None)
+      self.assertEqual(sorted(datetime_tz._load_local_tzinfo()),
+                       ["Australia/Sydney", "Etc/Sydney"])
+    finally:
+      shutil.rmtree(tzdir)
+
   def testWindowsTimezones(self):
     if sys.platform == "win32":
       self.assertNotEqual(detect_windows._detect_timezone_windows(), None)
@@ -794,6 +992,67 @@ class TestDatetimeTZ(TestTimeZoneBase):
       self.assertTimezoneEqual(d.tzinfo, pytz.utc)
       self.assertEqual(d.totimestamp(), timestamp)
 
+  def testFromTimestampTz(self):
+    datetime_tz.localtz_set("US/Pacific")
+
+    d = datetime_tz.datetime_tz.fromtimestamp(1236493800, "Europe/London")
+    self.assertTimezoneEqual(d.tzinfo, pytz.timezone("Europe/London"))
+    self.assertEqual(str(d), "2009-03-08 06:30:00+00:00")
+
+    d = datetime_tz.datetime_tz.utcfromtimestamp(1236493800, "Asia/Tokyo")
+    self.assertEqual(str(d), "2009-03-08 15:30:00+09:00")
+
+    d = datetime_tz.datetime_tz.fromtimestamp(1236502800)
+    self.assertEqual(str(d), "2009-03-08 01:00:00-08:00")
+    self.assertFalse(d.is_dst)
+    d = datetime_tz.datetime_tz.fromtimestamp(1236506400)
+    self.assertEqual(str(d), "2009-03-08 03:00:00-07:00")
+    self.assertTrue(d.is_dst)
+
+    # Rounding to microseconds matches datetime.
+    for timestamp in (1.0000005, 1.0000015, -0.0000005, 1e9 + 0.9999996,
+                      -1234567.891):
+      d = datetime_tz.datetime_tz.utcfromtimestamp(timestamp)
+      self.assertEqual(
+          d.asdatetime(),
+          datetime.datetime.fromtimestamp(timestamp, pytz.utc).replace(
+              tzinfo=None))
+
+  def testToTimestampGap(self):
+    # The UTC time doesn't exist as a local time in the zone.
+    d = datetime_tz.datetime_tz(
+        datetime.datetime(2015, 3, 29, 4, 12, 56, 500000), "Europe/Berlin")
+    self.assertEqual(d.totimestamp(), 1427595176.5)
+    self.assertEqual(tuple(d.utctimetuple())[:6], (2015, 3, 29, 2, 12, 56))
+
+  def testToTimestampUs(self):
+    d = datetime_tz.datetime_tz(
+        datetime.datetime(2024, 5, 1, 12, 0, 0, 123457), "US/Eastern")
+    self.assertEqual(d.totimestamp_us(), 1714579200123457)
+    self.assertEqual(d.totimestamp_ns(), 1714579200123457000)
+
+    for timestamp in os_timestamp_limits:
+      d = datetime_tz.datetime_tz.utcfromtimestamp(timestamp)
+      self.assertEqual(d.totimestamp_us(), int(timestamp) * 1000000)
+
+    d = datetime_tz.datetime_tz(1900, 1, 1, 0, 0, 0, 1, "Asia/Kolkata")
+    self.assertEqual(d.totimestamp_us(),
+                     calendar.timegm(d.utctimetuple()) * 1000000 + 1)
+
+    values = [
+        datetime_tz.datetime_tz(2009, 3, 8, 1, 30, 0, 5, "US/Eastern"),
+        datetime_tz.datetime_tz(2009, 3, 8, 3, 30, 0, 5, "US/Eastern"),
+        datetime.datetime(2009, 3, 8, 3, 30, tzinfo=pytz.utc)]
+    self.assertEqual(datetime_tz.totimestamps_us(values),
+                     array.array(datetime_tz.transitions.EPOCH_TYPECODE,
+                                 [1236493800000005, 1236497400000005,
+                                  1236483000000000]))
+    self.assertEqual(list(datetime_tz.totimestamps_ns(values)),
+                     [v.totimestamp_us() * 1000 for v in values[:2]] +
+                     [1236483000000000000])
+    self.assertRaises(TypeError, datetime_tz.totimestamps_us,
+                      [datetime.datetime(2009, 1, 1)])
+
   def testUtcNow(self):
     datetime_tz.localtz_set("US/Pacific")
 
@@ -833,6 +1092,153 @@ class TestDatetimeTZ(TestTimeZoneBase):
     self.assertTrue(isinstance(d, datetime_tz.datetime_tz))
     self.assertTimezoneEqual(d.tzinfo, tz)
 
+  def testCoarseClock(self):
+    datetime_tz.localtz_set("US/Pacific")
+    pacific = pytz.timezone("US/Pacific")
+
+    now = [1236506399999999000]  # 2009-03-08 01:59:59.999999 PST
+    clock = datetime_tz.clock.CoarseClock(tick=0.001, timer=lambda: now[0])
+    cls = datetime_tz.datetime_tz
+
+    d = clock.now(cls, pacific)
+    self.assertEqual(str(d), "2009-03-08 01:59:59.999999-08:00")
+    self.assertFalse(d.is_dst)
+    self.assertTrue(clock.now(cls, pacific) is d)
+
+    # The cached offset is dropped at the DST transition.
+    now[0] += 1000
+    d = clock.now(cls, pacific)
+    self.assertEqual(str(d), "2009-03-08 03:00:00-07:00")
+    self.assertTrue(d.is_dst)
+    self.assertEqual(str(clock.now(cls, pytz.utc)), "2009-03-08 10:00:00+00:00")
+
+    datetime_tz.coarse_clock_set(tick=0)
+    try:
+      d = datetime_tz.datetime_tz.now()
+      self.assertTrue(isinstance(d, datetime_tz.datetime_tz))
+      self.assertTimezoneEqual(d.tzinfo, pacific)
+      d = datetime_tz.datetime_tz.now("Australia/Sydney")
+      self.assertTimezoneEqual(d.tzinfo, pytz.timezone("Australia/Sydney"))
+      d = datetime_tz.datetime_tz.utcnow()
+      self.assertTimezoneEqual(d.tzinfo, pytz.utc)
+    finally:
+      datetime_tz.coarse_clock_set(False)
+
+  def testUtcKey(self):
+    eastern = pytz.timezone("US/Eastern")
+    first = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 11, 1, 1, 30), eastern, is_dst=True)
+    second = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 11, 1, 1, 30), eastern, is_dst=False)
+    self.assertEqual(first.utc_us, 1257053400000000)
+    self.assertEqual(second.utc_us, first.utc_us + 3600000000)
+    self.assertTrue(first < second)
+    self.assertTrue(first <= second)
+    self.assertTrue(second > first)
+    self.assertTrue(second >= first)
+    self.assertTrue(first != second)
+
+    # The same instant in different zones
+    utc = first.astimezone(pytz.utc)
+    self.assertEqual(utc.utc_us, first.utc_us)
+    self.assertTrue(utc == first)
+    self.assertFalse(utc != first)
+    self.assertTrue(utc <= first and utc >= first)
+    self.assertEqual(hash(utc), hash(first))
+    self.assertEqual(len(set([first, utc, second])), 2)
+
+    # ... and against datetime objects.
+    plain = first.asdatetime(naive=False)
+    self.assertEqual(hash(plain), hash(first))
+    self.assertTrue(plain == first and first == plain)
+    self.assertTrue(first < second.asdatetime(naive=False))
+    self.assertFalse(first == None)  # pylint: disable=g-equals-none
+    # Python 2 refuses to compare aware and naive datetimes at all.
+    if sys.version_info >= (3,):
+      self.assertFalse(first == first.asdatetime())
+      self.assertRaises(TypeError, lambda: first < first.asdatetime())
+
+    values = [second, utc, first.astimezone("Australia/Sydney"), plain]
+    self.assertEqual([datetime_tz.sort_key(x) for x in values],
+                     [second.utc_us] + [first.utc_us] * 3)
+    self.assertEqual(sorted(values, key=datetime_tz.sort_key),
+                     [utc, first, first, second])
+    self.assertRaises(TypeError, datetime_tz.sort_key, first.asdatetime())
+    self.assertRaises(TypeError, datetime_tz.sort_key, first.utc_us)
+    self.assertRaises(TypeError, datetime_tz.sort_key, None)
+
+  def testWarmup(self):
+    timings = datetime_tz.warmup(zones=["US/Eastern", pytz.utc])
+    self.assertEqual(list(timings), ["zones", "detect", "parse"])
+    for seconds in timings.values():
+      self.assertTrue(seconds >= 0)
+
+    tables = datetime_tz.transitions._tables
+    self.assertTrue(pytz.timezone("US/Eastern") in tables)
+    self.assertTrue(pytz.timezone("Australia/Sydney") in tables)
+    self.assertTrue(datetime_tz.pytz_abbr.all._abbrs["EST"]._years)
+
+    timings = datetime_tz.warmup(detect=False, parse=False)
+    self.assertEqual(list(timings), ["zones"])
+    self.assertRaises(pytz.UnknownTimeZoneError, datetime_tz.warmup,
+                      ["Not/AZone"])
+
+  def testStats(self):
+    self.assertEqual(datetime_tz.stats(), {})
+    datetime_tz.datetime_tz(2009, 3, 8, 1, 30, tzinfo="US/Eastern")
+    self.assertEqual(datetime_tz.stats(), {})
+
+    datetime_tz.stats_set()
+    try:
+      datetime_tz.datetime_tz(2009, 3, 8, 1, 30, tzinfo="US/Eastern")
+      datetime_tz.datetime_tz(datetime.datetime(2009, 11, 1, 1, 30),
+                              "US/Eastern", is_dst=True)
+      datetime_tz.datetime_tz(
+          pytz.utc.localize(datetime.datetime(2009, 3, 8, 1, 30)))
+      stats = datetime_tz.stats(reset=True)
+      self.assertEqual(stats["new.localize"], 2)
+      self.assertEqual(stats["new.ambiguous"], 1)
+      self.assertEqual(stats["new.normalize"], 1)
+      self.assertEqual(stats["tzinfome.pytz"], 2)
+      self.assertFalse("new.calls" in stats)
+      self.assertEqual(datetime_tz.stats(), {})
+
+      datetime_tz.hot_zones_set(["Australia/Sydney"], years=(2000, 2030))
+      try:
+        datetime_tz.datetime_tz(2009, 3, 8, tzinfo="Australia/Sydney")
+      finally:
+        datetime_tz.hot_zones_set([])
+      self.assertEqual(datetime_tz.stats()["tzinfome.hot"], 1)
+    finally:
+      datetime_tz.stats_set(False)
+    self.assertEqual(datetime_tz.stats(), {})
+
+    outer = datetime_tz.stats_set(timing=True)
+    try:
+      with datetime_tz.collect_stats(timing=True) as collected:
+        datetime_tz.datetime_tz.smartparse("now", "US/Eastern")
+        datetime_tz.datetime_tz.smartparse("2 hours ago", "US/Eastern")
+        datetime_tz.datetime_tz.smartparse("start of today", "US/Eastern")
+        datetime_tz.datetime_tz.smartparse("2009-03-08 01:30 EST")
+        datetime_tz.datetime_tz.smartparse("2009-03-08 01:30 EST")
+        self.assertTrue(datetime_tz.stats())
+      self.assertTrue(datetime_tz.instrument.collector is outer)
+      self.assertEqual(outer.asdict(), {})
+    finally:
+      datetime_tz.stats_set(False)
+
+    stats = collected.asdict()
+    self.assertEqual(stats["smartparse.keyword"], 2)
+    self.assertEqual(stats["smartparse.relative"], 1)
+    self.assertEqual(stats["smartparse.startend"], 1)
+    self.assertEqual(stats["smartparse.dateutil"], 2)
+    self.assertEqual(stats["smartparse.abbreviation"], 2)
+    self.assertEqual(stats["smartparse.calls"], 5)
+    self.assertTrue(stats["smartparse.seconds"] > 0)
+    self.assertTrue(stats["new.calls"] >= 5)
+    self.assertTrue(stats["cache.abbr_year.hit"] > 0)
+    self.assertTrue(stats["cache.zone_table.hit"] > 0)
+
   def testFromOrdinal(self):
     try:
       datetime_tz.datetime_tz.fromordinal(1)
@@ -1345,6 +1751,147 @@ class TestDatetimeTZ(TestTimeZoneBase):
     self.assertEqual(def_tz.get("Made/Up", None), None)
 
 
+class TestPytzAbbr(TestTimeZoneBase):
+
+  def testTzabbrTableMatchesLocalize(self):
+    for abbr in ("EST", "EDT", "AEST", "AEDT", "BST", "GMT", "CET"):
+      tz = datetime_tz.pytz_abbr.all[abbr]
+      points = [datetime.datetime(*args) for args in self.TEST_POINTS]
+      # Add the minutes either side of the transitions.
+      for transition in getattr(tz.zone, "_utc_transition_times", []):
+        if transition.year in self.TEST_YEARS:
+          for minutes in range(-180, 181, 15):
+            points.append(transition + datetime.timedelta(minutes=minutes))
+
+      for point in points:
+        localized = tz.zone.localize(point, is_dst=tz.is_dst)
+        self.assertEqual(tz.tzname(point), localized.tzname())
+        self.assertEqual(tz.utcoffset(point), localized.utcoffset())
+        self.assertEqual(tz.dst(point), localized.dst())
+
+  def testTzabbrAmbiguous(self):
+    ambiguous = datetime.datetime(2002, 10, 27, 1, 20)
+    self.assertEqual(
+        datetime_tz.pytz_abbr.all["EST"].utcoffset(ambiguous),
+        datetime.timedelta(hours=-5))
+    self.assertEqual(
+        datetime_tz.pytz_abbr.all["EDT"].utcoffset(ambiguous),
+        datetime.timedelta(hours=-4))
+
+  def testTzinfosOffsets(self):
+    pytz_abbr = datetime_tz.pytz_abbr
+    tzinfos = pytz_abbr.tzinfos
+
+    self.assertEqual(pytz_abbr.all["EST"].offsets, frozenset([-5 * 3600]))
+    self.assertEqual(pytz_abbr.all["AEDT"].offsets, frozenset([11 * 3600]))
+    self.assertTrue("EST" in pytz_abbr.region_index("all").by_offset[-18000])
+
+    # Matching offsets keep the zone.
+    self.assertTrue(tzinfos("EST", -18000) is pytz_abbr.all["EST"])
+    self.assertTrue(tzinfos("UTC", 0) is pytz_abbr.all["UTC"])
+    self.assertTrue(tzinfos("AEDT", 39600) is pytz_abbr.all["AEDT"])
+
+    # Otherwise the abbreviation is still used, unless strict.
+    self.assertTrue(tzinfos("EST", 18000) is pytz_abbr.all["EST"])
+    self.assertTrue(tzinfos("EST", 36000) is pytz_abbr.all["EST"])
+    strict = pytz_abbr.tzinfos_create("all", strict=True)
+    self.assertTrue(strict("EST", -18000) is pytz_abbr.all["EST"])
+    self.assertTrue(strict("AEDT", 39600) is pytz_abbr.all["AEDT"])
+    self.assertRaises(ValueError, strict, "EST", 36000)
+    # The sign is the one dateutil gives, not either.
+    self.assertRaises(ValueError, strict, "EST", 18000)
+    self.assertRaises(ValueError, strict, "AEDT", -39600)
+    try:
+      strict("AEDT", 36000)
+    except ValueError as e:
+      # Lists the zones which use the offset as given.
+      self.assertTrue("'AEST'" in str(e), str(e))
+      self.assertFalse("'AEDT'" in str(e), str(e))
+    else:
+      self.fail("No ValueError")
+
+    # Offsets on their own use shared tzinfo objects.
+    self.assertTrue(tzinfos(None, 0) is pytz.utc)
+    self.assertTrue(tzinfos(None, 19800) is tzinfos(None, 19800))
+    self.assertTimezoneEqual(tzinfos(None, 19800), pytz.FixedOffset(330))
+    self.assertTimezoneEqual(tzinfos(None, 3660), pytz.FixedOffset(61))
+    self.assertTrue(tzinfos(None, None) is pytz_abbr.unknown)
+
+    d = datetime_tz.datetime_tz.smartparse("2009-11-09 23:00:00 EST+10:00")
+    self.assertEqual(str(d), "2009-11-09 23:00:00-05:00")
+
+  def testLazyRegistry(self):
+    pytz_abbr = datetime_tz.pytz_abbr
+    regions = pytz_abbr._lazy_regions(["all"])
+    self.mocked = MockMe()
+    try:
+      self.mocked("datetime_tz.pytz_abbr.regions", regions)
+      self.mocked("datetime_tz.pytz_abbr.all", regions["all"])
+      self.mocked("datetime_tz.pytz_abbr._tzabbrs", {})
+
+      pytz_abbr.tzabbr_register(
+          "XST", u"Example Standard Time", u"Example", "Asia/Kolkata", False)
+      pytz_abbr.tzabbr_register(
+          "XST", u"Other Standard Time", u"Other", "Asia/Tokyo", False)
+      self.assertRaises(
+          AssertionError, pytz_abbr.tzabbr_register,
+          "XST", u"Other Standard Time", u"Other", "Asia/Tokyo", False)
+
+      # Nothing is created until looked up.
+      self.assertTrue("XST" in regions["all"])
+      self.assertEqual(len(regions["Other"]), 1)
+      self.assertEqual(pytz_abbr._tzabbrs, {})
+
+      xst = regions["all"]["XST"]
+      self.assertEqual(xst.zone.zone, "Asia/Kolkata")
+      self.assertTrue(regions["Example"]["XST"] is xst)
+      self.assertEqual(regions["Other"]["XST"].zone.zone, "Asia/Tokyo")
+      self.assertEqual(len(pytz_abbr._tzabbrs), 2)
+      self.assertRaises(KeyError, regions.__getitem__, "Missing")
+    finally:
+      self.mocked.tearDown()
+
+  def testWarm(self):
+    pytz_abbr = datetime_tz.pytz_abbr
+    pytz_abbr.warm(1995, "Australia")
+    australia = pytz_abbr.regions["Australia"]
+    self.assertTrue(len(australia) > 1)
+    for abbr in australia:
+      self.assertTrue(1995 in australia[abbr]._years, abbr)
+    self.assertTrue(pytz_abbr.region_index("Australia")._by_offset)
+
+  def testRegisterAfterIndex(self):
+    pytz_abbr = datetime_tz.pytz_abbr
+    regions = pytz_abbr._lazy_regions(["all"])
+    self.mocked = MockMe()
+    try:
+      self.mocked("datetime_tz.pytz_abbr.regions", regions)
+      self.mocked("datetime_tz.pytz_abbr.all", regions["all"])
+      self.mocked("datetime_tz.pytz_abbr._tzabbrs", {})
+      self.mocked("datetime_tz.pytz_abbr._indexes", {})
+
+      pytz_abbr.tzabbr_register(
+          "XST", u"Example Standard Time", u"Example", "Asia/Kolkata", False)
+      strict = pytz_abbr.tzinfos_create("all", strict=True)
+      self.assertRaises(ValueError, strict, "XST", 20700)
+      self.assertFalse(20700 in pytz_abbr.region_index("all").by_offset)
+
+      # Abbreviations registered later are in the existing indexes.
+      pytz_abbr.tzabbr_register(
+          "YST", u"Other Standard Time", u"Example", "Asia/Kathmandu", False)
+      self.assertTrue(strict("YST", 20700) is regions["all"]["YST"])
+      try:
+        strict("XST", 20700)
+      except ValueError as e:
+        self.assertTrue("'YST'" in str(e), str(e))
+      else:
+        self.fail("No ValueError")
+      self.assertEqual(pytz_abbr.region_index("Example").by_offset[20700],
+                       set(["YST"]))
+    finally:
+      self.mocked.tearDown()
+
+
 class datetime_tz_test_subclass(datetime_tz.datetime_tz):
   pass
 
@@ -1451,6 +1998,1119 @@ class TestIterate(unittest.TestCase):
                               "2008/05/14 11:45", "2008/05/15 11:45"])
 
 
+  def testBetweenBlocksAroundDst(self):
+    iterate = datetime_tz.iterate
+
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 3, 8, 0, 15), "US/Eastern")
+    end = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 11, 1, 3, 0), "US/Eastern")
+    delta = datetime_tz.timedelta(minutes=45)
+
+    # Adding the delta to each value in turn gives the expected results.
+    expected = []
+    toyield = start
+    while toyield < end:
+      expected.append(toyield)
+      toyield += delta
+
+    result = list(iterate.between(start, delta, end, block_size=7))
+    self.assertEqual([repr(dt) for dt in result],
+                     [repr(dt) for dt in expected])
+    self.assertEqual([dt.is_dst for dt in result],
+                     [dt.is_dst for dt in expected])
+
+  def testBetweenOutputs(self):
+    iterate = datetime_tz.iterate
+
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 3, 8, 0, 15), "US/Eastern")
+    end = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 3, 8, 4, 15), "US/Eastern")
+
+    epochs = list(iterate.hours(start, end, output="epoch"))
+    self.assertEqual(len(epochs), 3)
+    self.assertEqual(epochs[0], 1236489300000000)
+    self.assertEqual(epochs[1] - epochs[0], 3600000000)
+
+    arrays = list(iterate.hours(start, end, output="array", block_size=2))
+    self.assertEqual([len(a) for a in arrays], [2, 1])
+    self.assertEqual(list(arrays[0]) + list(arrays[1]),
+                     list(iterate.hours(start, end)))
+    self.assertEqual(str(arrays[1][0]), "2009-03-08 03:15:00-04:00")
+
+    self.assertRaises(
+        ValueError, iterate.between, start,
+        dateutil.relativedelta.relativedelta(months=1), end, output="epoch")
+    self.assertRaises(ValueError, iterate.hours, start, end, output="bad")
+
+  def testWallclockDays(self):
+    iterate = datetime_tz.iterate
+
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 3, 7), "US/Eastern")
+    end = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 3, 10), "US/Eastern")
+
+    # Stepping by 24 hours drifts away from midnight.
+    self.assertEqual([str(dt) for dt in iterate.days(start, end)],
+                     ["2009-03-07 00:00:00-05:00", "2009-03-08 00:00:00-05:00",
+                      "2009-03-09 01:00:00-04:00"])
+    self.assertEqual(
+        [str(dt) for dt in iterate.days(start, end, wallclock=True)],
+        ["2009-03-07 00:00:00-05:00", "2009-03-08 00:00:00-05:00",
+         "2009-03-09 00:00:00-04:00"])
+
+    # Times which don't exist move forward, ambiguous times are the first.
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 3, 7, 2, 30), "US/Eastern")
+    self.assertEqual(
+        [str(dt) for dt in itertools.islice(
+            iterate.days(start, wallclock=True), 3)],
+        ["2009-03-07 02:30:00-05:00", "2009-03-08 03:30:00-04:00",
+         "2009-03-09 02:30:00-04:00"])
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 10, 31, 1, 30), "US/Eastern")
+    result = list(itertools.islice(iterate.days(start, wallclock=True), 3))
+    self.assertEqual(
+        [str(dt) for dt in result],
+        ["2009-10-31 01:30:00-04:00", "2009-11-01 01:30:00-04:00",
+         "2009-11-02 01:30:00-05:00"])
+    self.assertEqual([dt.is_dst for dt in result], [True, True, False])
+
+  def testMonthsYears(self):
+    iterate = datetime_tz.iterate
+
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2008, 1, 31, 12), "Australia/Sydney")
+    end = datetime_tz.datetime_tz(
+        datetime.datetime(2008, 5, 1), "Australia/Sydney")
+    self.assertEqual(
+        [str(dt) for dt in iterate.months(start, end)],
+        ["2008-01-31 12:00:00+11:00", "2008-02-29 12:00:00+11:00",
+         "2008-03-31 12:00:00+11:00", "2008-04-30 12:00:00+10:00"])
+
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2008, 2, 29), "US/Pacific")
+    end = datetime_tz.datetime_tz(
+        datetime.datetime(2012, 3, 1), "US/Pacific")
+    self.assertEqual(
+        [dt.strftime("%Y/%m/%d") for dt in iterate.years(start, end)],
+        ["2008/02/29", "2009/02/28", "2010/02/28", "2011/02/28",
+         "2012/02/29"])
+
+    self.assertRaises(ValueError, iterate.wallclock, start, end)
+
+  def testRange(self):
+    iterate = datetime_tz.iterate
+
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 1, 1), "US/Eastern")
+    end = datetime_tz.datetime_tz(
+        datetime.datetime(2010, 1, 1), "US/Eastern")
+    r = iterate.range(start, datetime_tz.timedelta(minutes=1), end)
+
+    self.assertEqual(len(r), 525600)
+    self.assertEqual(r[0], start)
+    self.assertEqual(str(r[-1]), "2009-12-31 23:59:00-05:00")
+    self.assertEqual(str(r[100000]), "2009-03-11 11:40:00-04:00")
+    self.assertRaises(IndexError, lambda: r[len(r)])
+
+    # The epochs are an arithmetic range, not a list, even on Python 2.
+    self.assertTrue(isinstance(r.epochs, datetime_tz.transitions.EpochRange))
+    self.assertEqual(r.epochs[::-60][1:3],
+                     datetime_tz.transitions.EpochRange(
+                         r.epochs[-61], r.epochs[-181], -3600000000))
+
+    hours = r[::60]
+    self.assertTrue(isinstance(hours, datetime_tz.DatetimeTZRange))
+    self.assertEqual(len(hours), 8760)
+    self.assertEqual(hours.delta, datetime_tz.timedelta(hours=1))
+    self.assertEqual(list(hours), list(iterate.hours(start, end)))
+    self.assertEqual(list(reversed(hours)), list(hours)[::-1])
+    self.assertEqual(list(hours[::-1]), list(hours)[::-1])
+
+    # The same instant in another timezone is in the range.
+    london = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 7, 1, 12, 5), "Europe/London")
+    self.assertTrue(london in r)
+    self.assertFalse(london in hours)
+    self.assertEqual(r.index(london), 261005)
+    self.assertEqual(r[r.index(london)], london)
+    self.assertFalse(london + datetime_tz.timedelta(seconds=1) in r)
+    self.assertRaises(ValueError, hours.index, london)
+    self.assertFalse(datetime.datetime(2009, 7, 1) in r)
+
+    self.assertEqual(len(iterate.range(end, datetime_tz.timedelta(days=1),
+                                       start)), 0)
+    self.assertEqual(len(r.toarray()), len(r))
+    self.assertRaises(ValueError, iterate.range, start,
+                      datetime_tz.timedelta(0), end)
+
+  def testSeconds(self):
+    iterate = datetime_tz.iterate
+
+    start = datetime_tz.datetime_tz(datetime.datetime(2009, 3, 8), pytz.utc)
+    end = start + datetime_tz.timedelta(seconds=3)
+    self.assertEqual([dt.second for dt in iterate.seconds(start, end)],
+                     [0, 1, 2])
+
+  def testMerge(self):
+    iterate = datetime_tz.iterate
+    hour = datetime_tz.timedelta(hours=1)
+
+    start = datetime_tz.datetime_tz(datetime.datetime(2009, 11, 1), pytz.utc)
+    eastern = [dt.astimezone("US/Eastern")
+               for dt in iterate.between(start, 2 * hour, start + 9 * hour)]
+    sydney = [dt.astimezone("Australia/Sydney")
+              for dt in iterate.between(start + hour, 3 * hour,
+                                        start + 9 * hour)]
+    utc = [start + 4 * hour]
+    merged = list(iterate.merge(eastern, iter(sydney), [], utc))
+    self.assertEqual(merged, sorted(eastern + sydney + utc))
+    self.assertEqual([x.tzinfo.zone for x in merged[:3]],
+                     ["US/Eastern", "Australia/Sydney", "US/Eastern"])
+    # The same instant comes out in the order of the streams.
+    self.assertEqual([x.tzinfo.zone for x in merged[3:6]],
+                     ["US/Eastern", "Australia/Sydney", "UTC"])
+
+    tagged = list(iterate.merge(eastern, sydney, tagged=True))
+    self.assertEqual([index for index, _ in tagged],
+                     [0, 1, 0, 0, 1, 0, 1, 0])
+    self.assertEqual([value for _, value in tagged],
+                     sorted(eastern + sydney))
+
+    records = [("b", eastern[1]), ("a", eastern[0])]
+    self.assertEqual(
+        list(iterate.merge(records[1:], records[:1], key=lambda r: r[1])),
+        [("a", eastern[0]), ("b", eastern[1])])
+
+    self.assertEqual(list(iterate.merge()), [])
+    self.assertRaises(TypeError, list, iterate.merge(eastern, keys=None))
+
+
+class TestBuckets(unittest.TestCase):
+
+  def testFloorTo(self):
+    dt = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 3, 8, 14, 35, 10), "US/Eastern")
+
+    self.assertEqual(str(datetime_tz.floor_to(dt, "hour", "US/Eastern")),
+                     "2009-03-08 14:00:00-04:00")
+    self.assertEqual(str(datetime_tz.floor_to(dt, "day", "US/Eastern")),
+                     "2009-03-08 00:00:00-05:00")
+    self.assertEqual(str(datetime_tz.floor_to(dt, "week", "US/Eastern")),
+                     "2009-03-02 00:00:00-05:00")
+    self.assertEqual(str(datetime_tz.floor_to(dt, "month", "US/Eastern")),
+                     "2009-03-01 00:00:00-05:00")
+    self.assertEqual(str(datetime_tz.floor_to(dt, "year", "Asia/Kolkata")),
+                     "2009-01-01 00:00:00+05:30")
+    self.assertEqual(str(datetime_tz.floor_to(dt, "hour", "Asia/Kolkata")),
+                     "2009-03-09 00:00:00+05:30")
+
+    # Midnight doesn't exist in Sao Paulo when DST starts.
+    dt = datetime_tz.datetime_tz(
+        datetime.datetime(2008, 10, 19, 12), "America/Sao_Paulo")
+    self.assertEqual(
+        str(datetime_tz.floor_to(dt, "day", "America/Sao_Paulo")),
+        "2008-10-19 01:00:00-02:00")
+
+    # Epoch microseconds and sequences of them.
+    epoch_us = 1236537310000000  # 2009-03-08 14:35:10 EDT
+    self.assertEqual(datetime_tz.floor_to(epoch_us, "day", "US/Eastern"),
+                     1236488400000000)
+    self.assertEqual(
+        datetime_tz.floor_to([epoch_us, epoch_us + 1], "hour", "UTC"),
+        [1236535200000000, 1236535200000000])
+    typecode = datetime_tz.transitions.EPOCH_TYPECODE
+    values = array.array(typecode, [epoch_us])
+    self.assertEqual(datetime_tz.floor_to(values, "day", "US/Eastern"),
+                     array.array(typecode, [1236488400000000]))
+    values = datetime_tz.DatetimeTZArray.fromepochs([epoch_us])
+    self.assertEqual(
+        [str(x) for x in datetime_tz.floor_to(values, "day", "US/Eastern")],
+        ["2009-03-08 00:00:00-05:00"])
+
+    self.assertRaises(ValueError, datetime_tz.floor_to, dt, "fortnight")
+    self.assertRaises(TypeError, datetime_tz.floor_to,
+                      datetime.datetime(2009, 1, 1), "day", "UTC")
+
+  def testRepeatedHour(self):
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 11, 1, 0, 30), "US/Eastern")
+    stream = list(datetime_tz.iterate.minutes(
+        start, start + datetime_tz.timedelta(hours=3)))
+
+    groups = list(datetime_tz.group_by_local(stream, "hour", "US/Eastern"))
+    self.assertEqual([str(bucket) for bucket, _ in groups],
+                     ["2009-11-01 00:00:00-04:00", "2009-11-01 01:00:00-04:00",
+                      "2009-11-01 01:00:00-05:00", "2009-11-01 02:00:00-05:00"])
+    self.assertEqual([len(values) for _, values in groups], [30, 60, 60, 30])
+    self.assertEqual(groups[0][1][0], start)
+
+  def testGroupByDay(self):
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 3, 7), "US/Eastern")
+    stream = datetime_tz.iterate.hours(
+        start, start + datetime_tz.timedelta(days=3), output="epoch")
+
+    groups = list(datetime_tz.group_by_local(stream, "day", "US/Eastern"))
+    self.assertEqual([bucket.day for bucket, _ in groups], [7, 8, 9, 10])
+    self.assertEqual([len(values) for _, values in groups], [24, 23, 24, 1])
+
+
+class TestTimeIndex(unittest.TestCase):
+
+  def setUp(self):
+    # Every 30 minutes over the start of DST in Sydney and the end in
+    # US/Eastern, in a mix of zones.
+    start = datetime_tz.datetime_tz(datetime.datetime(2009, 10, 3), pytz.utc)
+    zones = ["US/Eastern", "Australia/Sydney", "UTC"]
+    self.values = [
+        dt.astimezone(zones[i % 3]) for i, dt in enumerate(
+            datetime_tz.iterate.between(
+                start, datetime_tz.timedelta(minutes=30),
+                start + datetime_tz.timedelta(days=31)))]
+    random.Random(0).shuffle(self.values)
+    self.index = datetime_tz.TimeIndex(self.values)
+
+  def assertLocal(self, result, tz, test):
+    tz = pytz.timezone(tz)
+    expected = sorted(v for v in self.values if test(v.astimezone(tz)))
+    self.assertEqual(result, expected)
+    self.assertTrue(result)
+
+  def testBetween(self):
+    self.assertEqual(len(self.index), len(self.values))
+    self.assertEqual(list(self.index), sorted(self.values))
+
+    start = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 10, 5, 10, 15), "Europe/London")
+    end = start + datetime_tz.timedelta(hours=2)
+    self.assertEqual(self.index.between(start, end),
+                     sorted(v for v in self.values if start <= v < end))
+    self.assertEqual(self.index.between(start.utc_us, end.utc_us),
+                     self.index.between(start, end))
+
+  def testLocalDay(self):
+    # 25 hours long
+    day = datetime.date(2009, 11, 1)
+    result = self.index.local_day(day, "US/Eastern")
+    self.assertEqual(len(result), 50)
+    self.assertLocal(result, "US/Eastern", lambda v: v.date() == day)
+
+    # 23 hours long
+    day = datetime.date(2009, 10, 4)
+    result = self.index.local_day(day, "Australia/Sydney")
+    self.assertEqual(len(result), 46)
+    self.assertLocal(result, "Australia/Sydney", lambda v: v.date() == day)
+
+    result = self.index.local_between(
+        datetime.datetime(2009, 11, 1, 1, 0), datetime.date(2009, 11, 2),
+        "US/Eastern")
+    self.assertEqual(len(result), 50 - 2)
+
+  def testDaily(self):
+    nine, five = datetime.time(9), datetime.time(17)
+    result = self.index.daily(nine, five, "Australia/Sydney")
+    self.assertLocal(result, "Australia/Sydney",
+                     lambda v: nine <= v.time() < five)
+
+    # Overnight, and only for some days
+    ten, six = datetime.time(22), datetime.time(6)
+    result = self.index.daily(ten, six, "US/Eastern",
+                              first=datetime.date(2009, 10, 31),
+                              last=datetime.date(2009, 11, 1))
+    self.assertLocal(
+        result, "US/Eastern",
+        lambda v: (datetime.datetime(2009, 10, 31, 22) <= v.asdatetime() <
+                   datetime.datetime(2009, 11, 2, 6) and
+                   not six <= v.time() < ten))
+    self.assertEqual(len(self.index.daily(ten, six, "US/Eastern")),
+                     len([v for v in self.values if not six <=
+                          v.astimezone("US/Eastern").time() < ten]))
+
+  def testPayloads(self):
+    epochs = [3, 1, 2]
+    index = datetime_tz.TimeIndex(epochs, payloads=["c", "a", "b"])
+    self.assertEqual(list(index.epochs), [1, 2, 3])
+    self.assertEqual(list(index), ["a", "b", "c"])
+    index.add(2, "b2")
+    index.add(0)
+    self.assertEqual(list(index), [0, "a", "b", "b2", "c"])
+    self.assertEqual(index.between(2, 3), ["b", "b2"])
+
+    self.assertRaises(ValueError, datetime_tz.TimeIndex, epochs, ["a"])
+    self.assertRaises(TypeError, datetime_tz.TimeIndex,
+                      [datetime.datetime(2009, 1, 1)])
+    self.assertRaises(TypeError, index.local_between,
+                      self.values[0], self.values[1], "UTC")
+
+
+class TestIntervals(unittest.TestCase):
+
+  def time(self, hour, minute=0, tz="US/Eastern"):
+    return datetime_tz.datetime_tz(
+        datetime.datetime(2009, 11, 1, hour, minute), tz, is_dst=True)
+
+  def testTimeRange(self):
+    TimeRange = datetime_tz.TimeRange  # pylint: disable=invalid-name
+
+    # Over the end of DST, so 3 hours long.
+    r = TimeRange(self.time(0), self.time(2))
+    self.assertEqual(r.duration, datetime.timedelta(hours=3))
+    self.assertEqual(r.end_us - r.start_us, 3 * 3600 * 1000000)
+    self.assertTrue(self.time(1, 59) in r)
+    self.assertFalse(self.time(2) in r)
+    self.assertTrue(self.time(0).astimezone("Australia/Sydney") in r)
+    self.assertTrue(r)
+    self.assertFalse(TimeRange(self.time(1), self.time(1)))
+    self.assertRaises(ValueError, TimeRange, self.time(2), self.time(1))
+    self.assertRaises(TypeError, TimeRange, datetime.datetime(2009, 1, 1),
+                      self.time(1))
+
+    other = TimeRange(self.time(1).astimezone("UTC"), self.time(4))
+    self.assertTrue(r.overlaps(other) and other.overlaps(r))
+    self.assertEqual(r.intersection(other), TimeRange(self.time(1),
+                                                      self.time(2)))
+    self.assertTrue(r.intersection(other) in r)
+    self.assertFalse(other in r)
+    later = TimeRange(self.time(2), self.time(3))
+    self.assertFalse(r.overlaps(later))
+    self.assertEqual(r.intersection(later), None)
+
+    self.assertEqual(TimeRange(self.time(0).astimezone("UTC"), self.time(2)),
+                     r)
+    self.assertEqual(len(set([r, TimeRange(self.time(0), self.time(2)),
+                              later])), 2)
+
+  def testQueryAfterAdd(self):
+    TimeRange = datetime_tz.TimeRange  # pylint: disable=invalid-name
+    r = TimeRange(self.time(0), self.time(2))
+    later = TimeRange(self.time(2), self.time(3))
+
+    # The first query after creating or adding builds the index.
+    self.assertEqual(datetime_tz.IntervalIndex([r], ["x"]).overlapping(r),
+                     ["x"])
+    self.assertEqual(datetime_tz.IntervalIndex([r], ["x"]).at(self.time(1)),
+                     ["x"])
+    index = datetime_tz.IntervalIndex([r], ["x"])
+    self.assertEqual(index.at(self.time(1)), ["x"])
+    index.add(later, "y")
+    self.assertEqual(index.overlapping(self.time(1), self.time(3)),
+                     ["x", "y"])
+    index.add(r, "z")
+    self.assertEqual(index.at(self.time(1)), ["x", "z"])
+
+    # Epoch microseconds work wherever a datetime does.
+    epoch_us = self.time(1).utc_us
+    self.assertTrue(epoch_us in r)
+    self.assertFalse(later.end_us in later)
+    self.assertEqual(index.at(epoch_us), ["x", "z"])
+    self.assertEqual(index.overlapping(later.start_us, later.end_us), ["y"])
+
+  def testIntervalIndex(self):
+    TimeRange = datetime_tz.TimeRange  # pylint: disable=invalid-name
+    rand = random.Random(0)
+    start = self.time(0)
+    ranges = []
+    for _ in range(500):
+      begin = start + datetime_tz.timedelta(minutes=rand.randint(0, 2000))
+      length = datetime_tz.timedelta(minutes=rand.choice([0, 15, 60, 600]))
+      ranges.append(TimeRange(begin, (begin + length).astimezone(
+          rand.choice(["UTC", "Asia/Kolkata", "US/Eastern"]))))
+
+    index = datetime_tz.IntervalIndex(ranges[:400], payloads=range(400))
+    for i, r in enumerate(ranges[400:]):
+      index.add(r, 400 + i)
+    self.assertEqual(len(index), 500)
+    self.assertEqual(sorted(index), list(range(500)))
+
+    for _ in range(50):
+      begin = start + datetime_tz.timedelta(minutes=rand.randint(-100, 2100))
+      query = TimeRange(begin, begin + datetime_tz.timedelta(
+          minutes=rand.randint(0, 120)))
+      result = index.overlapping(query)
+      self.assertEqual(sorted(result),
+                       [i for i, r in enumerate(ranges) if r.overlaps(query)])
+      self.assertEqual(result, index.overlapping(query.start, query.end))
+      self.assertEqual([ranges[i].start_us for i in result],
+                       sorted(ranges[i].start_us for i in result))
+
+      self.assertEqual(
+          sorted(index.at(begin)),
+          [i for i, r in enumerate(ranges) if begin in r])
+
+      parts = index.intersections(query)
+      self.assertEqual([p for _, p in parts], result)
+      for part, i in parts:
+        self.assertEqual(part, ranges[i].intersection(query))
+
+      free = index.free(query)
+      for gap in free:
+        self.assertEqual(index.overlapping(gap), [])
+        self.assertTrue(gap in query)
+        self.assertEqual(gap.start.tzinfo.zone, "US/Eastern")
+      # The gaps and the busy parts cover the whole query.
+      covered = 0
+      cursor = query.start_us
+      for part, _ in parts:
+        covered += max(part.end_us - max(part.start_us, cursor), 0)
+        cursor = max(cursor, part.end_us)
+      self.assertEqual(
+          covered + sum(gap.end_us - gap.start_us for gap in free),
+          query.end_us - query.start_us)
+
+
+class TestCompiledZone(unittest.TestCase):
+
+  def tearDown(self):
+    datetime_tz.hot_zones_set([])
+
+  def assertSameLocalize(self, pytz_zone, compiled_zone, dt):
+    for is_dst in (None, True, False):
+      try:
+        expected = pytz_zone.localize(dt, is_dst)
+      except pytz.InvalidTimeError as e:
+        self.assertRaises(type(e), compiled_zone.localize, dt, is_dst)
+        continue
+      actual = compiled_zone.localize(dt, is_dst)
+      self.assertEqual(
+          (actual.utcoffset(), actual.dst(), actual.tzname()),
+          (expected.utcoffset(), expected.dst(), expected.tzname()))
+
+  def testMatchesPytz(self):
+    for zone in ("US/Eastern", "Australia/Lord_Howe", "Europe/London"):
+      pytz_zone = pytz.timezone(zone)
+      for years in (None, (2005, 2010)):
+        compiled_zone = datetime_tz.compile_zone(zone, years)
+        self.assertTrue(isinstance(compiled_zone,
+                                   datetime_tz.compiled.CompiledTzInfo))
+        self.assertEqual(compiled_zone.zone, zone)
+
+        dt = datetime.datetime(2003, 1, 1)
+        while dt < datetime.datetime(2012, 1, 1):
+          self.assertSameLocalize(pytz_zone, compiled_zone, dt)
+          expected = pytz_zone.fromutc(dt)
+          actual = compiled_zone.fromutc(dt)
+          self.assertEqual(actual.replace(tzinfo=None),
+                           expected.replace(tzinfo=None))
+          self.assertEqual(actual.tzname(), expected.tzname())
+          dt += datetime.timedelta(hours=17, minutes=15)
+
+    eastern = datetime_tz.compile_zone("US/Eastern")
+    self.assertTrue(datetime_tz.compile_zone("US/Eastern") is eastern)
+    self.assertTrue(datetime_tz.compile_zone("UTC") is pytz.utc)
+
+    # The DST transitions
+    self.assertRaises(pytz.NonExistentTimeError, eastern.localize,
+                      datetime.datetime(2009, 3, 8, 2, 30), None)
+    self.assertRaises(pytz.AmbiguousTimeError, eastern.localize,
+                      datetime.datetime(2009, 11, 1, 1, 30), None)
+    d = eastern.localize(datetime.datetime(2009, 11, 1, 1, 30), is_dst=True)
+    self.assertEqual(d.tzname(), "EDT")
+    d = eastern.normalize(d + datetime.timedelta(hours=1))
+    self.assertEqual(str(d), "2009-11-01 01:30:00-05:00")
+
+  def testHotZones(self):
+    datetime_tz.hot_zones_set(["US/Eastern"], years=(2000, 2030))
+    eastern = datetime_tz.compile_zone("US/Eastern", (2000, 2030))
+
+    d = datetime_tz.datetime_tz(datetime.datetime(2009, 3, 8, 3), "US/Eastern")
+    self.assertTrue(d.tzinfo._data is eastern._data)
+    self.assertEqual(str(d), "2009-03-08 03:00:00-04:00")
+    self.assertTrue(d.is_dst)
+    d = d.replace(hour=1)
+    self.assertEqual(str(d), "2009-03-08 01:00:00-05:00")
+    self.assertTrue(d.tzinfo._data is eastern._data)
+
+    d = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 7, 1, 12), "UTC").astimezone(
+            pytz.timezone("US/Eastern"))
+    self.assertEqual(str(d), "2009-07-01 08:00:00-04:00")
+    self.assertTrue(d.tzinfo._data is eastern._data)
+    self.assertEqual(pickle.loads(pickle.dumps(d)), d)
+    self.assertTrue(pickle.loads(pickle.dumps(d)).tzinfo is d.tzinfo)
+
+    days = list(datetime_tz.iterate.days(
+        d, d + datetime_tz.timedelta(days=2)))
+    self.assertEqual([str(x) for x in days],
+                     ["2009-07-01 08:00:00-04:00", "2009-07-02 08:00:00-04:00"])
+
+    datetime_tz.hot_zones_set([])
+    d = datetime_tz.datetime_tz(datetime.datetime(2009, 3, 8, 3), "US/Eastern")
+    self.assertFalse(isinstance(d.tzinfo, datetime_tz.compiled.CompiledTzInfo))
+
+
+class TestPosixTz(unittest.TestCase):
+
+  def assertMatchesPytz(self, rule, zone, first, last):
+    pytz_zone = pytz.timezone(zone)
+    posix_zone = datetime_tz.compile_rule(rule)
+    table = datetime_tz.transitions.zone_table(posix_zone)
+    dt = first
+    while dt < last:
+      for is_dst in (None, True, False):
+        try:
+          expected = pytz_zone.localize(dt, is_dst)
+        except pytz.InvalidTimeError as e:
+          self.assertRaises(type(e), posix_zone.localize, dt, is_dst)
+          continue
+        actual = posix_zone.localize(dt, is_dst)
+        self.assertEqual(
+            (actual.utcoffset(), actual.dst(), actual.tzname()),
+            (expected.utcoffset(), expected.dst(), expected.tzname()))
+
+      expected = pytz_zone.fromutc(dt)
+      actual = posix_zone.fromutc(dt)
+      self.assertEqual(actual.replace(tzinfo=None),
+                       expected.replace(tzinfo=None))
+      self.assertEqual(actual.tzname(), expected.tzname())
+      utc_us = datetime_tz.transitions.naive_us(dt)
+      self.assertEqual(table.utcoffset_us(utc_us),
+                       datetime_tz.transitions.timedelta_us(
+                           actual.utcoffset()))
+      dt += datetime.timedelta(hours=7, minutes=45)
+
+  def testMatchesPytz(self):
+    self.assertMatchesPytz("EST5EDT,M3.2.0,M11.1.0", "US/Eastern",
+                           datetime.datetime(2008, 1, 1),
+                           datetime.datetime(2011, 1, 1))
+    # Southern hemisphere, with the end at 3am.
+    self.assertMatchesPytz("AEST-10AEDT,M10.1.0,M4.1.0/3", "Australia/Sydney",
+                           datetime.datetime(2009, 1, 1),
+                           datetime.datetime(2011, 1, 1))
+    # Quoted names and negative times.
+    self.assertMatchesPytz("<-01>1<+00>,M3.5.0/0,M10.5.0/1",
+                           "Atlantic/Azores", datetime.datetime(2009, 1, 1),
+                           datetime.datetime(2011, 1, 1))
+    # Times past midnight.
+    self.assertMatchesPytz("IST-2IDT,M3.4.4/26,M10.5.0", "Asia/Jerusalem",
+                           datetime.datetime(2020, 1, 1),
+                           datetime.datetime(2022, 1, 1))
+    # No daylight saving at all.
+    self.assertMatchesPytz("<+0330>-3:30", "Asia/Tehran",
+                           datetime.datetime(2023, 1, 1),
+                           datetime.datetime(2023, 6, 1))
+
+  def testRule(self):
+    rule = datetime_tz.posixtz.PosixRule("AEST-10AEDT,M10.1.0,M4.1.0/3")
+    self.assertEqual((rule.std_name, rule.dst_name), ("AEST", "AEDT"))
+    self.assertEqual(rule.std_offset, 10 * 3600 * 1000000)
+    self.assertEqual(rule.dst_offset, 11 * 3600 * 1000000)
+    self.assertEqual(rule.start, ("M", (10, 1, 0), 2 * 3600 * 1000000))
+    self.assertEqual(rule.end, ("M", (4, 1, 0), 3 * 3600 * 1000000))
+
+    # Without the rules, the US ones are used.
+    rule = datetime_tz.posixtz.PosixRule("CST6CDT")
+    self.assertEqual(rule.start, ("M", (3, 2, 0), 2 * 3600 * 1000000))
+
+    def transitions(rule, year):
+      return [(str(datetime_tz.transitions.us_naive(utc_us)), dst)
+              for utc_us, dst in
+              datetime_tz.posixtz.PosixRule(rule).year_transitions(year)]
+
+    # Julian days skip February 29, zero based days don't.
+    self.assertEqual(transitions("XST3XDT,J60,J300", 2008), [
+        ("2008-03-01 05:00:00", True), ("2008-10-27 04:00:00", False)])
+    self.assertEqual(transitions("XST3XDT,59,299", 2008), [
+        ("2008-02-29 05:00:00", True), ("2008-10-26 04:00:00", False)])
+    self.assertEqual(transitions("XST3XDT,59,299", 2009), [
+        ("2009-03-01 05:00:00", True), ("2009-10-27 04:00:00", False)])
+    # Week 5 means the last one in the month.
+    self.assertEqual(transitions("XST3XDT,M2.5.0,M10.5.6", 2009), [
+        ("2009-02-22 05:00:00", True), ("2009-10-31 04:00:00", False)])
+
+    for invalid in ("", "EST", "ES5", "EST5EDT,M13.1.0,M11.1.0",
+                    "EST5EDT,M3.6.0,M11.1.0", "EST5EDT,J0,J100",
+                    "EST5EDT,M3.2.0", "EST25", "Not/AZone"):
+      self.assertRaises(ValueError, datetime_tz.compile_rule, invalid)
+
+  def testPermanentDST(self):
+    eastern = datetime_tz.compile_rule("EST5EDT4,0/0,J365/25")
+    for dt in (datetime.datetime(2009, 1, 1), datetime.datetime(2009, 7, 1),
+               datetime.datetime(2009, 12, 31, 23, 59)):
+      self.assertEqual(eastern.fromutc(dt).tzname(), "EDT")
+      self.assertEqual(eastern.localize(dt, is_dst=None).tzname(), "EDT")
+
+  def testDatetimeTZ(self):
+    rule = "EST5EDT,M3.2.0,M11.1.0"
+    eastern = datetime_tz.compile_rule(rule)
+    self.assertTrue(datetime_tz.compile_rule(rule) is eastern)
+    self.assertEqual(eastern.zone, rule)
+
+    d = datetime_tz.datetime_tz(datetime.datetime(2009, 3, 8, 3), rule)
+    self.assertTrue(d.tzinfo._data is eastern._data)
+    self.assertEqual(str(d), "2009-03-08 03:00:00-04:00")
+    self.assertTrue(d.is_dst)
+    self.assertEqual(str(d.replace(hour=1)), "2009-03-08 01:00:00-05:00")
+    self.assertEqual(d.totimestamp(), 1236495600)
+    self.assertRaises(pytz.AmbiguousTimeError, datetime_tz.datetime_tz,
+                      datetime.datetime(2009, 11, 1, 1, 30), rule)
+
+    d = datetime_tz.datetime_tz(
+        datetime.datetime(2009, 7, 1, 12), "UTC").astimezone(rule)
+    self.assertEqual(str(d), "2009-07-01 08:00:00-04:00")
+    self.assertEqual(pickle.loads(pickle.dumps(d)), d)
+    self.assertTrue(pickle.loads(pickle.dumps(d)).tzinfo is d.tzinfo)
+    self.assertEqual(
+        str(datetime_tz.datetime_tz.fromtimestamp(1236495600, rule)),
+        "2009-03-08 03:00:00-04:00")
+
+    self.assertRaises(pytz.UnknownTimeZoneError, datetime_tz.datetime_tz,
+                      datetime.datetime(2009, 3, 8), "Not/AZone")
+    # Typos which look like a rule without DST aren't turned into one.
+    for typo in ("Foo3", "ABC-2", "EST5", "US/Easten"):
+      self.assertRaises(pytz.UnknownTimeZoneError, datetime_tz._tzinfome,
+                        typo)
+      self.assertRaises(pytz.UnknownTimeZoneError, datetime_tz.datetime_tz,
+                        datetime.datetime(2009, 3, 8), typo)
+    self.assertRaises(pytz.UnknownTimeZoneError, datetime_tz._tzinfome,
+                      "EST5EDT,M13.1.0,M11.1.0")
+
+  def testOutsideTableYears(self):
+    rule = "EST5EDT,M3.2.0,M11.1.0"
+    first, last = datetime_tz.posixtz.TABLE_YEARS
+    for year in (first - 100, first, last, last + 100):
+      for month in (1, 7):
+        local = datetime_tz.datetime_tz(
+            datetime.datetime(year, month, 1, 12), rule)
+        utc = local.astimezone("UTC")
+        self.assertEqual(utc.astimezone(rule), local)
+        self.assertEqual(str(utc.astimezone(rule)), str(local))
+        self.assertEqual(
+            datetime_tz.compile_rule(rule).fromutc(utc.asdatetime()),
+            utc.astimezone(rule))
+      # The rule is followed inside the years, and stays as it was at the
+      # ends outside them.
+      summer = datetime_tz.datetime_tz(
+          datetime.datetime(year, 7, 1, 12), rule)
+      self.assertEqual(summer.is_dst, first <= year <= last)
+
+  def testDetect(self):
+    old_environ = dict(os.environ)
+    try:
+      os.environ["TZ"] = "AEST-10AEDT,M10.1.0,M4.1.0/3"
+      tzinfo = datetime_tz._detect_timezone_environ()
+      self.assertTrue(tzinfo is datetime_tz.compile_rule(os.environ["TZ"]))
+      # Zone names still come from pytz.
+      os.environ["TZ"] = "EST5EDT"
+      self.assertTrue(datetime_tz._detect_timezone_environ() is
+                      pytz.timezone("EST5EDT"))
+    finally:
+      os.environ.clear()
+      os.environ.update(old_environ)
+
+
+@unittest.skipIf(sys.version_info >= (3,), "Python 2 only")
+class TestZoneDBPython2(unittest.TestCase):
+
+  def testZoneDBSet(self):
+    self.assertRaises(NotImplementedError, datetime_tz.zonedb_set)
+    self.assertEqual(datetime_tz._zonedb, None)
+    self.assertEqual(datetime_tz.zonedb_set(False), None)
+
+    from datetime_tz import zonedb  # pylint: disable=g-import-not-at-top
+    self.assertRaises(NotImplementedError, zonedb.build,
+                      os.path.join(tempfile.gettempdir(), "unused.db"))
+
+
+@unittest.skipIf(sys.version_info < (3,), "Needs memoryview.cast")
+class TestZoneDB(unittest.TestCase):
+
+  def setUp(self):
+    self.tempdir = tempfile.mkdtemp()
+    self.path = os.path.join(self.tempdir, "zones.db")
+
+  def tearDown(self):
+    datetime_tz.zonedb_set(False)
+    shutil.rmtree(self.tempdir)
+
+  def testBuild(self):
+    from datetime_tz import zonedb  # pylint: disable=g-import-not-at-top
+    zones = ["US/Eastern", "America/New_York", "Australia/Lord_Howe", "UTC"]
+    self.assertEqual(zonedb.build(self.path, zones), self.path)
+    umask = os.umask(0o022)
+    try:
+      # Readable by other users, and replacing an existing database works.
+      self.assertEqual(zonedb.build(self.path, zones), self.path)
+    finally:
+      os.umask(umask)
+    self.assertEqual(os.stat(self.path).st_mode & 0o777, 0o644)
+
+    db = zonedb.ZoneDB(self.path)
+    self.assertEqual(db.version, pytz.OLSON_VERSION)
+    # Zones with a single offset aren't stored.
+    self.assertEqual(db.names(),
+                     ["America/New_York", "Australia/Lord_Howe", "US/Eastern"])
+    self.assertFalse("UTC" in db)
+    self.assertEqual(db.zone("UTC"), None)
+    self.assertEqual(db.zone("Europe/London"), None)
+    self.assertTrue(db.zone("US/Eastern") is db.zone("US/Eastern"))
+
+    for zone in ("US/Eastern", "Australia/Lord_Howe"):
+      pytz_zone = pytz.timezone(zone)
+      db_zone = db.zone(zone)
+      self.assertEqual(db_zone.zone, zone)
+      dt = datetime.datetime(2005, 1, 1)
+      while dt < datetime.datetime(2011, 1, 1):
+        expected = pytz_zone.fromutc(dt)
+        actual = db_zone.fromutc(dt)
+        self.assertEqual(actual.replace(tzinfo=None),
+                         expected.replace(tzinfo=None))
+        self.assertEqual(actual.tzname(), expected.tzname())
+        expected = pytz_zone.localize(dt, is_dst=False)
+        actual = db_zone.localize(dt, is_dst=False)
+        self.assertEqual(actual.utcoffset(), expected.utcoffset())
+        dt += datetime.timedelta(hours=17, minutes=15)
+
+    self.assertRaises(ValueError, zonedb.ZoneDB, __file__)
+
+    # The temporary file is removed whatever interrupts the build.
+    def rename_interrupted(src, dst):
+      raise KeyboardInterrupt()
+    mocked = MockMe()
+    try:
+      mocked("os.rename", rename_interrupted)
+      mocked("os.replace", rename_interrupted)
+      self.assertRaises(KeyboardInterrupt, zonedb.build,
+                        os.path.join(self.tempdir, "other.db"), zones)
+    finally:
+      mocked.tearDown()
+    self.assertEqual(os.listdir(self.tempdir), ["zones.db"])
+
+  def testOpenDB(self):
+    from datetime_tz import zonedb  # pylint: disable=g-import-not-at-top
+    self.assertRaises((IOError, OSError), zonedb.open_db, self.path, False)
+    db = zonedb.open_db(self.path)
+    self.assertEqual(db.version, pytz.OLSON_VERSION)
+    self.assertTrue("Europe/London" in db)
+
+    # A database for another tzdata version is rebuilt.
+    zonedb.build(self.path, ["US/Eastern"])
+    olson_version = pytz.OLSON_VERSION
+    pytz.OLSON_VERSION = "1970a"
+    try:
+      self.assertRaises(ValueError, zonedb.open_db, self.path, False)
+      db = zonedb.open_db(self.path)
+    finally:
+      pytz.OLSON_VERSION = olson_version
+    self.assertEqual(db.version, "1970a")
+    self.assertTrue("Europe/London" in db)
+
+  def testZoneDBSet(self):
+    db = datetime_tz.zonedb_set(path=self.path)
+    self.assertTrue(os.path.exists(self.path))
+
+    d = datetime_tz.datetime_tz(datetime.datetime(2009, 3, 8, 3), "US/Eastern")
+    self.assertTrue(d.tzinfo._data is db.zone("US/Eastern")._data)
+    self.assertEqual(str(d), "2009-03-08 03:00:00-04:00")
+    d = d.replace(hour=1)
+    self.assertEqual(str(d), "2009-03-08 01:00:00-05:00")
+    self.assertEqual(pickle.loads(pickle.dumps(d)), d)
+    # Unpickled values share the database's tables.
+    self.assertTrue(pickle.loads(pickle.dumps(d.tzinfo)) is d.tzinfo)
+    aware = d.asdatetime(naive=False)
+    self.assertTrue(pickle.loads(pickle.dumps(aware)).tzinfo is d.tzinfo)
+
+    hours = list(datetime_tz.iterate.hours(
+        d, d + datetime_tz.timedelta(hours=3)))
+    self.assertEqual([str(x) for x in hours],
+                     ["2009-03-08 01:00:00-05:00", "2009-03-08 03:00:00-04:00",
+                      "2009-03-08 04:00:00-04:00"])
+
+    datetime_tz.zonedb_set(False)
+    d = datetime_tz.datetime_tz(datetime.datetime(2009, 3, 8, 3), "US/Eastern")
+    self.assertFalse(isinstance(d.tzinfo, datetime_tz.compiled.CompiledTzInfo))
+
+
+class TestFormatParser(unittest.TestCase):
+
+  def setUp(self):
+    datetime_tz.localtz_set("Australia/Sydney")
+
+  def assertSameAsSmartparse(self, values, expected_format):
+    parser = datetime_tz.FormatParser(samples=5)
+    for value in values:
+      expected = datetime_tz.datetime_tz.smartparse(value)
+      self.assertEqual(repr(parser.parse(value)), repr(expected))
+    stats = parser.stats()
+    self.assertEqual(stats["format"], expected_format)
+    self.assertEqual(stats["samples"], 5)
+    return stats
+
+  def testCompileFormat(self):
+    regex = datetime_tz.inference.compile_format("%Y-%m-%d %H:%M:%S %Z")
+    m = regex.match("2009-11-09 23:00:00 EST")
+    self.assertEqual(m.group("year"), "2009")
+    self.assertEqual(m.group("abbr"), "EST")
+    self.assertEqual(regex.match("2009-11-09"), None)
+    self.assertRaises(
+        ValueError, datetime_tz.inference.compile_format, "%Q")
+
+  def testInferFormat(self):
+    stats = self.assertSameAsSmartparse(
+        ["2009-11-09 23:%02d:00" % i for i in range(10)],
+        "%Y-%m-%d %H:%M:%S")
+    self.assertEqual(stats["fast"], 5)
+    self.assertEqual(stats["fallback"], 0)
+
+    self.assertSameAsSmartparse(
+        ["2009-11-09T23:%02d:00.25+08:00" % i for i in range(10)],
+        "%Y-%m-%dT%H:%M:%S.%f%z")
+    self.assertSameAsSmartparse(
+        ["2009-11-09 23:%02d:00Z" % i for i in range(10)],
+        "%Y-%m-%d %H:%M:%S%z")
+    self.assertSameAsSmartparse(
+        ["Mon Nov 09 23:%02d:00 EST 2009" % i for i in range(10)],
+        "%a %b %d %H:%M:%S %Z %Y")
+    self.assertSameAsSmartparse(
+        ["2009-11-09 23:%02d:00 EST-05:00" % i for i in range(10)],
+        "%Y-%m-%d %H:%M:%S %Z%z")
+
+  def testAbbreviationDst(self):
+    # The abbreviation picks which of the ambiguous times is meant.
+    values = ["2002-10-27 01:%02d:00 %s" % (i, abbr)
+              for i in range(10) for abbr in ("EST", "EDT")]
+    self.assertSameAsSmartparse(values, "%Y-%m-%d %H:%M:%S %Z")
+
+  def testFallback(self):
+    values = ["2009-11-09 23:%02d:00" % i for i in range(10)]
+    values += ["yesterday", "Nov 9th 2009", "2009-02-30 00:00:00"]
+    parser = datetime_tz.FormatParser(samples=5)
+    for value in values[:-1]:
+      parser.parse(value)
+    self.assertRaises(ValueError, parser.parse, values[-1])
+
+    stats = parser.stats()
+    self.assertEqual(stats["format"], "%Y-%m-%d %H:%M:%S")
+    self.assertEqual(stats["fast"], 5)
+    self.assertEqual(stats["fallback"], 3)
+
+  def testNoFormat(self):
+    parser = datetime_tz.FormatParser(samples=2)
+    parser.parse("yesterday")
+    parser.parse("today")
+    parser.parse("tomorrow")
+    self.assertEqual(parser.stats()["format"], None)
+    self.assertEqual(parser.stats()["fallback"], 1)
+
+
+@unittest.skipIf(sys.version_info < (3, 6), "asyncio support needs 3.6+")
+class TestAsyncParse(unittest.TestCase):
+
+  def setUp(self):
+    datetime_tz.localtz_set("Australia/Sydney")
+    self.loop = asyncio.new_event_loop()
+
+  def tearDown(self):
+    self.loop.close()
+
+  def testImportIsLazy(self):
+    # Importing asyncio would slow down every import of datetime_tz.
+    output = subprocess.check_output([
+        sys.executable, "-c",
+        "import sys, datetime_tz; "
+        "print('asyncio' in sys.modules, 'concurrent.futures' in sys.modules)"],
+        cwd=os.path.dirname(os.path.abspath(__file__)))
+    self.assertEqual(output.strip(), b"False False")
+
+  def collect(self, agen):
+    result = []
+    while True:
+      try:
+        result.append(self.loop.run_until_complete(agen.__anext__()))
+      except StopAsyncIteration:  # pylint: disable=undefined-variable
+        return result
+
+  def testOrderPreserved(self):
+    values = ["2009-11-09 23:%02d:%02d" % (i // 60, i % 60)
+              for i in range(500)]
+    result = self.collect(datetime_tz.aparse(
+        values, batch_size=7, max_batches=3))
+    self.assertEqual(
+        result, [datetime_tz.datetime_tz.smartparse(v) for v in values])
+
+  def testAsyncSourceStalls(self):
+    loop = self.loop
+
+    class Source(object):
+      """Async iterator which only produces a line every 10ms."""
+
+      def __init__(self, values):
+        self.values = list(values)
+
+      def __aiter__(self):
+        return self
+
+      def __anext__(self):
+        future = loop.create_future()
+        if self.values:
+          loop.call_later(0.01, future.set_result, self.values.pop(0))
+        else:
+          # pylint: disable=undefined-variable
+          future.set_exception(StopAsyncIteration())
+        return future
+
+    values = ["2010-07-03 06:00:%02d UTC" % i for i in range(10)]
+    result = self.collect(datetime_tz.aparse(
+        Source(values), batch_size=100, max_delay=0.001))
+    self.assertEqual(
+        result, [datetime_tz.datetime_tz.smartparse(v) for v in values])
+
+  def testError(self):
+    agen = datetime_tz.aparse(["2009-11-09", "not a date"])
+    self.assertRaises(ValueError, self.collect, agen)
+
+
+class TestParseFile(unittest.TestCase):
+
+  def setUp(self):
+    datetime_tz.localtz_set("Australia/Sydney")
+    self.tmpdir = tempfile.mkdtemp()
+
+  def tearDown(self):
+    shutil.rmtree(self.tmpdir)
+
+  def writeFile(self, lines):
+    path = os.path.join(self.tmpdir, "input.csv")
+    f = open(path, "w")
+    f.write("\n".join(lines) + "\n")
+    f.close()
+    return path
+
+  def testChunkFile(self):
+    path = self.writeFile(["line %d" % i for i in range(100)])
+    ranges = datetime_tz.parallel.chunk_file(path, 50)
+    self.assertTrue(len(ranges) > 1)
+    self.assertEqual(ranges[0][0], 0)
+    self.assertEqual(ranges[-1][1], os.path.getsize(path))
+
+    data = open(path, "rb").read()
+    for (start, end), (next_start, _) in zip(ranges, ranges[1:]):
+      self.assertEqual(end, next_start)
+      self.assertEqual(data[end-1:end], b"\n")
+
+  def testParseFile(self):
+    values = ["2009-11-09 23:00:00-05:00", "2002-10-27 01:20:00 EST",
+              "Tue Jul 03 06:00:01 UTC 2010", "2008/05/12 11:45"] * 10
+    path = self.writeFile(
+        ["id,when"] + ["%d,%s" % (i, v) for i, v in enumerate(values)])
+
+    expected = [datetime_tz.datetime_tz.smartparse(v) for v in values]
+    for workers in (1, 2):
+      result = datetime_tz.parse_file(
+          path, column=1, header=True, workers=workers, chunk_size=64)
+      self.assertTrue(isinstance(result, datetime_tz.DatetimeTZArray))
+      self.assertEqual(len(result), len(values))
+      self.assertEqual(list(result), expected)
+      self.assertEqual(
+          [str(d) for d in result], [str(d) for d in expected])
+
+  def testParseFileErrors(self):
+    path = self.writeFile(["2008/05/12 11:45", "not a date", "2008/05/13"])
+    self.assertRaises(ValueError, datetime_tz.parse_file, path, workers=1)
+
+    result = datetime_tz.parse_file(path, workers=1, errors="skip")
+    self.assertEqual(len(result), 2)
+    self.assertEqual(result[1], datetime_tz.datetime_tz(2008, 5, 13))
+
+  def assertParseError(self, message, *args, **kw):
+    try:
+      datetime_tz.parse_file(*args, **kw)
+    except ValueError as e:
+      self.assertTrue(message in str(e), str(e))
+    else:
+      self.fail("No ValueError")
+
+  def testParseFileErrorLine(self):
+    # Line numbers are in the file, not the chunk.
+    lines = ["id,when"] + ["%d,2008/05/%02d" % (i, i + 1) for i in range(20)]
+    lines[15] = "14,not a date"
+    path = self.writeFile(lines)
+    for workers in (1, 2):
+      self.assertParseError("'not a date' (line 16 of", path, column=1,
+                            header=True, workers=workers, chunk_size=32)
+    lines[15] = "14"
+    path = self.writeFile(lines)
+    self.assertParseError("Line 16 has no column 1", path, column=1,
+                          header=True, chunk_size=32)
+
+    path = self.writeFile(["2008/05/12"] * 10 + ["not a date"])
+    self.assertParseError("line 11 of", path, workers=2, chunk_size=16)
+
+  def testParseFileQuotedNewlines(self):
+    path = self.writeFile(
+        ["1,\"a note\",2008/05/12", "2,\"split\nnote\",2008/05/13",
+         "3,\"\",2008/05/14"])
+    # Wherever the chunks split the file.
+    for chunk_size in (8, 32, 1024):
+      self.assertParseError("Line 2 has a quoted field with a newline", path,
+                            column=2, workers=1, chunk_size=chunk_size)
+
+  def testCommandLine(self):
+    path = self.writeFile(["2010-07-03 06:00:01 UTC"])
+    out = StringIO()
+    self.mocked = MockMe()
+    try:
+      self.mocked("sys.stdout", out)
+      datetime_tz.__main__.main(
+          ["parse-file", "--workers", "1", "--output-format", "epoch", path])
+    finally:
+      self.mocked.tearDown()
+    self.assertEqual(out.getvalue(), "1278136801000000 UTC\n")
+
+
+class TestBench(unittest.TestCase):
+
+  def testBench(self):
+    from datetime_tz import bench  # pylint: disable=g-import-not-at-top
+    corpus = bench.Corpus(200)
+    self.assertEqual(len(corpus.values), 200)
+    # Half the values are near a DST transition.
+    self.assertTrue(len(corpus.local) < 200)
+    for name, function in bench.BENCHMARKS.items():
+      self.assertTrue(len(function(corpus)) > 0, name)
+
+    tempdir = tempfile.mkdtemp()
+    out = StringIO()
+    self.mocked = MockMe()
+    try:
+      self.mocked("sys.stdout", out)
+      output = os.path.join(tempdir, "results.json")
+      bench.main(["--size", "20", "--repeat", "1", "--output", output,
+                  "new.", "smartparse.iso"])
+      bench.main(["--size", "20", "--repeat", "1", "--no-memory",
+                  "--compare", output, "new.aware"])
+
+      # Benchmarks which fail (like missing features) are skipped.
+      def missing(corpus):
+        return corpus.values[0].not_a_method()
+      benchmarks = collections.OrderedDict(bench.BENCHMARKS)
+      benchmarks["missing"] = missing
+      self.mocked("datetime_tz.bench.BENCHMARKS", benchmarks)
+      bench.main(["--size", "20", "--repeat", "1", "--no-memory", "missing",
+                  "new.aware"])
+    finally:
+      self.mocked.tearDown()
+      shutil.rmtree(tempdir)
+    lines = out.getvalue().splitlines()
+    self.assertEqual([line.split()[0] for line in lines],
+                     ["benchmark", "new.naive", "new.aware", "new.datetime_tz",
+                      "new.fields", "smartparse.iso", "benchmark",
+                      "new.aware", "benchmark", "missing", "new.aware"])
+    self.assertTrue(lines[-4].endswith("%"))
+    self.assertEqual(lines[-2].split()[1:3], ["failed:", "AttributeError:"])
+
+    blocks, kept, peak = bench.memory(bench.BENCHMARKS["astimezone"], corpus)
+    if bench.tracemalloc is None:
+      self.assertEqual((blocks, kept, peak), (None, None, None))
+    else:
+      self.assertTrue(blocks >= 1, blocks)
+      # The peak includes astimezone's temporaries as well as the results.
+      self.assertTrue(peak > kept > 0, (kept, peak))
+
+
 class TestWin32MapUpdate(unittest.TestCase):
 
   def setUp(self):